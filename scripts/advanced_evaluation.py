@@ -1,246 +1,982 @@
-import pandas as pd
-import geopandas as gpd
-import numpy as np
 from pathlib import Path
-from sklearn.metrics import precision_recall_curve, auc, brier_score_loss, roc_auc_score
-from sklearn.model_selection import GroupShuffleSplit
-import matplotlib.pyplot as plt
 import json
 import logging
+import run_registry
+import hashlib
+import importlib.util
+import argparse
+import sys
 
-# Importando funções do core para replicar o split exato
-from core.data_preparation import load_and_clean_data, criar_grid_espacial
+# pandas, numpy, pyarrow e os módulos de métricas são importados dentro das
+# funções que os usam: `-h` (e `cli.py evaluate -h`) não carrega nada pesado.
 
 # Configuração
-BASE_DIR = Path(r"C:\Users\adirs\Downloads\preditor_fcu-20251203T221625Z-1-001\preditor_fcu_v3").resolve()
+BASE_DIR = run_registry.BASE_DIR.resolve()
 INPUT_FILE = BASE_DIR / "dados" / "pnui_x_ibge.geoparquet"
 OUTPUT_DIR = BASE_DIR / "comparativo_avancado"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-# Runs para analisar
-RUNS_TO_ANALYZE = [
-    ("Run 1 (0.95, Std)", "log_v3_95_std"),
-    ("Run 6 (0.80, NoInt)", "log_v3_80_noint"),
-    ("Run 7 (0.70, NoInt)", "log_v3_70_noint"),
-    ("Run 8 (0.60, NoInt)", "log_v3_60_noint")
-]
+# Parâmetros do split (Exatamente como no treino)
+GRID_SIZE = 20
+TEST_SIZE = 0.25
+RANDOM_STATE = 42
+
+# Manifesto de split em disco: IDs de teste por escopo, invalidado quando o
+# conteúdo do INPUT_FILE ou os parâmetros do split mudam.
+SPLIT_CACHE_DIR = OUTPUT_DIR / "cache_split"
+SPLIT_MANIFEST_VERSION = 2
+
+# Coluna usada por load_and_clean_data para restringir o frame a um polo.
+# Usada no modo --single-load para recortar o frame nacional em memória.
+# Pressupõe que core.data_preparation filtra o polo por igualdade exata
+# (NM_MUN == escopo), sem normalizar nomes nem limpar o recorte de novo. Como
+# core não exporta esse filtro, cada polo é conferido contra a recarga por
+# escopo na primeira vez (por versão de core.data_preparation) antes de o
+# recorte em memória ser usado; ver single_load_verification.
+SCOPE_COLUMN = "NM_MUN"
+SINGLE_LOAD_CHECK_FILE = SPLIT_CACHE_DIR / "single_load_verified.json"
+
+# Percentuais de k reportados (Recall@k / Precision@k)
+K_PERCENTS = [1.0, 5.0]
 
 SCOPES = ["BRASIL", "Belo Horizonte", "Brasília", "Juazeiro do Norte", "Marabá", "Porto Alegre", "Recife"]
 
+# Escopos com painel de calibração em PNG (--calibration-plots panels)
+CALIBRATION_SCOPES = ["BRASIL", "Recife", "Porto Alegre"]
+
+# Bootstrap: semente, nível de confiança e limite de elementos da matriz de
+# pesos (reamostragens x linhas) processada por bloco
+BOOTSTRAP_SEED = 42
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_CHUNK_ELEMENTS = 4_000_000
+BOOTSTRAP_METRICS = ["auc_roc", "auprc", "brier"]
+BOOTSTRAP_METRIC_LABELS = {"auc_roc": "AUC (ROC)", "auprc": "AUPRC", "brier": "Brier Score"}
+
+def split_test_set(df):
+    """
+    Aplica o grid espacial e o GroupShuffleSplit do treino a um frame já limpo
+    e retorna (IDs, células do grid) do conjunto de teste.
+    """
+    import numpy as np
+    # sklearn e core (geopandas) só são importados quando o split é recalculado
+    from sklearn.model_selection import GroupShuffleSplit
+    from core.data_preparation import criar_grid_espacial
+
+    # 1. Cria Grid Espacial (Exatamente como no treino: size=20)
+    groups = criar_grid_espacial(df, grid_size=GRID_SIZE)
+    
+    # 2. Split (Exatamente como no treino: test_size=0.25, random_state=42)
+    splitter = GroupShuffleSplit(n_splits=1, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+    train_idx, test_idx = next(splitter.split(df, df["FCU"], groups=groups))
+    
+    # Retorna os IDs do teste e a célula do grid de cada um
+    return df.iloc[test_idx]["ID"].astype(str).values, np.asarray(groups)[test_idx].astype(str)
+
+def get_test_split(scope, input_file):
+    """
+    Replica a lógica de split do 03_treinamento_modelo.py e retorna
+    (IDs, células do grid) do conjunto de teste.
+    """
+    # Carrega e Limpa (Exatamente como no treino)
+    from core.data_preparation import load_and_clean_data
+    df = load_and_clean_data(input_file, scope=scope)
+    return split_test_set(df)
+
 def get_test_ids(scope, input_file):
     """
     Replica a lógica de split do 03_treinamento_modelo.py para recuperar os IDs do conjunto de teste.
     """
-    # 1. Carrega e Limpa (Exatamente como no treino)
-    df = load_and_clean_data(input_file, scope=scope)
+    return get_test_split(scope, input_file)[0]
+
+def slice_scope(df_brasil, scope):
+    """
+    Recorte em memória do frame nacional equivalente a
+    load_and_clean_data(input_file, scope=scope).
+    """
+    if scope == "BRASIL":
+        return df_brasil
+    return df_brasil[df_brasil[SCOPE_COLUMN] == scope].reset_index(drop=True)
+
+def peak_memory_mb():
+    """Pico de memória residente do processo (MB), ou None se indisponível."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta em KB, macOS em bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+def single_load_verification():
+    """
+    (chave, escopos já conferidos) do recorte em memória. A chave é o hash do
+    código de core.data_preparation e de SCOPE_COLUMN: se o filtro de escopo
+    do core mudar, todos os polos são conferidos de novo.
+    """
+    origin = importlib.util.find_spec("core.data_preparation").origin
+    digest = hashlib.sha256(Path(origin).read_bytes())
+    digest.update(SCOPE_COLUMN.encode("utf-8"))
+    key = digest.hexdigest()[:16]
+    try:
+        with open(SINGLE_LOAD_CHECK_FILE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return key, set(cached["scopes"])
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    return key, set()
+
+def get_test_ids_single_load(scopes, input_file, verify=True):
+    """
+    Carrega e limpa o frame nacional uma única vez e faz o split de cada
+    escopo sobre o recorte em memória (mesmo split por escopo do modo padrão).
+    Com verify, um polo ainda não conferido (single_load_verification) tem o
+    split comparado com o da recarga por escopo; se divergir, vale o da
+    recarga e o polo continua sendo recarregado nas próximas execuções.
+    Retorna {escopo: (IDs, células do grid)}.
+    """
+    import numpy as np
+    from core.data_preparation import load_and_clean_data
+    print("Carregando frame nacional (carga única)...")
+    df_brasil = load_and_clean_data(input_file, scope="BRASIL")
+    key, verified = single_load_verification() if verify else (None, set())
     
-    # 2. Cria Grid Espacial (Exatamente como no treino: size=20)
-    groups = criar_grid_espacial(df, grid_size=20)
+    test_ids = {}
+    for scope in scopes:
+        print(f"Recuperando IDs de Teste ({scope}) em memória...")
+        test_ids[scope] = split_test_set(slice_scope(df_brasil, scope))
+        if not verify or scope == "BRASIL" or scope in verified:
+            continue
+        reference = get_test_split(scope, input_file)
+        if np.array_equal(reference[0], test_ids[scope][0]):
+            print(f"  {scope}: recorte em memória conferido com a recarga por escopo.")
+            verified.add(scope)
+        else:
+            print(f"  AVISO: o recorte de {scope} por {SCOPE_COLUMN} diverge de load_and_clean_data; usando a recarga por escopo.")
+            test_ids[scope] = reference
     
-    # 3. Split (Exatamente como no treino: test_size=0.25, random_state=42)
-    splitter = GroupShuffleSplit(n_splits=1, test_size=0.25, random_state=42)
-    train_idx, test_idx = next(splitter.split(df, df["FCU"], groups=groups))
+    if verify:
+        SPLIT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(SINGLE_LOAD_CHECK_FILE, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "scopes": sorted(verified)}, f, ensure_ascii=False)
     
-    # Retorna os IDs do teste
-    return df.iloc[test_idx]["ID"].astype(str).values
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"Pico de memória (carga única): {peak:.0f} MB")
+    return test_ids
+
+def verify_single_load(scopes, input_file):
+    """
+    Compara o modo de carga única com a recarga por escopo. Retorna True se
+    os IDs de teste forem idênticos (mesmos valores, mesma ordem) em todos os escopos.
+    """
+    import numpy as np
+    single = get_test_ids_single_load(scopes, input_file, verify=False)
+    ok = True
+    for scope in scopes:
+        reference = get_test_ids(scope, input_file)
+        same = np.array_equal(reference, single[scope][0])
+        print(f"  {scope}: {'idêntico' if same else 'DIVERGENTE'} ({len(reference)} IDs)")
+        ok = ok and same
+    return ok
+
+def file_content_hash(path, chunk_size=8 * 1024 * 1024):
+    """
+    SHA-256 do conteúdo do arquivo. O hash é memorizado num sidecar JSON
+    junto com (tamanho, mtime), então só é recalculado se o arquivo mudar.
+    """
+    path = Path(path)
+    stat = path.stat()
+    sidecar = SPLIT_CACHE_DIR / "input_hash.json"
+    
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if (cached.get("path") == str(path) and cached.get("size") == stat.st_size
+                and cached.get("mtime_ns") == stat.st_mtime_ns):
+            return cached["sha256"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    
+    SPLIT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(sidecar, "w", encoding="utf-8") as f:
+        json.dump({"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                   "sha256": content_hash}, f)
+    return content_hash
+
+def split_manifest_key(input_file):
+    """Chave do manifesto: hash do conteúdo do input + parâmetros do split."""
+    params = "|".join([
+        file_content_hash(input_file),
+        f"grid={GRID_SIZE}",
+        f"test_size={TEST_SIZE}",
+        f"random_state={RANDOM_STATE}",
+        f"v={SPLIT_MANIFEST_VERSION}",
+    ])
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()[:16]
+
+def load_test_split(scopes, input_file, single_load=False):
+    """
+    Retorna {escopo: (IDs de teste, células do grid)}, lendo do manifesto de
+    split quando a chave bate e recalculando apenas os escopos ausentes (com
+    recarga por escopo ou, se single_load, a partir de uma única carga do
+    frame nacional).
+    """
+    import pandas as pd
+    key = split_manifest_key(input_file)
+    manifest_path = SPLIT_CACHE_DIR / f"split_{key}.parquet"
+    
+    test_ids = {}
+    if manifest_path.exists():
+        df_manifest = pd.read_parquet(manifest_path)
+        for scope, df_scope in df_manifest.groupby("scope", sort=False):
+            test_ids[scope] = (df_scope["ID"].to_numpy(dtype=object), df_scope["grupo"].to_numpy(dtype=object))
+        print(f"Manifesto de split carregado: {manifest_path.name}")
+    
+    missing = [s for s in scopes if s not in test_ids]
+    if missing:
+        if single_load:
+            test_ids.update(get_test_ids_single_load(missing, input_file))
+        else:
+            for scope in missing:
+                print(f"Recuperando IDs de Teste ({scope})...")
+                test_ids[scope] = get_test_split(scope, input_file)
+        
+        # Remove manifestos obsoletos (outra chave) e grava o atual
+        SPLIT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for stale in SPLIT_CACHE_DIR.glob("split_*.parquet"):
+            if stale != manifest_path:
+                stale.unlink()
+        df_manifest = pd.concat(
+            [pd.DataFrame({"scope": scope, "ID": pd.Series(ids, dtype=str), "grupo": pd.Series(groups, dtype=str)})
+             for scope, (ids, groups) in test_ids.items()],
+            ignore_index=True
+        )
+        df_manifest.to_parquet(manifest_path, index=False)
+        print(f"Manifesto de split salvo: {manifest_path.name}")
+    
+    return {scope: test_ids[scope] for scope in scopes}
+
+def load_all_test_ids(scopes, input_file, single_load=False):
+    """Retorna {escopo: IDs de teste} (ver load_test_split)."""
+    return {scope: ids for scope, (ids, _) in load_test_split(scopes, input_file, single_load).items()}
+
+def read_master_table(master_path, test_ids=None, prob_columns=None):
+    """
+    Lê de output_final_master.geoparquet apenas ID, FCU e prob_fcu_* (ou só
+    prob_columns), sem decodificar a geometria. Se test_ids for dado, mantém
+    só essas linhas: com ID inteiro o filtro é empurrado para a leitura do
+    Parquet; com ID texto ele é aplicado em Arrow após o strip (como no fluxo
+    original). test_ids pode vir como texto ou já como chaves int64.
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    schema = pq.read_schema(master_path)
+    if prob_columns is None:
+        prob_columns = [name for name in schema.names if name.startswith("prob_fcu_")]
+    columns = ["ID", "FCU"] + [name for name in prob_columns if name in schema.names]
+    id_type = schema.field("ID").type
+    
+    filters = None
+    if test_ids is not None and pa.types.is_integer(id_type):
+        try:
+            wanted = np.unique(np.asarray(test_ids).astype(np.int64))
+            filters = pc.field("ID").isin(pa.array(wanted).cast(id_type))
+        except (ValueError, OverflowError, pa.ArrowInvalid):
+            filters = None
+    
+    table = pq.read_table(master_path, columns=columns, filters=filters)
+    
+    ids = pc.utf8_trim_whitespace(pc.cast(table["ID"], pa.string()))
+    table = table.set_column(0, "ID", ids)
+    test_ids_are_text = test_ids is not None and not np.issubdtype(np.asarray(test_ids).dtype, np.integer)
+    if filters is None and test_ids_are_text:
+        table = table.filter(pc.is_in(ids, value_set=pa.array(np.asarray(test_ids, dtype=str))))
+    
+    return table
+
+def prepare_prediction_caches(runs, all_ids):
+    """
+    Garante o cache Arrow (prediction_cache.py) das predições de teste de
+    cada run, lendo o geoparquet só quando o master ou o split mudaram.
+    Retorna {pasta: caminho do cache}.
+    """
+    import prediction_cache
+    digest = prediction_cache.ids_digest(all_ids)
+    paths = {}
+    for run_name, folder_name in runs:
+        master_path = BASE_DIR / folder_name / "output_final" / "output_final_master.geoparquet"
+        paths[folder_name] = prediction_cache.ensure(BASE_DIR, folder_name, master_path, digest,
+                                                     lambda: read_master_table(master_path, all_ids))
+    return paths
 
 def calculate_auprc(y_true, y_prob):
+    from sklearn.metrics import precision_recall_curve, auc
     precision, recall, _ = precision_recall_curve(y_true, y_prob)
     return auc(recall, precision)
 
 def calculate_recall_at_k(y_true, y_prob, k_percent):
+    import pandas as pd
     k = int(len(y_true) * (k_percent / 100))
     if k == 0: return 0.0
     
     df = pd.DataFrame({'true': y_true, 'prob': y_prob})
-    df = df.sort_values('prob', ascending=False)
+    df = df.sort_values('prob', ascending=False, kind='stable')
     
     top_k = df.head(k)
     recall = top_k['true'].sum() / df['true'].sum()
     return recall
 
 def calculate_precision_at_k(y_true, y_prob, k_percent):
+    import pandas as pd
     k = int(len(y_true) * (k_percent / 100))
     if k == 0: return 0.0
     
     df = pd.DataFrame({'true': y_true, 'prob': y_prob})
-    df = df.sort_values('prob', ascending=False)
+    df = df.sort_values('prob', ascending=False, kind='stable')
     
     top_k = df.head(k)
     precision = top_k['true'].sum() / k
     return precision
 
-def plot_calibration_curve(y_true, y_prob, run_name, scope, output_path):
-    from sklearn.calibration import calibration_curve
-    prob_true, prob_pred = calibration_curve(y_true, y_prob, n_bins=10, strategy='quantile')
-    
-    plt.figure(figsize=(6, 6))
-    plt.plot(prob_pred, prob_true, marker='o', label=f'{run_name}')
-    plt.plot([0, 1], [0, 1], linestyle='--', color='gray', label='Perfeitamente Calibrado')
-    plt.xlabel('Probabilidade Predita Média')
-    plt.ylabel('Fração de Positivos (FCU)')
-    plt.title(f'Curva de Calibração - {scope}\n{run_name}')
-    plt.legend()
-    plt.grid(True)
-    plt.savefig(output_path)
-    plt.close()
-
-def get_drivers_from_txt(log_dir, scope):
-    txt_path = log_dir / "relatorios" / f"relatorio_analise_{scope}.txt"
-    drivers = {}
-    if not txt_path.exists(): return drivers
+def lift_curve_frame(metrics, run_name, scope):
+    """Curva de ganho/lift de compute_ranking_metrics em formato longo."""
+    import pandas as pd
+    curve = metrics["gain_curve"]
+    return pd.DataFrame({"Run": run_name, "Scope": scope, "Pct": curve["pct"],
+                         "Gain": curve["gain"], "Lift": curve["lift"]})
+
+def verify_ranking_metrics(y_true, y_prob, metrics, label, tol=1e-12):
+    """
+    Confere as métricas da passada única (ranking_metrics) contra as
+    implementações de referência (sklearn / pandas). As duas ordenam de forma
+    estável, então empates no corte k caem do mesmo lado. Retorna True se
+    baterem.
+    """
+    from sklearn.metrics import brier_score_loss, roc_auc_score
+    reference = {"auprc": calculate_auprc(y_true, y_prob),
+                 "auc_roc": roc_auc_score(y_true, y_prob),
+                 "brier": brier_score_loss(y_true, y_prob)}
+    for k_percent in metrics["recall_at_k"]:
+        reference[f"recall@{k_percent:g}%"] = calculate_recall_at_k(y_true, y_prob, k_percent)
+        reference[f"precision@{k_percent:g}%"] = calculate_precision_at_k(y_true, y_prob, k_percent)
     
-    try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        
-        start_idx = -1
-        for i, line in enumerate(lines):
-            if "Fatores de Influência (EBM)" in line:
-                start_idx = i + 3
-                break
-        
-        if start_idx != -1:
-            for i in range(start_idx, len(lines)):
-                line = lines[i].strip()
-                if not line or "──────" in line:
-                    if line and "──────" in line: break
-                    continue
-                if "feature_pretty" in line: continue
-
-                parts = line.rsplit(maxsplit=1)
-                if len(parts) == 2:
-                    name = parts[0].strip()
-                    try:
-                        score = float(parts[1])
-                        drivers[name] = score
-                    except ValueError:
-                        continue
-    except Exception as e:
-        print(f"Erro ao ler {txt_path}: {e}")
-    return drivers
+    got = {"auprc": metrics["auprc"], "auc_roc": metrics["auc_roc"], "brier": metrics["brier"]}
+    for k_percent in metrics["recall_at_k"]:
+        got[f"recall@{k_percent:g}%"] = metrics["recall_at_k"][k_percent]
+        got[f"precision@{k_percent:g}%"] = metrics["precision_at_k"][k_percent]
+    
+    ok = True
+    for name, ref_val in reference.items():
+        if abs(ref_val - got[name]) > tol:
+            print(f"  DIVERGÊNCIA {label} {name}: referência={ref_val:.12f} passada única={got[name]:.12f}")
+            ok = False
+    return ok
 
 def analyze_driver_stability(runs):
     """
-    Conta a frequência de drivers importantes (Score > 0.2) em todos os runs e escopos.
+    Estabilidade dos drivers em todos os runs e escopos, a partir do cubo de
+    driver_matrix.py: frequência de |Score| > 0.2 (Tabela 4.3), curvas de
+    frequência numa grade de limiares e concordância (Spearman, Kendall,
+    Jaccard top-k) entre todos os pares (run, escopo).
     """
+    import pandas as pd
+    import driver_reports
+    import driver_matrix
     print("Analisando estabilidade dos drivers...")
-    driver_counts = {}
+    folders = [folder_name for _, folder_name in runs]
+    # Drivers de todos os relatórios (cache em Parquet, relido só se os logs mudarem)
+    drivers = driver_reports.load_driver_table(BASE_DIR, folders, SCOPES)
+    cube = driver_matrix.driver_cube(drivers, folders, SCOPES)
     
-    for run_name, folder_name in runs:
-        log_dir = BASE_DIR / folder_name
-        for scope in SCOPES:
-            drivers = get_drivers_from_txt(log_dir, scope)
-                    
-            # Filtra drivers relevantes
-            for feature, score in drivers.items():
-                if abs(score) > 0.2: # Limiar de relevância
-                    driver_counts[feature] = driver_counts.get(feature, 0) + 1
-    
-    # Cria DataFrame
-    df_stab = pd.DataFrame(list(driver_counts.items()), columns=['Driver', 'Frequency'])
-    df_stab = df_stab.sort_values('Frequency', ascending=False)
+    # Curvas de frequência: uma coluna por limiar da grade
+    curves = driver_matrix.frequency_curves(cube)
+    curves.rename_axis(index="Driver", columns="Threshold").stack().rename("Frequency").reset_index() \
+        .to_csv(OUTPUT_DIR / "driver_frequency_curves.csv", index=False)
     
-    # Salva
+    # Tabela 4.3: frequência no limiar de relevância, na ordem de primeira aparição
+    relevant = drivers.loc[drivers["score"].abs() > driver_matrix.STABILITY_THRESHOLD, "feature"].unique()
+    frequency = driver_matrix.frequency_curves(cube, [driver_matrix.STABILITY_THRESHOLD]).iloc[:, 0]
+    df_stab = pd.DataFrame({'Driver': relevant, 'Frequency': frequency.reindex(relevant).to_numpy()})
+    df_stab = df_stab.sort_values('Frequency', ascending=False)
     df_stab.to_csv(OUTPUT_DIR / "driver_stability.csv", index=False)
+    
+    # Concordância entre os vetores de drivers de todos os pares (run, escopo)
+    labels = {folder_name: run_name for run_name, folder_name in runs}
+    driver_matrix.agreement_table(cube, labels).to_csv(OUTPUT_DIR / "driver_rank_agreement.csv", index=False)
     return df_stab
 
-def main():
-    results = []
+def evaluate_scope(df_master, mask, run_name, folder_name, scope, verify=False):
+    """
+    Avalia um par (run, escopo) sobre as linhas de teste do escopo.
+    Retorna um dict com as métricas de ranking (None se não houver dados) e
+    os arrays (y, prob) usados depois na tabela de calibração.
+    """
+    import ranking_metrics
+    result = {"run": run_name, "folder": folder_name, "scope": scope, "metrics": None,
+              "calibration": None, "verify_ok": True}
+    
+    safe_scope = scope.replace(' ', '_')
+    col_prob = f"prob_fcu_{safe_scope}"
+    if col_prob not in df_master.columns:
+        return result
     
-    # 1. Recupera IDs de Teste para BRASIL (Global)
-    print("Recuperando IDs de Teste (BRASIL)...")
-    test_ids_brasil = get_test_ids("BRASIL", INPUT_FILE)
-    print(f"Total Teste BRASIL: {len(test_ids_brasil)}")
+    df_test = df_master[mask].dropna(subset=["FCU", col_prob])
+    if df_test.empty:
+        return result
     
-    # 2. Recupera IDs de Teste para cada Polo (Local)
-    test_ids_local = {}
-    for scope in SCOPES:
-        if scope == "BRASIL": continue
-        print(f"Recuperando IDs de Teste ({scope})...")
-        test_ids_local[scope] = get_test_ids(scope, INPUT_FILE)
+    y_true = df_test["FCU"]
+    y_prob = df_test[col_prob]
+    
+    # Uma ordenação + um cumsum para todas as métricas de ranking
+    metrics = ranking_metrics.compute_ranking_metrics(y_true, y_prob, k_percents=K_PERCENTS)
+    if verify:
+        result["verify_ok"] = verify_ranking_metrics(y_true, y_prob, metrics, f"{run_name}/{scope}")
+    result["metrics"] = metrics
+    result["calibration"] = (y_true.to_numpy(), y_prob.to_numpy())
+    return result
 
-    for run_name, folder_name in RUNS_TO_ANALYZE:
+def evaluate_sequential(runs, cache_paths, scope_index, verify=False):
+    """Avalia todos os (run, escopo) no processo atual, abrindo o cache de cada run uma vez."""
+    import id_index
+    import prediction_cache
+    unit_results = []
+    for run_name, folder_name in runs:
         print(f"Processando {run_name}...")
         
-        log_dir = BASE_DIR / folder_name
-        master_path = log_dir / "output_final" / "output_final_master.geoparquet"
+        # Apenas ID, FCU e prob_fcu_* das linhas de teste (cache Arrow por memory map)
+        df_master = prediction_cache.open_table(cache_paths[folder_name]).to_pandas()
         
-        if not master_path.exists():
-            print(f"Arquivo não encontrado: {master_path}")
+        # IDs codificados uma vez por run; o filtro de cada escopo é um gather de máscara
+        masks = id_index.scope_masks(id_index.encode_ids(df_master["ID"].to_numpy(), scope_index), scope_index)
+        
+        for scope in SCOPES:
+            unit_results.append(evaluate_scope(df_master, masks[scope], run_name, folder_name, scope, verify))
+    return unit_results
+
+# Estado dos processos do pool: blocos de memória compartilhada e índice de IDs
+_WORKER_STATE = {}
+
+def share_arrays(arrays):
+    """
+    Copia arrays NumPy para blocos de memória compartilhada. Retorna (spec,
+    blocos): spec é o pequeno descritor enviado aos workers; os blocos devem
+    ser liberados (close + unlink) pelo chamador.
+    """
+    import numpy as np
+    from multiprocessing import shared_memory
+    spec = {}
+    blocks = []
+    for name, arr in arrays.items():
+        if arr is None:
             continue
-            
-        df_master = gpd.read_parquet(master_path)
-        df_master["ID"] = df_master["ID"].astype(str).str.strip()
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        blocks.append(shm)
+        spec[name] = (shm.name, arr.dtype.str, arr.shape)
+    return spec, blocks
+
+def attach_arrays(spec):
+    """Anexa os blocos descritos por share_arrays e retorna (arrays, blocos)."""
+    import numpy as np
+    arrays = {}
+    blocks = []
+    for name, (shm_name, dtype, shape) in spec.items():
+        shm = _attach_shared_memory(shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return arrays, blocks
+
+def release_arrays(blocks):
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+def _attach_shared_memory(name):
+    # Os workers herdam o resource_tracker do processo principal, que é quem
+    # cria e libera os blocos; no Python >= 3.13 o anexo nem é registrado.
+    from multiprocessing import shared_memory
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+def share_scope_index(index):
+    """
+    Publica as chaves de todos os escopos (e o vocabulário, se houver) em
+    memória compartilhada. Retorna (spec, blocos) como share_arrays.
+    """
+    import numpy as np
+    scopes = list(index["keys"])
+    keys = np.concatenate([index["keys"][scope] for scope in scopes]).astype(np.int64)
+    offsets = np.cumsum([0] + [index["keys"][scope].size for scope in scopes]).tolist()
+    
+    arrays_spec, blocks = share_arrays({"keys": keys, "vocab": index["vocab"]})
+    return {"scopes": scopes, "offsets": offsets, "arrays": arrays_spec}, blocks
+
+def _init_worker(spec, verify):
+    arrays, blocks = attach_arrays(spec["arrays"])
+    keys = arrays["keys"]
+    offsets = spec["offsets"]
+    _WORKER_STATE["blocks"] = blocks
+    _WORKER_STATE["verify"] = verify
+    _WORKER_STATE["index"] = {
+        "vocab": arrays.get("vocab"),
+        "keys": {scope: keys[offsets[i]:offsets[i + 1]] for i, scope in enumerate(spec["scopes"])},
+    }
+
+def _evaluate_unit_task(run_name, folder_name, scope, cache_path):
+    import id_index
+    import prediction_cache
+    index = _WORKER_STATE["index"]
+    col_prob = f"prob_fcu_{scope.replace(' ', '_')}"
+    
+    # Só as colunas deste escopo, do cache Arrow do run: o memory map divide
+    # as páginas do arquivo entre os workers, sem cópia por processo
+    scope_keys = index["keys"][scope]
+    df_master = prediction_cache.open_table(cache_path, ["ID", "FCU", col_prob]).to_pandas()
+    
+    mask = id_index.member_mask(id_index.encode_ids(df_master["ID"].to_numpy(), index), scope_keys)
+    return evaluate_scope(df_master, mask, run_name, folder_name, scope, _WORKER_STATE["verify"])
+
+def evaluate_parallel(runs, cache_paths, scope_index, workers, verify=False):
+    """
+    Distribui as unidades (run, escopo) num pool de processos. As chaves de
+    teste vão uma única vez por memória compartilhada; os resultados voltam
+    na ordem de submissão (runs x SCOPES), independente da ordem de término.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    spec, blocks = share_scope_index(scope_index)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(spec, verify)) as pool:
+            futures = []
+            for run_name, folder_name in runs:
+                print(f"Processando {run_name} ({workers} workers)...")
+                for scope in SCOPES:
+                    futures.append(pool.submit(_evaluate_unit_task, run_name, folder_name, scope, cache_paths[folder_name]))
+            return [future.result() for future in futures]
+    finally:
+        release_arrays(blocks)
+
+def evaluate_streaming(runs, scope_index, n_bins=None, batch_rows=None):
+    """
+    Avalia cada run lendo o master em record batches, com memória limitada
+    (histogramas de n_bins faixas por escopo em vez das predições em memória).
+    n_bins e batch_rows padrão: os de streaming_metrics.
+    Retorna (unit_results, linhas de limites de erro, tabela de calibração).
+    """
+    import pandas as pd
+    import streaming_metrics
+    import calibration
+    n_bins = n_bins or streaming_metrics.DEFAULT_BINS
+    batch_rows = batch_rows or streaming_metrics.DEFAULT_BATCH_ROWS
+    unit_results = []
+    bound_rows = []
+    calib_rows = []
+    for run_name, folder_name in runs:
+        print(f"Processando {run_name} (streaming, {n_bins} faixas)...")
+        master_path = BASE_DIR / folder_name / "output_final" / "output_final_master.geoparquet"
+        accs = streaming_metrics.stream_master(master_path, scope_index, SCOPES, n_bins, batch_rows)
         
+        for scope in SCOPES:
+            result = {"run": run_name, "folder": folder_name, "scope": scope, "metrics": None,
+                      "calibration": None, "verify_ok": True}
+            acc = accs.get(scope)
+            if acc is not None and acc["n"] > 0:
+                metrics = streaming_metrics.histogram_metrics(acc, k_percents=K_PERCENTS)
+                result["metrics"] = metrics
+                for metric, bound in metrics["bounds"].items():
+                    bound_rows.append({"Run": run_name, "Scope": scope, "Metric": metric, "Error Bound": bound})
+                prob_true, prob_pred, count = streaming_metrics.histogram_calibration(acc)
+                for i in range(count.size):
+                    calib_rows.append({"Run": run_name, "Folder": folder_name, "Scope": scope, "Bin": i,
+                                       "Prob Pred": prob_pred[i], "Prob True": prob_true[i], "Count": int(count[i])})
+            unit_results.append(result)
+    return unit_results, bound_rows, pd.DataFrame(calib_rows, columns=calibration.TABLE_COLUMNS)
+
+def summarize_units(runs, unit_results):
+    """
+    Agrega os resultados por (run, escopo) nas linhas de advanced_metrics.csv
+    (identificadas pela pasta do run, em Folder; o rótulo "Run N" muda quando
+    pastas entram ou saem) e nas curvas de ganho/lift, sempre na ordem de
+    runs e SCOPES. Métricas do
+    modo streaming (com "bounds") saem com Mode = "streaming" e o maior erro
+    absoluto possível entre as colunas da linha em Max Error Bound.
+    """
+    import numpy as np
+    import metrics_store
+    by_unit = {(unit["run"], unit["scope"]): unit for unit in unit_results}
+    results = []
+    lift_frames = []
+    
+    for run_name, folder_name in runs:
         # --- ANÁLISE GLOBAL (BRASIL) ---
-        # Filtra apenas o conjunto de TESTE do Brasil
-        df_brasil_test = df_master[df_master["ID"].isin(test_ids_brasil)].copy()
-        
-        if df_brasil_test.empty:
-            print("ERRO: DataFrame de teste vazio para BRASIL.")
+        brasil = by_unit.get((run_name, "BRASIL"))
+        if brasil is None or brasil["metrics"] is None:
+            print(f"ERRO: DataFrame de teste vazio para BRASIL ({run_name}).")
             continue
-            
-        # Limpeza de NaNs
-        df_brasil_test = df_brasil_test.dropna(subset=["FCU", "prob_fcu_BRASIL"])
-        
-        y_true_br = df_brasil_test["FCU"]
-        y_prob_br = df_brasil_test["prob_fcu_BRASIL"]
+        m_br = brasil["metrics"]
+        lift_frames.append(lift_curve_frame(m_br, run_name, "BRASIL"))
         
-        auprc_global = calculate_auprc(y_true_br, y_prob_br)
-        recall_1pct = calculate_recall_at_k(y_true_br, y_prob_br, 1.0)
-        recall_5pct = calculate_recall_at_k(y_true_br, y_prob_br, 5.0)
-        prec_1pct = calculate_precision_at_k(y_true_br, y_prob_br, 1.0)
-        
-        # Plot Calibração Global
-        plot_calibration_curve(y_true_br, y_prob_br, run_name, "BRASIL", 
-                             OUTPUT_DIR / f"calib_{folder_name.split('_')[-2]}_BRASIL.png")
-
         # --- ANÁLISE LOCAL (Média dos Polos) ---
         auprc_locals = []
-        
+        bound_locals = []
         for scope in SCOPES:
             if scope == "BRASIL": continue
-            
-            # Filtra apenas o conjunto de TESTE do Polo
-            ids_polo = test_ids_local[scope]
-            df_polo_test = df_master[df_master["ID"].isin(ids_polo)].copy()
-            
-            safe_scope = scope.replace(' ', '_')
-            col_prob = f"prob_fcu_{safe_scope}"
-            
-            if col_prob not in df_polo_test.columns:
+            unit = by_unit.get((run_name, scope))
+            if unit is None or unit["metrics"] is None:
                 continue
-                
-            df_polo_test = df_polo_test.dropna(subset=["FCU", col_prob])
-            
-            if len(df_polo_test) > 0:
-                val = calculate_auprc(df_polo_test["FCU"], df_polo_test[col_prob])
-                auprc_locals.append(val)
-                
-                # Plot Calibração Local (Ex: Recife, Porto Alegre)
-                if scope in ["Recife", "Porto Alegre"]:
-                     plot_calibration_curve(df_polo_test["FCU"], df_polo_test[col_prob], run_name, scope, 
-                                          OUTPUT_DIR / f"calib_{folder_name.split('_')[-2]}_{safe_scope}.png")
-
+            auprc_locals.append(unit["metrics"]["auprc"])
+            bound_locals.append(unit["metrics"].get("bounds", {}).get("auprc", 0.0))
+            lift_frames.append(lift_curve_frame(unit["metrics"], run_name, scope))
+        
         avg_auprc_local = np.mean(auprc_locals) if auprc_locals else 0.0
         
-        results.append({
+        approximate = "bounds" in m_br
+        if approximate:
+            bounds = m_br["bounds"]
+            max_bound = max([bounds["auprc"]]
+                            + [bounds.get(f"{kind}@{k_percent:g}%", 0.0) for kind in ("recall", "precision") for k_percent in K_PERCENTS]
+                            + ([np.mean(bound_locals)] if bound_locals else []))
+        
+        row = {
             "Run": run_name,
-            "AUPRC (Global)": auprc_global,
-            "Recall@1% (Global)": recall_1pct,
-            "Recall@5% (Global)": recall_5pct,
-            "Precision@1% (Global)": prec_1pct,
-            "AUPRC (Média Local)": avg_auprc_local
-        })
+            "Folder": folder_name,
+            "Mode": "streaming" if approximate else "exact",
+            "AUPRC (Global)": m_br["auprc"],
+        }
+        # Uma coluna Recall@k e uma Precision@k por k de K_PERCENTS
+        for kind, key in (("Recall", "recall_at_k"), ("Precision", "precision_at_k")):
+            for k_percent in K_PERCENTS:
+                row[metrics_store.advanced_k_column(kind, k_percent)] = m_br[key][k_percent]
+        row["AUPRC (Média Local)"] = avg_auprc_local
+        row["Max Error Bound"] = max_bound if approximate else np.nan
+        results.append(row)
+    return results, lift_frames
+
+def load_bootstrap_data(runs, cache_paths, scope, test_ids, test_groups, scope_index):
+    """
+    Monta os dados do bootstrap de um escopo: y (n), probabilidades de cada
+    run (R x n) e célula do grid de cada linha (n), alinhados por ID nas
+    linhas de teste presentes (e sem NaN) em todos os runs.
+    """
+    import pandas as pd
+    import numpy as np
+    import id_index
+    import prediction_cache
+    col_prob = f"prob_fcu_{scope.replace(' ', '_')}"
+    scope_keys = scope_index["keys"][scope]
+    
+    per_run = []
+    for run_name, folder_name in runs:
+        df = prediction_cache.open_table(cache_paths[folder_name], ["ID", "FCU", col_prob]).to_pandas()
+        if col_prob not in df.columns:
+            print(f"Aviso: {col_prob} ausente em {run_name}; run fora do bootstrap.")
+            continue
+        df = df.dropna(subset=["FCU", col_prob])
+        df["key"] = id_index.encode_ids(df["ID"].to_numpy(), scope_index)
+        df = df[id_index.member_mask(df["key"].to_numpy(), scope_keys)].drop_duplicates("key")
+        per_run.append((run_name, df.set_index("key")))
+    
+    if not per_run:
+        return None
+    
+    common = per_run[0][1].index.to_numpy()
+    for _, df in per_run[1:]:
+        common = np.intersect1d(common, df.index.to_numpy())
+    common = np.sort(common)
+    
+    cells = pd.Series(np.asarray(test_groups, dtype=str), index=id_index.encode_ids(test_ids, scope_index))
+    cells = cells[~cells.index.duplicated()]
+    cell_codes, _ = pd.factorize(cells.reindex(common).to_numpy())
+    
+    return {
+        "runs": [run_name for run_name, _ in per_run],
+        "y": per_run[0][1].loc[common, "FCU"].to_numpy(dtype=float),
+        "probs": np.vstack([df.loc[common, col_prob].to_numpy(dtype=float) for _, df in per_run]),
+        "cells": cell_codes.astype(np.int64),
+    }
+
+def draw_bootstrap_weights(rng, n_resamples, n, cells=None):
+    """
+    Sorteia n_resamples reamostragens como uma matriz de índices e devolve as
+    contagens (n x n_resamples) de cada linha. Com cells, o sorteio é por
+    bloco espacial: as células do grid são reamostradas com reposição e cada
+    linha herda a contagem da sua célula.
+    """
+    import numpy as np
+    if cells is None:
+        idx = rng.integers(0, n, size=(n_resamples, n))
+        flat = (idx * n_resamples + np.arange(n_resamples)[:, None]).ravel()
+        return np.bincount(flat, minlength=n * n_resamples).reshape(n, n_resamples).astype(float)
+    
+    n_cells = int(cells.max()) + 1
+    idx = rng.integers(0, n_cells, size=(n_resamples, n_cells))
+    flat = (idx * n_resamples + np.arange(n_resamples)[:, None]).ravel()
+    cell_counts = np.bincount(flat, minlength=n_cells * n_resamples).reshape(n_cells, n_resamples)
+    return cell_counts[cells].astype(float)
+
+def bootstrap_chunk(data, seed, n_resamples, block):
+    """
+    Processa um bloco de reamostragens: os mesmos pesos são aplicados a todos
+    os runs (pareamento). Retorna {métrica: array (R x n_resamples)}.
+    """
+    import numpy as np
+    import ranking_metrics
+    rng = np.random.default_rng(seed)
+    y = data["y"]
+    weights = draw_bootstrap_weights(rng, n_resamples, y.size, data["cells"] if block else None)
+    
+    out = {metric: np.empty((data["probs"].shape[0], n_resamples)) for metric in BOOTSTRAP_METRICS}
+    for r, probs in enumerate(data["probs"]):
+        batch = ranking_metrics.batched_ranking_metrics(y, probs, weights)
+        for metric in BOOTSTRAP_METRICS:
+            out[metric][r] = batch[metric]
+    return out
+
+def _init_bootstrap_worker(spec):
+    arrays, blocks = attach_arrays(spec)
+    _WORKER_STATE["blocks"] = blocks
+    _WORKER_STATE["bootstrap"] = arrays
+
+def _bootstrap_chunk_task(seed, n_resamples, block):
+    return bootstrap_chunk(_WORKER_STATE["bootstrap"], seed, n_resamples, block)
+
+def run_bootstrap(data, n_resamples, block=True, workers=1, seed=BOOTSTRAP_SEED):
+    """
+    Executa n_resamples reamostragens em blocos. Cada bloco tem sua própria
+    semente derivada de `seed` (SeedSequence.spawn), então o resultado não
+    depende do número de workers. Com workers > 1 os dados vão uma única vez
+    por memória compartilhada para o pool.
+    """
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+    chunk = max(1, min(n_resamples, BOOTSTRAP_CHUNK_ELEMENTS // max(data["y"].size, 1)))
+    sizes = [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    arrays = {"y": data["y"], "probs": data["probs"], "cells": data["cells"]}
+    
+    if workers > 1:
+        spec, blocks = share_arrays(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_bootstrap_worker, initargs=(spec,)) as pool:
+                futures = [pool.submit(_bootstrap_chunk_task, s, size, block) for s, size in zip(seeds, sizes)]
+                parts = [future.result() for future in futures]
+        finally:
+            release_arrays(blocks)
+    else:
+        parts = [bootstrap_chunk(arrays, s, size, block) for s, size in zip(seeds, sizes)]
+    
+    return {metric: np.hstack([part[metric] for part in parts]) for metric in BOOTSTRAP_METRICS}
+
+def summarize_bootstrap(data, samples, scope, method, confidence=BOOTSTRAP_CONFIDENCE):
+    """
+    Gera as tabelas de intervalos de confiança por run e das diferenças
+    pareadas entre runs (run A - run B, mesmas reamostragens).
+    """
+    import pandas as pd
+    import numpy as np
+    import ranking_metrics
+    alpha = (1 - confidence) / 2
+    runs = data["runs"]
+    n_resamples = samples[BOOTSTRAP_METRICS[0]].shape[1]
+    estimates = {
+        metric: np.array([ranking_metrics.batched_ranking_metrics(data["y"], probs, np.ones(data["y"].size))[metric][0]
+                          for probs in data["probs"]])
+        for metric in BOOTSTRAP_METRICS
+    }
+    
+    ci_rows = []
+    delta_rows = []
+    for metric in BOOTSTRAP_METRICS:
+        dist = samples[metric]
+        for r, run_name in enumerate(runs):
+            low, high = np.nanquantile(dist[r], [alpha, 1 - alpha])
+            ci_rows.append({"Scope": scope, "Run": run_name, "Metric": BOOTSTRAP_METRIC_LABELS[metric],
+                            "Estimate": estimates[metric][r], "CI Low": low, "CI High": high,
+                            "Std": np.nanstd(dist[r]), "Resamples": n_resamples, "Method": method})
+        for a in range(len(runs)):
+            for b in range(a + 1, len(runs)):
+                delta = dist[a] - dist[b]
+                low, high = np.nanquantile(delta, [alpha, 1 - alpha])
+                delta_rows.append({"Scope": scope, "Run A": runs[a], "Run B": runs[b],
+                                   "Metric": BOOTSTRAP_METRIC_LABELS[metric],
+                                   "Delta": estimates[metric][a] - estimates[metric][b],
+                                   "CI Low": low, "CI High": high, "P(Delta > 0)": np.nanmean(delta > 0),
+                                   "Resamples": n_resamples, "Method": method})
+    return pd.DataFrame(ci_rows), pd.DataFrame(delta_rows)
+
+def select_runs(registry, folders=None):
+    """
+    Runs a analisar, na ordem do registro: as pastas pedidas em folders ou,
+    por padrão, todos os runs descobertos que têm output_final_master.
+    """
+    if not folders:
+        return [(run["label"], run["folder"]) for run in registry if run["has_master"]]
+    by_folder = {run["folder"]: run for run in registry}
+    for folder in folders:
+        if folder not in by_folder:
+            print(f"Run não encontrado em {BASE_DIR}: {folder}")
+    return [(run["label"], run["folder"]) for run in registry if run["folder"] in folders]
+
+def parse_args(argv=None):
+    # Padrões None resolvidos por quem usa a opção (streaming_metrics,
+    # spatial_analysis): -h não importa numpy/pyarrow
+    parser = argparse.ArgumentParser(description="Métricas avançadas (AUPRC, Recall@k, Calibração, Estabilidade de Drivers).")
+    parser.add_argument("--runs", nargs="+", metavar="PASTA",
+                        help="Pastas log_v3_* a avaliar (padrão: todos os runs descobertos com output_final_master).")
+    parser.add_argument("--single-load", action="store_true",
+                        help="Carrega o frame nacional uma vez e recorta os polos em memória ao recalcular o split.")
+    parser.add_argument("--verify-single-load", action="store_true",
+                        help="Compara o split da carga única com a recarga por escopo e encerra.")
+    parser.add_argument("--verify-metrics", action="store_true",
+                        help="Confere as métricas da passada única contra sklearn/pandas em cada (run, escopo).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Número de processos para avaliar as unidades (run, escopo) em paralelo.")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="B",
+                        help="Número de reamostragens bootstrap para os ICs de AUC/AUPRC/Brier (0 desativa).")
+    parser.add_argument("--bootstrap-method", choices=["block", "iid"], default="block",
+                        help="Reamostragem por bloco espacial (células de criar_grid_espacial) ou por linha.")
+    parser.add_argument("--bootstrap-scope", default="BRASIL", choices=SCOPES,
+                        help="Escopo cujo conjunto de teste é reamostrado.")
+    parser.add_argument("--mode", choices=["exact", "streaming"], default="exact",
+                        help="exact: predições de teste em memória; streaming: histogramas por record batch, com memória limitada.")
+    parser.add_argument("--stream-bins", type=int, default=None,
+                        help="Faixas de score dos histogramas do modo streaming (resolução das métricas).")
+    parser.add_argument("--batch-rows", type=int, default=None,
+                        help="Linhas por record batch no modo streaming.")
+    parser.add_argument("--spatial", action="store_true",
+                        help="Diagnóstico espacial dos resíduos: Moran global/local e AUC/AUPRC por célula do grid (spatial_analysis.py).")
+    parser.add_argument("--spatial-k", type=int, default=None,
+                        help="Vizinhos mais próximos na matriz de pesos do diagnóstico espacial.")
+    parser.add_argument("--spatial-permutations", type=int, default=None,
+                        help="Permutações do pseudo p-valor do Moran global (0 desativa).")
+    parser.add_argument("--calibration-plots", choices=["none", "panels"], default="none",
+                        help="panels: uma figura por run com um painel de calibração por escopo de CALIBRATION_SCOPES.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    import pandas as pd
+    import numpy as np
+    import id_index
+    import calibration
+    import spatial_analysis
+    
+    if args.verify_single_load:
+        ok = verify_single_load(SCOPES, INPUT_FILE)
+        print("Split da carga única idêntico à recarga por escopo." if ok else "ERRO: split da carga única diverge da recarga por escopo.")
+        return 0 if ok else 1
+    
+    # 1. Recupera IDs de Teste para BRASIL (Global) e cada Polo (Local)
+    # (manifesto em disco evita recarregar o geoparquet a cada execução)
+    test_split = load_test_split(SCOPES, INPUT_FILE, single_load=args.single_load)
+    all_test_ids = {scope: ids for scope, (ids, _) in test_split.items()}
+    print(f"Total Teste BRASIL: {len(all_test_ids['BRASIL'])}")
+    
+    # 2. Índice de IDs: chaves int64 ordenadas por escopo, compartilhadas por todos os runs
+    scope_index = id_index.build_scope_index(all_test_ids)
+    # União dos IDs de teste: recorte gravado no cache de predições de cada run
+    all_ids = np.unique(np.concatenate([np.asarray(ids, dtype=str) for ids in all_test_ids.values()]))
+    
+    # 3. Runs descobertos em BASE_DIR (run_registry.py)
+    selected = select_runs(run_registry.load_registry(BASE_DIR), args.runs)
+    runs = []
+    for run_name, folder_name in selected:
+        master_path = BASE_DIR / folder_name / "output_final" / "output_final_master.geoparquet"
+        if not master_path.exists():
+            print(f"Arquivo não encontrado: {master_path}")
+            continue
+        runs.append((run_name, folder_name))
+    
+    if args.mode == "streaming":
+        unit_results, bound_rows, df_calib = evaluate_streaming(runs, scope_index, args.stream_bins, args.batch_rows)
+        pd.DataFrame(bound_rows).to_csv(OUTPUT_DIR / "streaming_bounds.csv", index=False)
+        print("Limites de erro salvos em streaming_bounds.csv")
+    else:
+        cache_paths = prepare_prediction_caches(runs, all_ids)
+        if args.workers > 1:
+            unit_results = evaluate_parallel(runs, cache_paths, scope_index, args.workers, args.verify_metrics)
+        else:
+            unit_results = evaluate_sequential(runs, cache_paths, scope_index, args.verify_metrics)
+    
+    calib_ok = True
+    if args.mode == "exact":
+        # Calibração de todos os (run, escopo) numa única passada vetorizada
+        calib_units = [(unit["run"], unit["folder"], unit["scope"]) + unit["calibration"]
+                       for unit in unit_results if unit["calibration"] is not None]
+        df_calib = calibration.calibration_table(calib_units)
+        if args.verify_metrics:
+            calib_ok = calibration.verify_calibration_table(df_calib, calib_units)
+    # Faixas do modo streaming vêm dos histogramas: marcadas para o relatório
+    df_calib.assign(Mode=args.mode).to_csv(OUTPUT_DIR / "calibration_bins.csv", index=False)
+    print("Faixas de calibração salvas em calibration_bins.csv")
+    if args.calibration_plots == "panels":
+        for run_name, folder_name in runs:
+            calibration.plot_run_panels(df_calib, run_name, OUTPUT_DIR / f"calibration_{folder_name}.png", CALIBRATION_SCOPES)
+    
+    results, lift_frames = summarize_units(runs, unit_results)
+    metrics_ok = calib_ok and all(unit["verify_ok"] for unit in unit_results)
 
     # Salva Métricas
     df_res = pd.DataFrame(results)
     df_res.to_csv(OUTPUT_DIR / "advanced_metrics.csv", index=False)
     print("Métricas salvas em advanced_metrics.csv")
     
+    if lift_frames:
+        pd.concat(lift_frames, ignore_index=True).to_csv(OUTPUT_DIR / "lift_curves.csv", index=False)
+        print("Curvas de ganho/lift salvas em lift_curves.csv")
+    
+    # Intervalos de confiança por bootstrap (pareado entre runs)
+    if args.bootstrap > 0 and runs:
+        scope = args.bootstrap_scope
+        ids, groups = test_split[scope]
+        if args.mode == "streaming":
+            cache_paths = prepare_prediction_caches(runs, all_ids)
+        data = load_bootstrap_data(runs, cache_paths, scope, ids, groups, scope_index)
+        if data is not None:
+            print(f"Bootstrap ({args.bootstrap_method}, B={args.bootstrap}) em {scope}: {data['y'].size} linhas, {len(data['runs'])} runs...")
+            samples = run_bootstrap(data, args.bootstrap, block=args.bootstrap_method == "block", workers=args.workers)
+            df_ci, df_delta = summarize_bootstrap(data, samples, scope, args.bootstrap_method)
+            df_ci.to_csv(OUTPUT_DIR / "bootstrap_ci.csv", index=False)
+            df_delta.to_csv(OUTPUT_DIR / "bootstrap_deltas.csv", index=False)
+            print("ICs salvos em bootstrap_ci.csv e bootstrap_deltas.csv")
+    
+    # Diagnóstico espacial dos resíduos (Moran global/local, métricas por célula)
+    if args.spatial and runs:
+        if args.mode == "streaming" and args.bootstrap <= 0:
+            cache_paths = prepare_prediction_caches(runs, all_ids)
+        spatial_k = spatial_analysis.KNN_K if args.spatial_k is None else args.spatial_k
+        permutations = spatial_analysis.PERMUTATIONS if args.spatial_permutations is None else args.spatial_permutations
+        print(f"Diagnóstico espacial (k={spatial_k}, {permutations} permutações)...")
+        master_path = BASE_DIR / runs[0][1] / "output_final" / "output_final_master.geoparquet"
+        df_moran, df_cells, df_lisa = spatial_analysis.analyze_runs(
+            runs, cache_paths, master_path, test_split, scope_index, SCOPES, spatial_k, permutations)
+        df_moran.to_csv(OUTPUT_DIR / "spatial_moran.csv", index=False)
+        df_cells.to_csv(OUTPUT_DIR / "spatial_cells.csv", index=False)
+        df_lisa.to_parquet(OUTPUT_DIR / "spatial_lisa.parquet", index=False)
+        print("Diagnóstico espacial salvo em spatial_moran.csv, spatial_cells.csv e spatial_lisa.parquet")
+    
     # Estabilidade Drivers
-    analyze_driver_stability(RUNS_TO_ANALYZE)
+    analyze_driver_stability(selected)
+    
+    if args.verify_metrics:
+        print("Métricas da passada única conferem com sklearn/pandas." if metrics_ok else "ERRO: métricas da passada única divergem da referência.")
+        return 0 if metrics_ok else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Curvas de calibração por quantil de vários (run, escopo) numa única passada.
+
+calibration_table recebe as predições de teste de todos os pares, concatena
+tudo com um código por par e faz uma única ordenação (lexsort por par e
+score). Os cortes de quantil de cada par saem do array ordenado com a mesma
+interpolação linear do np.percentile, a atribuição das linhas às faixas é um
+merge ordenado entre linhas e cortes, e as somas por faixa são bincounts
+sobre o índice (par, faixa). O resultado reproduz
+sklearn.calibration.calibration_curve(strategy="quantile") e sai como uma
+tabela longa (uma linha por faixa não vazia).
+
+A renderização é separada e opcional: plot_run_panels gera uma figura com um
+painel por escopo (matplotlib, importado só ali) e calibration_svg gera um
+SVG inline, sem dependências, para o relatório.
+"""
+import numpy as np
+import pandas as pd
+
+N_BINS = 10
+
+TABLE_COLUMNS = ["Run", "Folder", "Scope", "Bin", "Prob Pred", "Prob True", "Count"]
+
+def _quantile_edges(sorted_p, starts, sizes, n_bins):
+    """
+    Cortes de quantil (U x n_bins+1) de cada segmento de sorted_p, com a
+    interpolação "linear" do np.percentile (Hyndman & Fan, método 7).
+    """
+    q = (np.linspace(0, 1, n_bins + 1) * 100) / 100
+    n = sizes[:, None].astype(float)
+    virtual = (n - 1) * q
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = np.clip(previous, 0, n - 1).astype(np.int64)
+    following = np.clip(previous + 1, 0, n - 1).astype(np.int64)
+    a = sorted_p[starts[:, None] + previous]
+    b = sorted_p[starts[:, None] + following]
+    diff_b_a = b - a
+    return np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma), a + diff_b_a * gamma)
+
+def calibration_table(units, n_bins=N_BINS):
+    """
+    units: lista de (run, pasta, escopo, y_true, y_prob). Retorna um DataFrame
+    com TABLE_COLUMNS, só com as faixas não vazias de cada par.
+    """
+    units = [unit for unit in units if np.asarray(unit[4]).size > 0]
+    if not units:
+        return pd.DataFrame(columns=TABLE_COLUMNS)
+
+    sizes = np.array([np.asarray(unit[4]).size for unit in units], dtype=np.int64)
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    code = np.repeat(np.arange(len(units)), sizes)
+    y = np.concatenate([np.asarray(unit[3], dtype=float) for unit in units]) == 1
+    p = np.concatenate([np.asarray(unit[4], dtype=float) for unit in units])
+
+    # Uma ordenação para todos os pares: por par e, dentro dele, por score
+    order = np.lexsort((p, code))
+    p_sorted = p[order]
+    y_sorted = y[order]
+    edges = _quantile_edges(p_sorted, starts, sizes, n_bins)[:, 1:-1]
+
+    # Merge ordenado linhas x cortes internos: a faixa de uma linha é o número
+    # de cortes estritamente menores que o score (searchsorted à esquerda).
+    # No empate a linha vem antes do corte.
+    n_inner = n_bins - 1
+    merged_code = np.r_[code, np.repeat(np.arange(len(units)), n_inner)]
+    merged_value = np.r_[p_sorted, edges.ravel()]
+    is_edge = np.r_[np.zeros(p.size, dtype=np.int8), np.ones(edges.size, dtype=np.int8)]
+    merged = np.lexsort((is_edge, merged_value, merged_code))
+    edges_before = np.cumsum(is_edge[merged])
+    row_pos = merged[is_edge[merged] == 0]
+    bin_ids = np.empty(p.size, dtype=np.int64)
+    bin_ids[row_pos] = edges_before[is_edge[merged] == 0] - code[row_pos] * n_inner
+
+    flat = code * n_bins + bin_ids
+    total = np.bincount(flat, minlength=len(units) * n_bins)
+    sums = np.bincount(flat, weights=p_sorted, minlength=len(units) * n_bins)
+    true = np.bincount(flat, weights=y_sorted, minlength=len(units) * n_bins)
+
+    nonzero = np.flatnonzero(total)
+    unit_of = nonzero // n_bins
+    return pd.DataFrame({
+        "Run": [units[i][0] for i in unit_of],
+        "Folder": [units[i][1] for i in unit_of],
+        "Scope": [units[i][2] for i in unit_of],
+        "Bin": nonzero % n_bins,
+        "Prob Pred": sums[nonzero] / total[nonzero],
+        "Prob True": true[nonzero] / total[nonzero],
+        "Count": total[nonzero],
+    }, columns=TABLE_COLUMNS)
+
+def verify_calibration_table(table, units, n_bins=N_BINS, tol=1e-12):
+    """Confere a tabela contra sklearn.calibration.calibration_curve em cada par."""
+    from sklearn.calibration import calibration_curve
+    ok = True
+    for run_name, _, scope, y_true, y_prob in units:
+        if np.asarray(y_prob).size == 0:
+            continue
+        prob_true, prob_pred = calibration_curve(y_true, y_prob, n_bins=n_bins, strategy='quantile')
+        rows = table[(table["Run"] == run_name) & (table["Scope"] == scope)]
+        if (len(rows) != prob_true.size
+                or np.max(np.abs(rows["Prob True"].to_numpy() - prob_true), initial=0) > tol
+                or np.max(np.abs(rows["Prob Pred"].to_numpy() - prob_pred), initial=0) > tol):
+            print(f"  [verify] {run_name}/{scope}: calibração diverge do sklearn")
+            ok = False
+    return ok
+
+def plot_run_panels(table, run_name, output_path, scopes=None):
+    """Uma figura por run, com um painel de calibração por escopo."""
+    import matplotlib.pyplot as plt
+    rows = table[table["Run"] == run_name]
+    scopes = [s for s in (scopes or rows["Scope"].unique()) if (rows["Scope"] == s).any()]
+    if not scopes:
+        return
+    n_cols = min(len(scopes), 4)
+    n_rows = -(-len(scopes) // n_cols)
+    fig, axes = plt.subplots(n_rows, n_cols, figsize=(4 * n_cols, 4 * n_rows), squeeze=False)
+    for ax, scope in zip(axes.ravel(), scopes):
+        curve = rows[rows["Scope"] == scope]
+        ax.plot(curve["Prob Pred"], curve["Prob True"], marker='o')
+        ax.plot([0, 1], [0, 1], linestyle='--', color='gray')
+        ax.set_title(scope)
+        ax.grid(True)
+    for ax in axes.ravel()[len(scopes):]:
+        ax.axis('off')
+    fig.supxlabel('Probabilidade Predita Média')
+    fig.supylabel('Fração de Positivos (FCU)')
+    fig.suptitle(f'Curvas de Calibração - {run_name}')
+    fig.tight_layout()
+    fig.savefig(output_path)
+    plt.close(fig)
+
+def calibration_svg(prob_pred, prob_true, size=240, pad=28):
+    """SVG inline de uma curva de calibração (diagonal de referência + pontos)."""
+    inner = size - 2 * pad
+    hi = max(1e-9, float(np.max(prob_pred, initial=0)), float(np.max(prob_true, initial=0)))
+    def xy(px, py):
+        return pad + inner * px / hi, size - pad - inner * py / hi
+    points = " ".join(f"{x:.1f},{y:.1f}" for x, y in (xy(a, b) for a, b in zip(prob_pred, prob_true)))
+    x0, y0 = xy(0, 0)
+    x1, y1 = xy(hi, hi)
+    parts = [f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {size} {size}' width='100%'>",
+             f"<rect x='{pad}' y='{pad}' width='{inner}' height='{inner}' fill='none' stroke='#ccc'/>",
+             f"<line x1='{x0:.1f}' y1='{y0:.1f}' x2='{x1:.1f}' y2='{y1:.1f}' stroke='gray' stroke-dasharray='4 3'/>",
+             f"<polyline points='{points}' fill='none' stroke='#1f77b4' stroke-width='2'/>"]
+    parts += [f"<circle cx='{x:.1f}' cy='{y:.1f}' r='3' fill='#1f77b4'/>" for x, y in (xy(a, b) for a, b in zip(prob_pred, prob_true))]
+    parts += [f"<text x='{pad}' y='{size - 8}' font-size='10'>0</text>",
+              f"<text x='{size - pad}' y='{size - 8}' font-size='10' text-anchor='end'>{hi:.2f}</text>",
+              f"<text x='{size / 2}' y='{size - 8}' font-size='10' text-anchor='middle'>Predita</text>",
+              f"<text x='10' y='{size / 2}' font-size='10' text-anchor='middle' transform='rotate(-90 10 {size / 2})'>Observada</text>",
+              "</svg>"]
+    return "".join(parts)
@@ -0,0 +1,153 @@
+"""
+Ponto de entrada único dos scripts do relatório.
+
+    python cli.py runs [--refresh]
+    python cli.py evaluate [opções de advanced_evaluation.py]
+    python cli.py consolidate [opções de consolidate_results.py]
+    python cli.py diff [opções de prediction_diff.py]
+    python cli.py hotspots [opções de hotspots.py]
+    python cli.py package
+
+Aqui só se importa a biblioteca padrão. Cada subcomando importa o script que
+executa (e, por ele, pandas/pyarrow/sklearn/geopandas) apenas quando é
+chamado, então listar os runs ou pedir ajuda não carrega nada pesado. Com
+--import-times, o tempo de importação de cada pacote é impresso ao final,
+junto com o tempo total desde a criação do processo (interpretador incluído).
+"""
+# Primeira instrução: o total de --import-times inclui os imports do topo
+import time
+START = time.perf_counter()
+
+import argparse
+import builtins
+import sys
+from pathlib import Path
+
+import run_registry
+
+# Configuração (run_registry.py)
+BASE_DIR = run_registry.BASE_DIR
+
+# Subcomando -> (módulo, função que recebe argv)
+COMMANDS = {
+    "evaluate": ("advanced_evaluation", "main"),
+    "consolidate": ("consolidate_results", "main"),
+    "diff": ("prediction_diff", "main"),
+    "hotspots": ("hotspots", "main"),
+}
+
+def track_imports(timings):
+    """
+    Passa a medir cada import novo (ainda fora de sys.modules), acumulando em
+    timings[pacote] o tempo próprio do pacote, sem o dos pacotes que ele puxa.
+    """
+    original = builtins.__import__
+    stack = []
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            root = name.partition(".")[0]
+            timings[root] = timings.get(root, 0.0) + elapsed - children
+
+    builtins.__import__ = timed_import
+    return original
+
+def process_age():
+    """
+    Segundos desde a criação do processo (Linux e Windows; None em outros
+    sistemas), para contar também a inicialização do interpretador.
+    """
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            creation, exit_time, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+            kernel32 = ctypes.windll.kernel32
+            if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation), ctypes.byref(exit_time),
+                                            ctypes.byref(kernel), ctypes.byref(user)):
+                return None
+            kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            # FILETIME: intervalos de 100 ns
+            return (((now.dwHighDateTime << 32) | now.dwLowDateTime)
+                    - ((creation.dwHighDateTime << 32) | creation.dwLowDateTime)) / 1e7
+        import os
+        with open("/proc/self/stat") as f:
+            # Campo 22 (starttime, em ticks desde o boot), contado depois do nome entre parênteses
+            start_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+def print_import_times(timings, total):
+    """Tempo de importação por pacote e total (desde a criação do processo, quando disponível)."""
+    print(f"\nTempo de importação ({sum(timings.values()):.2f}s de {total:.2f}s no total):")
+    for name, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        if seconds >= 0.005:
+            print(f"  {name:<24} {seconds:6.2f}s")
+
+def list_runs(refresh=False):
+    runs = run_registry.load_registry(BASE_DIR, refresh=refresh)
+    print(f"{'Run':<26} {'Pasta':<20} {'Threshold':>9}  {'Variante':<8} {'Master':<6} Origem")
+    for run in runs:
+        print(f"{run['label']:<26} {run['folder']:<20} {run['threshold']:>9.2f}  {run['variant']:<8} "
+              f"{'sim' if run['has_master'] else 'não':<6} {run['source']}")
+    print(f"{len(runs)} runs em {BASE_DIR}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scripts do relatório de sensibilidade do Preditor FCU.")
+    parser.add_argument("--import-times", action="store_true",
+                        help="Imprime, ao final, o tempo gasto importando cada pacote.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    runs_parser = subparsers.add_parser("runs", help="Lista os runs descobertos (run_registry.py).")
+    runs_parser.add_argument("--refresh", action="store_true", help="Ignora o manifesto em cache e varre as pastas de novo.")
+    # Sem ajuda própria: -h e as demais opções vão direto para o script
+    subparsers.add_parser("evaluate", add_help=False, help="Roda advanced_evaluation.py (opções repassadas ao script).")
+    subparsers.add_parser("consolidate", add_help=False, help="Roda consolidate_results.py (opções repassadas ao script).")
+    subparsers.add_parser("diff", add_help=False, help="Roda prediction_diff.py (opções repassadas ao script).")
+    subparsers.add_parser("hotspots", add_help=False, help="Roda hotspots.py (opções repassadas ao script).")
+    subparsers.add_parser("package", help="Empacota o relatório para deploy estático (package_for_vercel.py).")
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.command not in COMMANDS:
+        parser.error(f"argumentos não reconhecidos: {' '.join(rest)}")
+    return args, rest
+
+def main(argv=None):
+    args, rest = parse_args(argv)
+    # Imports do topo de cli.py (argparse, run_registry, ...), anteriores ao rastreio
+    timings = {"cli.py (topo)": time.perf_counter() - START}
+    original_import = track_imports(timings) if args.import_times else None
+    try:
+        if args.command == "runs":
+            list_runs(refresh=args.refresh)
+        elif args.command == "package":
+            import package_for_vercel
+            package_for_vercel.package_report()
+        else:
+            module_name, function = COMMANDS[args.command]
+            # Código de saída do script (None = sucesso)
+            return getattr(__import__(module_name), function)(rest)
+    finally:
+        if original_import is not None:
+            builtins.__import__ = original_import
+            elapsed = time.perf_counter() - START
+            age = process_age()
+            if age is not None and age > elapsed:
+                # Inicialização do interpretador (e site), antes da primeira linha de cli.py
+                timings["interpretador"] = age - elapsed
+                elapsed = age
+            print_import_times(timings, elapsed)
+
+if __name__ == "__main__":
+    sys.exit(main())
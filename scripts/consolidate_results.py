@@ -1,23 +1,34 @@
 import json
-import pandas as pd
+import os
+import sys
 from pathlib import Path
-import re
-import glob
+from datetime import datetime
+import hashlib
+import argparse
+import importlib.util
+import itertools
+import struct
+import time
+import driver_reports
+import run_registry
+
+# pandas, calibration e metrics_store são importados dentro das seções que os
+# usam: um build incremental sem mudanças (ou --section de uma seção leve)
+# não paga o custo de importar pandas/pyarrow.
 
 # Configuração
-BASE_DIR = Path(r"C:\Users\adirs\Downloads\preditor_fcu-20251203T221625Z-1-001\preditor_fcu_v3")
+BASE_DIR = run_registry.BASE_DIR
 OUTPUT_FILE = BASE_DIR / "comparativo_sensibilidade.txt"
 
-RUNS = [
-    ("Run 1 (0.95, Std)", "log_v3_95_std"),
-    ("Run 2 (0.80, Std)", "log_v3_80_std"),
-    ("Run 3 (0.70, Std)", "log_v3_70_std"),
-    ("Run 4 (0.60, Std)", "log_v3_60_std"),
-    ("Run 5 (0.95, NoInt)", "log_v3_95_noint"),
-    ("Run 6 (0.80, NoInt)", "log_v3_80_noint"),
-    ("Run 7 (0.70, NoInt)", "log_v3_70_noint"),
-    ("Run 8 (0.60, NoInt)", "log_v3_60_noint"),
-]
+# Runs descobertos nas pastas log_v3_<thresh>_<variante> (run_registry.py),
+# como [(rótulo, pasta)]. refresh_runs() atualiza a lista a cada build.
+REGISTRY = run_registry.load_registry(BASE_DIR)
+RUNS = run_registry.run_pairs(REGISTRY)
+
+# Run recomendado, cujas curvas de elasticidade vão na seção 3.1
+ELASTICITY_RUN_FOLDER = "log_v3_60_noint"
+# Run de maior AUC citado na conclusão (seção 6)
+BEST_AUC_RUN_FOLDER = "log_v3_80_noint"
 
 SCOPES = [
     "Juazeiro_do_Norte",
@@ -29,77 +40,43 @@ SCOPES = [
     "BRASIL"
 ]
 
-def get_metrics(log_dir, scope):
-    try:
-        with open(log_dir / "modelos" / f"metrics_{scope}.json", "r") as f:
-            data = json.load(f)
-        return data.get("auc", 0), data.get("brier_score", 0)
-    except FileNotFoundError:
-        try:
-            log_path = log_dir / "treinamento" / f"log_treino_{scope}.txt"
-            with open(log_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            match = re.search(r"AUC=(\d+\.\d+), Brier=(\d+\.\d+)", content)
-            if match:
-                return float(match.group(1)), float(match.group(2))
-        except FileNotFoundError:
-            pass
-        return None, None
-
-def get_feature_count(log_dir, scope):
+# Métricas do store (metrics_store.py), carregadas uma vez por build do relatório
+_METRICS = {}
+
+# Modo --lazy-tabs: as tabelas das abas (seções 2 e 3) saem como um payload JSON
+# e são montadas no navegador quando a aba é aberta pela primeira vez
+LAZY_TABS = False
+
+def report_metrics():
+    """Lookup {(pasta, escopo, métrica): valor} do store de métricas."""
+    if "lookup" not in _METRICS:
+        import metrics_store
+        _METRICS["lookup"] = metrics_store.metric_lookup(metrics_store.load_metrics(BASE_DIR, RUNS, SCOPES))
+    return _METRICS["lookup"]
+
+def get_distribution_table(log_dir):
+    """DataFrame de table_distribution_comparative.csv do run, ou None se não existir."""
+    csv_path = log_dir / "output_final" / "relatorios_visuais" / "table_distribution_comparative.csv"
+    import pandas as pd
     try:
-        with open(log_dir / "features_config" / f"selected_features_{scope}.json", "r") as f:
-            data = json.load(f)
-        return len(data)
+        return pd.read_csv(csv_path)
     except FileNotFoundError:
-        try:
-            log_path = log_dir / "treinamento" / f"log_treino_{scope}.txt"
-            with open(log_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            match = re.search(r"Shapes: Treino=\(\d+, (\d+)\)", content)
-            if match:
-                return int(match.group(1))
-        except FileNotFoundError:
-            pass
-        return 0
-
-def get_full_drivers_matrix(log_dir, scope):
-    txt_path = log_dir / "relatorios" / f"relatorio_analise_{scope}.txt"
-    drivers = {}
-    try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        
-        start_idx = -1
-        for i, line in enumerate(lines):
-            if "Fatores de Influência (EBM)" in line:
-                start_idx = i + 3
-                break
-        
-        if start_idx != -1:
-            for i in range(start_idx, len(lines)):
-                line = lines[i].strip()
-                if not line or "──────" in line:
-                    if line and "──────" in line:
-                        break
-                    continue
-                
-                if "feature_pretty" in line: continue
-
-                parts = line.rsplit(maxsplit=1)
-                if len(parts) == 2:
-                    name = parts[0].strip()
-                    try:
-                        score = float(parts[1])
-                        drivers[name] = score
-                    except ValueError:
-                        continue
-    except FileNotFoundError:
-        pass
-    return drivers
+        return None
+
+def distribution_cells(df):
+    """
+    Texto das células de df, coluna a coluna, como df.to_html(index=False) o
+    escreve: o mesmo formatador do pandas (casas decimais, NaN), sem escapar.
+    """
+    import pandas as pd
+    from pandas.io.formats.format import DataFrameFormatter
+    fmt = DataFrameFormatter(df, index=False)
+    with pd.option_context("display.max_colwidth", None):
+        return [[cell.strip() for cell in fmt.format_col(i)] for i in range(len(df.columns))]
 
 def get_distribution_html(log_dir):
     csv_path = log_dir / "output_final" / "relatorios_visuais" / "table_distribution_comparative.csv"
+    import pandas as pd
     try:
         df = pd.read_csv(csv_path)
         return df.to_html(index=False, border=0, classes='table table-striped')
@@ -175,25 +152,56 @@ def get_pretty_name(feature_name):
         return " & ".join(pretty_parts)
     return VAR_PRETTY_MAP.get(feature_name, feature_name)
 
+def png_size(path):
+    """(largura, altura) de um PNG lidas do cabeçalho IHDR, sem decodificar a imagem; None se não der."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+def img_tag(rel_path, style="width:100%"):
+    """<img> com carregamento lazy e width/height do arquivo, para o navegador reservar o espaço antes do download."""
+    size = png_size(BASE_DIR / rel_path)
+    dims = f" width='{size[0]}' height='{size[1]}'" if size else ""
+    return f"<img src='{rel_path}'{dims} loading='lazy' decoding='async' style='{style}; height:auto'>"
+
+def refresh_runs():
+    global REGISTRY, RUNS
+    REGISTRY = run_registry.load_registry(BASE_DIR)
+    RUNS = run_registry.run_pairs(REGISTRY)
+
+def elasticity_folder():
+    return next((f for _, f in RUNS if f == ELASTICITY_RUN_FOLDER), None)
+
+def run_label(folder, short=False):
+    """
+    Rótulo atual do run da pasta ("Run 8 (0.60, NoInt)", ou "Run 8" com
+    short=True). A numeração segue as pastas descobertas, então o texto do
+    relatório cita os runs por aqui, nunca pelo número. Sem o run, a pasta.
+    """
+    label = next((name for name, f in RUNS if f == folder), folder)
+    return label.split("(")[0].strip() if short else label
+
 def calculate_ablation_impact():
-    comparisons = [
-        ("0.95", "Run 1 (0.95, Std)", "Run 5 (0.95, NoInt)"),
-        ("0.80", "Run 2 (0.80, Std)", "Run 6 (0.80, NoInt)"),
-        ("0.70", "Run 3 (0.70, Std)", "Run 7 (0.70, NoInt)"),
-        ("0.60", "Run 4 (0.60, Std)", "Run 8 (0.60, NoInt)"),
-    ]
+    # Pares (threshold, com interações, sem interações) de cada threshold com as duas variantes
+    comparisons = run_registry.interaction_pairs(REGISTRY)
     
     html = []
     html.append("<p>Comparativo direto entre modelos com interações (Standard) e sem interações (NoInt) para avaliar o ganho de performance.</p>")
     html.append("<table><caption>Tabela 5. Impacto das Interações na Performance (AUC)</caption>")
     html.append("<tr><th>Threshold</th><th>AUC (Com Interações)</th><th>AUC (Sem Interações)</th><th>Delta</th><th>Impacto</th></tr>")
     
+    metrics = report_metrics()
     for thresh, run_std, run_noint in comparisons:
         folder_std = next(f for r, f in RUNS if r == run_std)
         folder_noint = next(f for r, f in RUNS if r == run_noint)
         
-        auc_std, _ = get_metrics(BASE_DIR / folder_std, "BRASIL")
-        auc_noint, _ = get_metrics(BASE_DIR / folder_noint, "BRASIL")
+        auc_std = metrics.get((folder_std, "BRASIL", "auc"))
+        auc_noint = metrics.get((folder_noint, "BRASIL", "auc"))
         
         if auc_std and auc_noint:
             delta = auc_std - auc_noint
@@ -205,9 +213,85 @@ def calculate_ablation_impact():
     html.append("<div class='source'>Fonte: Elaboração própria a partir dos dados do Preditor FCU v3.</div>")
     return "\n".join(html)
 
-def generate_html_report(output_file):
-    html = []
-    html.append("""
+# Montagem das tabelas do modo --lazy-tabs: cada .lazy-table da aba aberta vira
+# uma tabela a partir do payload JSON da seção (lido uma vez por seção)
+LAZY_TAB_SCRIPT = """
+            var lazyPayloads = {};
+            function escapeHtml(s) { return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;'); }
+            function heatmapCell(v, text, max) {
+                var norm = Math.min(Math.abs(v) / max, 1), g = Math.floor(255 * (1 - norm)), b = Math.floor(200 * (1 - norm));
+                return "<td class='heatmap-cell' style='background-color: rgb(255, " + g + ", " + b + "); color: " + (norm > 0.6 ? "#fff" : "#000") + "'>" + escapeHtml(text) + "</td>";
+            }
+            function lazyTableHtml(t) {
+                var html = ["<table><caption>" + escapeHtml(t.caption) + "</caption><tr>"], i, j;
+                if (t.kind === "heatmap") {
+                    html.push("<th style='text-align:left'>Variável</th>");
+                    t.columns.forEach(function(c) { html.push("<th>" + escapeHtml(c) + "</th>"); });
+                    html.push("</tr>");
+                    for (i = 0; i < t.rows.length; i++) {
+                        html.push("<tr><td style='text-align:left'>" + escapeHtml(t.rows[i]) + "</td>");
+                        for (j = 0; j < t.columns.length; j++) html.push(heatmapCell(t.values[i * t.columns.length + j], t.text[i * t.columns.length + j], t.max));
+                        html.push("</tr>");
+                    }
+                } else {
+                    t.columns.forEach(function(c) { html.push("<th style='text-align:center'>" + escapeHtml(c) + "</th>"); });
+                    html.push("</tr>");
+                    for (i = 0; i < t.data[0].length; i++) {
+                        html.push("<tr>");
+                        for (j = 0; j < t.columns.length; j++) html.push("<td>" + escapeHtml(t.data[j][i]) + "</td>");
+                        html.push("</tr>");
+                    }
+                }
+                html.push("</table>");
+                return html.join("");
+            }
+            function renderLazyTab(tabId) {
+                var slots = document.getElementById(tabId).querySelectorAll(".lazy-table:not([data-rendered])");
+                for (var i = 0; i < slots.length; i++) {
+                    var id = slots[i].getAttribute("data-payload");
+                    if (!lazyPayloads[id]) lazyPayloads[id] = JSON.parse(document.getElementById(id).textContent);
+                    slots[i].innerHTML = lazyTableHtml(lazyPayloads[id][slots[i].getAttribute("data-table")]);
+                    slots[i].setAttribute("data-rendered", "1");
+                }
+            }"""
+
+def lazy_payload(payload_id, tables):
+    """<script type='application/json'> com as tabelas {id da tabela: dados} de uma seção no modo --lazy-tabs."""
+    data = json.dumps(tables, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    return f"<script type='application/json' id='{payload_id}'>{data}</script>"
+
+def lazy_slot(payload_id, table_id):
+    return f"<div class='lazy-table' data-payload='{payload_id}' data-table='{table_id}'></div>"
+
+def heatmap_cell_text(val):
+    """Texto de uma célula da matriz de drivers (o mesmo nos dois modos)."""
+    return f"{val:.2f}"
+
+def verify_lazy_tabs():
+    """
+    Confere, run a run, se as tabelas de distribuição do modo --lazy-tabs têm o
+    mesmo texto, célula a célula, das tabelas do modo normal (df.to_html).
+    Retorna o número de tabelas divergentes.
+    """
+    import html as html_lib
+    import re
+    mismatches = 0
+    for run_name, folder_name in RUNS:
+        log_dir = BASE_DIR / folder_name
+        df_dist = get_distribution_table(log_dir)
+        if df_dist is None:
+            continue
+        eager = [html_lib.unescape(cell) for cell in re.findall(r"<td>(.*?)</td>", get_distribution_html(log_dir), re.S)]
+        lazy = [cell for row in zip(*distribution_cells(df_dist)) for cell in row]
+        if eager != lazy:
+            first = next((i for i, (a, b) in enumerate(zip(eager, lazy)) if a != b), min(len(eager), len(lazy)))
+            print(f"[DIVERGE] {run_name}: célula {first} (normal {eager[first:first + 1]}, lazy {lazy[first:first + 1]})")
+            mismatches += 1
+    print(f"Tabelas de distribuição: {mismatches} divergências entre --lazy-tabs e o modo normal.")
+    return mismatches
+
+def render_header():
+    yield """
     <!DOCTYPE html>
     <html lang="pt-BR">
     <head>
@@ -249,8 +333,9 @@ def generate_html_report(output_file):
                 tablinks = document.getElementsByClassName(btnClass);
                 for (i = 0; i < tablinks.length; i++) { tablinks[i].className = tablinks[i].className.replace(" active", ""); }
                 document.getElementById(tabId).style.display = "block";
-                evt.currentTarget.className += " active";
-            }
+                evt.currentTarget.className += " active";""" + ("""
+                renderLazyTab(tabId);""" if LAZY_TABS else "") + """
+            }""" + (LAZY_TAB_SCRIPT if LAZY_TABS else "") + """
             window.onload = function() {
                 if(document.getElementsByClassName("tablinks-dist").length > 0) document.getElementsByClassName("tablinks-dist")[0].click();
                 if(document.getElementsByClassName("tablinks-drivers").length > 0) document.getElementsByClassName("tablinks-drivers")[0].click();
@@ -261,107 +346,126 @@ def generate_html_report(output_file):
     </head>
     <body>
     <h1>Relatório Final de Análise de Sensibilidade<br>Preditor FCU v3</h1>
-    <p style="text-align: center;">Data de Geração: """ + pd.Timestamp.now().strftime("%d/%m/%Y %H:%M") + """</p>
-    <p>Este relatório consolida os resultados de oito rodadas de treinamento (Runs) do modelo Preditor FCU v3.</p>
-    """)
+    <p style="text-align: center;">Data de Geração: """ + datetime.now().strftime("%d/%m/%Y %H:%M") + """</p>
+    <p>Este relatório consolida os resultados de """ + f"{len(RUNS)} rodada{'s' if len(RUNS) != 1 else ''}" + """ de treinamento (Runs) do modelo Preditor FCU v3.</p>
+    """
 
+def render_summary():
     # 1. Resumo Métricas
-    html.append("<h2>1. Resumo de Métricas (Escopo: BRASIL)</h2>")
-    html.append("<table><caption>Tabela 1. Desempenho Global dos Modelos</caption>")
-    html.append("<tr><th>Run</th><th>Variáveis Selecionadas</th><th>AUC (ROC)</th><th>Brier Score</th></tr>")
+    yield "<h2>1. Resumo de Métricas (Escopo: BRASIL)</h2>"
+    yield "<table><caption>Tabela 1. Desempenho Global dos Modelos</caption>"
+    yield "<tr><th>Run</th><th>Variáveis Selecionadas</th><th>AUC (ROC)</th><th>Brier Score</th></tr>"
+    metrics = report_metrics()
     for run_name, folder_name in RUNS:
-        log_dir = BASE_DIR / folder_name
-        auc, brier = get_metrics(log_dir, "BRASIL")
-        count = get_feature_count(log_dir, "BRASIL")
+        auc = metrics.get((folder_name, "BRASIL", "auc"))
+        brier = metrics.get((folder_name, "BRASIL", "brier"))
+        count = int(metrics.get((folder_name, "BRASIL", "n_features"), 0))
         if auc is not None:
-            html.append(f"<tr><td style='text-align:left'>{run_name}</td><td>{count}</td><td>{auc:.4f}</td><td>{brier:.4f}</td></tr>")
+            yield f"<tr><td style='text-align:left'>{run_name}</td><td>{count}</td><td>{auc:.4f}</td><td>{brier:.4f}</td></tr>"
         else:
-            html.append(f"<tr><td style='text-align:left'>{run_name}</td><td>-</td><td>-</td><td>-</td></tr>")
-    html.append("</table>")
-    html.append("<div class='source'>Fonte: Elaboração própria.</div>")
+            yield f"<tr><td style='text-align:left'>{run_name}</td><td>-</td><td>-</td><td>-</td></tr>"
+    yield "</table>"
+    yield "<div class='source'>Fonte: Elaboração própria.</div>"
 
+def render_distribution():
     # 2. Tabelas de Distribuição
-    html.append("<h2>2. Distribuição de Probabilidades (Local vs Global)</h2>")
-    html.append("<div class='tab'>")
+    yield "<h2>2. Distribuição de Probabilidades (Local vs Global)</h2>"
+    yield "<div class='tab'>"
     for i, (run_name, _) in enumerate(RUNS, 1):
         safe_id = f"DistRun{i}"
         label = run_name.split('(')[0].strip()
-        html.append(f"<button class='tablinks-dist' onclick=\"openTab(event, '{safe_id}', 'content-dist', 'tablinks-dist')\">{label}</button>")
-    html.append("</div>")
+        yield f"<button class='tablinks-dist' onclick=\"openTab(event, '{safe_id}', 'content-dist', 'tablinks-dist')\">{label}</button>"
+    yield "</div>"
     
+    payload = {}
     for i, (run_name, folder_name) in enumerate(RUNS, 1):
         safe_id = f"DistRun{i}"
-        html.append(f"<div id='{safe_id}' class='content-dist tabcontent'>")
-        html.append(f"<h3>{run_name}</h3>")
+        yield f"<div id='{safe_id}' class='content-dist tabcontent'>"
+        yield f"<h3>{run_name}</h3>"
         log_dir = BASE_DIR / folder_name
+        if LAZY_TABS:
+            df_dist = get_distribution_table(log_dir)
+            if df_dist is None:
+                yield "<p>Dados de distribuição não disponíveis.</p>"
+            else:
+                payload[safe_id] = {"kind": "table", "caption": f"Tabela 2.{i}. Distribuição - {run_name}",
+                                    "columns": [str(c) for c in df_dist.columns],
+                                    "data": distribution_cells(df_dist)}
+                yield lazy_slot("report-data-dist", safe_id)
+                yield "<div class='source'>Fonte: Elaboração própria.</div>"
+            yield "</div>"
+            continue
         dist_html = get_distribution_html(log_dir)
         if "Tabela não encontrada" in dist_html:
-             html.append("<p>Dados de distribuição não disponíveis.</p>")
+             yield "<p>Dados de distribuição não disponíveis.</p>"
         else:
             dist_html = dist_html.replace('<table border="1" class="dataframe">', f'<table><caption>Tabela 2.{i}. Distribuição - {run_name}</caption>')
             dist_html = dist_html.replace('<thead>', '<thead>').replace('<th>', '<th style="text-align:center">')
-            html.append(dist_html)
-            html.append("<div class='source'>Fonte: Elaboração própria.</div>")
-        html.append("</div>")
+            yield dist_html
+            yield "<div class='source'>Fonte: Elaboração própria.</div>"
+        yield "</div>"
+    if payload:
+        yield lazy_payload("report-data-dist", payload)
 
+def render_drivers():
     # 3. Matriz de Drivers
-    html.append("<h2>3. Matriz de Drivers de Risco (Completa)</h2>")
-    html.append("<div class='tab'>")
+    yield "<h2>3. Matriz de Drivers de Risco (Completa)</h2>"
+    yield "<div class='tab'>"
     for i, (run_name, _) in enumerate(RUNS, 1):
         safe_id = f"DriverRun{i}"
         label = run_name.split('(')[0].strip()
-        html.append(f"<button class='tablinks-drivers' onclick=\"openTab(event, '{safe_id}', 'content-drivers', 'tablinks-drivers')\">{label}</button>")
-    html.append("</div>")
+        yield f"<button class='tablinks-drivers' onclick=\"openTab(event, '{safe_id}', 'content-drivers', 'tablinks-drivers')\">{label}</button>"
+    yield "</div>"
+    
+    # Drivers de todos os runs e escopos (cache compartilhado) num cubo run x variável x escopo
+    import driver_matrix
+    driver_table = driver_reports.load_driver_table(BASE_DIR, [folder for _, folder in RUNS], SCOPES)
+    cube = driver_matrix.driver_cube(driver_table, [folder for _, folder in RUNS], SCOPES, rename=get_pretty_name)
     
+    payload = {}
     for i, (run_name, folder_name) in enumerate(RUNS, 1):
         safe_id = f"DriverRun{i}"
-        html.append(f"<div id='{safe_id}' class='content-drivers tabcontent'>")
-        html.append(f"<h3>{run_name}</h3>")
+        yield f"<div id='{safe_id}' class='content-drivers tabcontent'>"
+        yield f"<h3>{run_name}</h3>"
         
-        all_drivers_data = {}
-        all_feature_names = set()
-        for scope in SCOPES:
-            log_dir = BASE_DIR / folder_name
-            drivers = get_full_drivers_matrix(log_dir, scope)
-            pretty_drivers = {get_pretty_name(k): v for k, v in drivers.items()}
-            all_drivers_data[scope] = pretty_drivers
-            all_feature_names.update(pretty_drivers.keys())
-            
-        feature_max_scores = {}
-        for feat in all_feature_names:
-            scores = [abs(all_drivers_data.get(s, {}).get(feat, 0.0)) for s in SCOPES]
-            feature_max_scores[feat] = max(scores)
-            
-        sorted_features = sorted(list(all_feature_names), key=lambda x: feature_max_scores[x], reverse=True)
+        matrix = driver_matrix.run_matrix(cube, folder_name)
         
-        if not sorted_features:
-            html.append("<p>Dados não disponíveis para este Run.</p>")
+        if matrix.empty:
+            yield "<p>Dados não disponíveis para este Run.</p>"
+        elif LAZY_TABS:
+            # Valores em ordem de linha, sem arredondar, para as cores (heatmapCell); o
+            # texto já vai formatado, como no modo normal, para não arredondar duas vezes
+            values = matrix.to_numpy().ravel()
+            payload[safe_id] = {"kind": "heatmap", "caption": f"Tabela 3.{i}. Matriz de Importância - {run_name}",
+                                "columns": [scope.replace('_', ' ') for scope in SCOPES], "rows": list(matrix.index),
+                                "values": values.tolist(), "text": [heatmap_cell_text(val) for val in values],
+                                "max": driver_matrix.HEATMAP_MAX}
+            yield lazy_slot("report-data-drivers", safe_id)
+            yield "<div class='source'>Fonte: Elaboração própria.</div>"
         else:
-            html.append(f"<table><caption>Tabela 3.{i}. Matriz de Importância - {run_name}</caption>")
-            html.append("<tr><th style='text-align:left'>Variável</th>" + "".join([f"<th>{scope.replace('_', ' ')}</th>" for scope in SCOPES]) + "</tr>")
-            for feature in sorted_features:
-                html.append(f"<tr><td style='text-align:left'>{feature}</td>")
-                for scope in SCOPES:
-                    val = all_drivers_data.get(scope, {}).get(feature, 0.0)
-                    max_val = 1.5
-                    norm = min(abs(val) / max_val, 1.0)
-                    g = int(255 * (1 - norm))
-                    b = int(200 * (1 - norm))
-                    bg_color = f"rgb(255, {g}, {b})"
-                    text_color = "#fff" if norm > 0.6 else "#000"
-                    html.append(f"<td class='heatmap-cell' style='background-color: {bg_color}; color: {text_color}'>{val:.2f}</td>")
-                html.append("</tr>")
-            html.append("</table>")
-            html.append("<div class='source'>Fonte: Elaboração própria.</div>")
-        html.append("</div>")
-
-    # 3.1 Curvas de Elasticidade (Run 8)
-    html.append("<h2>3.1 Curvas de Elasticidade (Run 8)</h2>")
-    html.append("<p>As curvas de elasticidade (ou funções de forma) ilustram como a probabilidade de risco (Score EBM) varia em função dos valores de cada variável preditora, mantendo as demais constantes. Elas permitem visualizar a natureza da relação (linear, não-linear, limiar) e a direção do efeito.</p>")
+            yield f"<table><caption>Tabela 3.{i}. Matriz de Importância - {run_name}</caption>"
+            yield "<tr><th style='text-align:left'>Variável</th>" + "".join([f"<th>{scope.replace('_', ' ')}</th>" for scope in SCOPES]) + "</tr>"
+            values = matrix.to_numpy()
+            bg_colors, text_colors = driver_matrix.heatmap_colors(values)
+            for feature, row, bg_row, text_row in zip(matrix.index, values, bg_colors, text_colors):
+                yield f"<tr><td style='text-align:left'>{feature}</td>"
+                yield from (f"<td class='heatmap-cell' style='background-color: {bg}; color: {text}'>{heatmap_cell_text(val)}</td>"
+                            for val, bg, text in zip(row, bg_row, text_row))
+                yield "</tr>"
+            yield "</table>"
+            yield "<div class='source'>Fonte: Elaboração própria.</div>"
+        yield "</div>"
+    if payload:
+        yield lazy_payload("report-data-drivers", payload)
+
+def render_elasticity():
+    # 3.1 Curvas de Elasticidade (run recomendado)
+    yield f"<h2>3.1 Curvas de Elasticidade ({run_label(ELASTICITY_RUN_FOLDER, short=True)})</h2>"
+    yield "<p>As curvas de elasticidade (ou funções de forma) ilustram como a probabilidade de risco (Score EBM) varia em função dos valores de cada variável preditora, mantendo as demais constantes. Elas permitem visualizar a natureza da relação (linear, não-linear, limiar) e a direção do efeito.</p>"
     
-    run8_folder = next((f for r, f in RUNS if "Run 8" in r), None)
-    if run8_folder:
-        elasticity_dir = BASE_DIR / run8_folder / "relatorios_finais"
+    elast_folder = elasticity_folder()
+    if elast_folder:
+        elasticity_dir = BASE_DIR / elast_folder / "relatorios_finais"
         if elasticity_dir.exists():
             elast_by_scope = {}
             for img_path in elasticity_dir.glob("elasticidade_*.png"):
@@ -376,7 +480,7 @@ def generate_html_report(output_file):
                     if found_scope not in elast_by_scope: elast_by_scope[found_scope] = []
                     feature_raw = fname.replace(f"elasticidade_{safe_s}_", "").replace(".png", "")
                     feature_pretty = get_pretty_name(feature_raw)
-                    rel_path = f"{run8_folder}/relatorios_finais/{fname}"
+                    rel_path = f"{elast_folder}/relatorios_finais/{fname}"
                     elast_by_scope[found_scope].append((feature_pretty, rel_path))
             
             sorted_scopes = sorted(elast_by_scope.keys())
@@ -384,91 +488,127 @@ def generate_html_report(output_file):
                 sorted_scopes.remove("BRASIL")
                 sorted_scopes.insert(0, "BRASIL")
             
-            html.append("<div class='tab'>")
+            yield "<div class='tab'>"
             for i, scope in enumerate(sorted_scopes, 1):
                 safe_id = f"ElastScope{i}"
-                html.append(f"<button class='tablinks-elast' onclick=\"openTab(event, '{safe_id}', 'content-elast', 'tablinks-elast')\">{scope}</button>")
-            html.append("</div>")
+                yield f"<button class='tablinks-elast' onclick=\"openTab(event, '{safe_id}', 'content-elast', 'tablinks-elast')\">{scope}</button>"
+            yield "</div>"
             
             for i, scope in enumerate(sorted_scopes, 1):
                 safe_id = f"ElastScope{i}"
                 imgs = elast_by_scope[scope]
-                html.append(f"<div id='{safe_id}' class='content-elast tabcontent'>")
-                html.append(f"<h4>{scope}</h4>")
-                html.append("<div style='display:flex; flex-wrap:wrap; justify-content:center;'>")
+                yield f"<div id='{safe_id}' class='content-elast tabcontent'>"
+                yield f"<h4>{scope}</h4>"
+                yield "<div style='display:flex; flex-wrap:wrap; justify-content:center;'>"
                 for feat, src in imgs:
-                    html.append(f"<div class='calibration-plot' style='width:45%; margin:5px;'><img src='{src}' style='width:100%'><br><small>{feat}</small></div>")
-                html.append("</div>")
-                html.append("</div>")
+                    yield f"<div class='calibration-plot' style='width:45%; margin:5px;'>{img_tag(src)}<br><small>{feat}</small></div>"
+                yield "</div>"
+                yield "</div>"
             
-            html.append("<p><strong>Análise (Run 8):</strong> Na Run 8 (0.60, NoInt), observamos que as curvas de elasticidade confirmam a consistência física e socioeconômica do modelo. Variáveis de infraestrutura (como saneamento e pavimentação) exibem forte decaimento do risco conforme a qualidade aumenta, enquanto indicadores de precariedade (déficit de arborização, densidade sanitária) mostram crescimento monotônico do risco.</p>")
-            html.append("<div class='source'>Fonte: Elaboração própria.</div>")
+            yield f"<p><strong>Análise ({run_label(ELASTICITY_RUN_FOLDER, short=True)}):</strong> Na {run_label(ELASTICITY_RUN_FOLDER)}, observamos que as curvas de elasticidade confirmam a consistência física e socioeconômica do modelo. Variáveis de infraestrutura (como saneamento e pavimentação) exibem forte decaimento do risco conforme a qualidade aumenta, enquanto indicadores de precariedade (déficit de arborização, densidade sanitária) mostram crescimento monotônico do risco.</p>"
+            yield "<div class='source'>Fonte: Elaboração própria.</div>"
         else:
-            html.append("<p>Imagens de elasticidade não encontradas.</p>")
+            yield "<p>Imagens de elasticidade não encontradas.</p>"
 
+def render_advanced():
+    import pandas as pd
+    import calibration
+    import metrics_store
     # 4. Análises Avançadas
-    html.append("<h2>4. Análises Avançadas e Robustez</h2>")
+    yield "<h2>4. Análises Avançadas e Robustez</h2>"
     adv_metrics_path = BASE_DIR / "comparativo_avancado" / "advanced_metrics.csv"
     if adv_metrics_path.exists():
-        df_adv = pd.read_csv(adv_metrics_path)
-        html.append("<h3>4.1 Métricas de Eventos Raros (AUPRC e Recall@k)</h3>")
-        cols = ['Run', 'AUPRC (Global)', 'Recall@1% (Global)', 'Precision@1% (Global)', 'Recall@5% (Global)', 'AUPRC (Média Local)']
-        cols = [c for c in cols if c in df_adv.columns]
-        html.append("<table><caption>Tabela 4.1. Performance em Eventos Raros</caption>")
-        html.append("<tr>" + "".join([f"<th>{c}</th>" for c in cols]) + "</tr>")
+        # Linhas de advanced_metrics.csv, lidas do store de métricas
+        metrics = report_metrics()
+        # Colunas do cabeçalho do CSV: os k de Recall@k / Precision@k seguem K_PERCENTS
+        columns = metrics_store.advanced_columns(pd.read_csv(adv_metrics_path, nrows=0).columns)
+        df_adv = pd.DataFrame([
+            {"Run": run_name, **{col: metrics.get((folder_name,) + key, float("nan")) for col, key in columns.items()}}
+            for run_name, folder_name in RUNS
+            if any((folder_name,) + key in metrics for key in columns.values())
+        ], columns=["Run"] + list(columns))
+        yield "<h3>4.1 Métricas de Eventos Raros (AUPRC e Recall@k)</h3>"
+        # Recall@k e Precision@k lado a lado, k crescente
+        k_columns = sorted((c for c in columns if c not in metrics_store.ADVANCED_COLUMNS),
+                           key=lambda c: (float(metrics_store.ADVANCED_K_PATTERN.match(c).group(2)), c.startswith("Precision")))
+        cols = ['Run', 'AUPRC (Global)'] + k_columns + ['AUPRC (Média Local)']
+        cols = [c for c in cols if c == 'Run' or (c in df_adv.columns and df_adv[c].notna().any())]
+        yield "<table><caption>Tabela 4.1. Performance em Eventos Raros</caption>"
+        yield "<tr>" + "".join([f"<th>{c}</th>" for c in cols]) + "</tr>"
+        # Linhas do modo streaming (histogramas) são aproximadas: marcadas com ≈
+        bounds = {run_name: metrics[(folder_name,) + metrics_store.ADVANCED_BOUND_METRIC] for run_name, folder_name in RUNS
+                  if (folder_name,) + metrics_store.ADVANCED_BOUND_METRIC in metrics}
         for _, row in df_adv.iterrows():
-            html.append("<tr>")
+            approx = "≈" if row["Run"] in bounds else ""
+            yield "<tr>"
             for c in cols:
                 val = row[c]
-                if isinstance(val, (int, float)): html.append(f"<td>{val:.4f}</td>")
-                else: html.append(f"<td style='text-align:left'>{val}</td>")
-            html.append("</tr>")
-        html.append("</table>")
-        html.append("<div class='source'>Fonte: Elaboração própria.</div>")
-
-        html.append("<h3>4.2 Curvas de Calibração</h3>")
-        all_calib_imgs = sorted(glob.glob(str(BASE_DIR / "comparativo_avancado" / "calib_*.png")))
+                if isinstance(val, (int, float)): yield f"<td>{approx}{val:.4f}</td>"
+                else: yield f"<td style='text-align:left'>{val}</td>"
+            yield "</tr>"
+        yield "</table>"
+        if bounds:
+            yield (f"<div class='source'>Fonte: Elaboração própria. ≈: valores aproximados do modo streaming (histogramas de score), "
+                   f"com erro absoluto de no máximo {max(bounds.values()):.4f}.</div>")
+        else:
+            yield "<div class='source'>Fonte: Elaboração própria.</div>"
+
+        yield "<h3>4.2 Curvas de Calibração</h3>"
+        calib_bins_path = BASE_DIR / "comparativo_avancado" / "calibration_bins.csv"
         calib_by_run = {}
-        for img_path in all_calib_imgs:
-            rel_path = Path(img_path).name
-            run_id = ""
-            scope_name = ""
-            if "95" in rel_path: run_id = "Run 1 (0.95, Std)"; scope_name = rel_path.split("95_")[1]
-            elif "60" in rel_path and "std" in rel_path: run_id = "Run 4 (0.60, Std)"; scope_name = rel_path.split("60_")[1]
-            elif "80" in rel_path: run_id = "Run 6 (0.80, NoInt)"; scope_name = rel_path.split("80_")[1]
-            elif "70" in rel_path: run_id = "Run 7 (0.70, NoInt)"; scope_name = rel_path.split("70_")[1]
-            elif "60" in rel_path and "noint" in rel_path: run_id = "Run 8 (0.60, NoInt)"; scope_name = rel_path.split("60_")[1]
-            elif "60" in rel_path: run_id = "Run 8 (0.60, NoInt)"; scope_name = rel_path.split("60_")[1] 
-            else: continue 
-            scope_name = scope_name.replace(".png", "").replace("_", " ")
-            if run_id not in calib_by_run: calib_by_run[run_id] = []
-            calib_by_run[run_id].append((scope_name, f"comparativo_avancado/{rel_path}"))
-
-        html.append("<div class='tab'>")
+        if calib_bins_path.exists():
+            # Faixas calculadas por advanced_evaluation.py, desenhadas como SVG inline
+            # Agrupadas pela pasta e rotuladas com o rótulo atual do run
+            labels = {folder_name: run_name for run_name, folder_name in RUNS}
+            df_calib = pd.read_csv(calib_bins_path)
+            df_calib = df_calib[df_calib["Folder"].isin(labels)]
+            for (folder_name, scope), curve in df_calib.groupby(["Folder", "Scope"], sort=False):
+                run_id = labels[folder_name]
+                svg = calibration.calibration_svg(curve["Prob Pred"].to_numpy(), curve["Prob True"].to_numpy())
+                if "Mode" in curve.columns and (curve["Mode"] == "streaming").any():
+                    scope = f"{scope} (aprox., streaming)"
+                calib_by_run.setdefault(run_id, []).append((scope, svg))
+        if not calib_by_run:
+            # Sem a tabela: figuras em PNG, atribuídas ao run pelo nome do arquivo
+            runs_by_folder = {run["folder"]: run for run in REGISTRY}
+            for img_path in sorted((BASE_DIR / "comparativo_avancado").glob("calibration_*.png")):
+                run = runs_by_folder.get(img_path.stem[len("calibration_"):])
+                if run:
+                    calib_by_run.setdefault(run["label"], []).append(("Todos os escopos", img_tag(f"comparativo_avancado/{img_path.name}")))
+            for img_path in sorted((BASE_DIR / "comparativo_avancado").glob("calib_*.png")):
+                run, scope_name = run_registry.match_calibration_image(REGISTRY, img_path.name)
+                if run is None:
+                    print(f"Aviso: figura de calibração sem run correspondente: {img_path.name}")
+                    continue
+                calib_by_run.setdefault(run["label"], []).append((scope_name, img_tag(f"comparativo_avancado/{img_path.name}")))
+
+        yield "<div class='tab'>"
         for i, run_id in enumerate(calib_by_run.keys(), 1):
             safe_id = f"CalibRun{i}"
             label = run_id.split('(')[0].strip()
-            html.append(f"<button class='tablinks-calib' onclick=\"openTab(event, '{safe_id}', 'content-calib', 'tablinks-calib')\">{label}</button>")
-        html.append("</div>")
+            yield f"<button class='tablinks-calib' onclick=\"openTab(event, '{safe_id}', 'content-calib', 'tablinks-calib')\">{label}</button>"
+        yield "</div>"
         for i, (run_id, imgs) in enumerate(calib_by_run.items(), 1):
             safe_id = f"CalibRun{i}"
-            html.append(f"<div id='{safe_id}' class='content-calib tabcontent'>")
-            html.append(f"<h4>{run_id}</h4>")
-            html.append("<div style='text-align:center'>")
-            for scope, img_src in imgs:
-                html.append(f"<div class='calibration-plot'><img src='{img_src}' style='width:100%'><br><small>{scope}</small></div>")
-            html.append("</div>")
-            html.append("</div>")
-        html.append("<div class='source'>Fonte: Elaboração própria.</div>")
+            yield f"<div id='{safe_id}' class='content-calib tabcontent'>"
+            yield f"<h4>{run_id}</h4>"
+            yield "<div style='text-align:center'>"
+            for scope, figure in imgs:
+                yield f"<div class='calibration-plot'>{figure}<br><small>{scope}</small></div>"
+            yield "</div>"
+            yield "</div>"
+        yield "<div class='source'>Fonte: Elaboração própria.</div>"
 
+def render_driver_stability():
+    import pandas as pd
     # 4.3 Estabilidade Drivers
     driver_stab_path = BASE_DIR / "comparativo_avancado" / "driver_stability.csv"
     if driver_stab_path.exists():
         df_stab = pd.read_csv(driver_stab_path)
-        html.append("<h3>4.3 Estabilidade dos Drivers (Consistência Global)</h3>")
-        html.append("<p>A partir das matrizes de importância EBM por run e por escopo, foi calculada a frequência com que cada variável apresentou Score > 0,2. Esse critério de corte permite identificar os drivers realmente robustos, que emergem de forma recorrente sob diferentes thresholds de correlação e presença/ausência de interações.</p>")
-        html.append("<table><caption>Tabela 4.3. Drivers Mais Robustos</caption>")
-        html.append("<tr><th>Rank</th><th>Variável</th><th>Frequência</th><th>Interpretação</th></tr>")
+        yield "<h3>4.3 Estabilidade dos Drivers (Consistência Global)</h3>"
+        yield "<p>A partir das matrizes de importância EBM por run e por escopo, foi calculada a frequência com que cada variável apresentou Score > 0,2. Esse critério de corte permite identificar os drivers realmente robustos, que emergem de forma recorrente sob diferentes thresholds de correlação e presença/ausência de interações.</p>"
+        yield "<table><caption>Tabela 4.3. Drivers Mais Robustos</caption>"
+        yield "<tr><th>Rank</th><th>Variável</th><th>Frequência</th><th>Interpretação</th></tr>"
         interpretations = {
             "fisico_pct_app_30m": "Restrição ambiental (APP)",
             "fisico_declividade_media": "Topografia acidentada",
@@ -486,38 +626,653 @@ def generate_html_report(output_file):
             if interp == "-":
                 for k, v in interpretations.items():
                     if k in driver: interp = v; break
-            html.append(f"<tr><td>{i+1}º</td><td style='text-align:left'>{pretty_driver}</td><td>{row['Frequency']}</td><td style='text-align:left'>{interp}</td></tr>")
-        html.append("</table>")
-        html.append("<div class='source'>Fonte: Elaboração própria.</div>")
+            yield f"<tr><td>{i+1}º</td><td style='text-align:left'>{pretty_driver}</td><td>{row['Frequency']}</td><td style='text-align:left'>{interp}</td></tr>"
+        yield "</table>"
+        yield "<div class='source'>Fonte: Elaboração própria.</div>"
+        
+        # Concordância dos rankings de drivers entre runs, no mesmo escopo
+        agreement_path = BASE_DIR / "comparativo_avancado" / "driver_rank_agreement.csv"
+        if agreement_path.exists():
+            df_agree = pd.read_csv(agreement_path)
+            same_scope = df_agree[(df_agree["Scope A"] == df_agree["Scope B"]) & (df_agree["Run A"] != df_agree["Run B"])]
+            jaccard_col = next((c for c in df_agree.columns if c.startswith("Jaccard@")), None)
+            if not same_scope.empty and jaccard_col:
+                k = jaccard_col.split("@")[1]
+                yield (f"<p>Entre runs, no mesmo escopo, a concordância média dos rankings de importância foi de {same_scope['Spearman'].mean():.2f} (Spearman) "
+                       f"e {same_scope['Kendall'].mean():.2f} (Kendall tau-b), e os {k} principais drivers coincidiram em média {same_scope[jaccard_col].mean():.0%} (Jaccard), "
+                       f"em {len(same_scope)} pares de runs.</p>")
+
+def render_bootstrap():
+    import pandas as pd
+    # 4.4 Incerteza (Bootstrap)
+    boot_ci_path = BASE_DIR / "comparativo_avancado" / "bootstrap_ci.csv"
+    if boot_ci_path.exists():
+        df_ci = pd.read_csv(boot_ci_path)
+        metrics = list(dict.fromkeys(df_ci["Metric"]))
+        n_resamples = int(df_ci["Resamples"].iloc[0])
+        method = "em blocos espaciais (células do grid de split)" if df_ci["Method"].iloc[0] == "block" else "por setor censitário"
+        yield "<h3>4.4 Incerteza das Métricas (Bootstrap)</h3>"
+        yield f"<p>Intervalos de confiança de 95% obtidos por {n_resamples} reamostragens {method} do conjunto de teste ({df_ci['Scope'].iloc[0]}). As mesmas reamostragens são aplicadas a todos os runs, de modo que as diferenças entre runs são pareadas.</p>"
+        yield "<table><caption>Tabela 4.4.1. Métricas com Intervalo de Confiança (95%)</caption>"
+        yield "<tr><th>Run</th>" + "".join([f"<th>{m}</th>" for m in metrics]) + "</tr>"
+        for run_name, df_run in df_ci.groupby("Run", sort=False):
+            yield f"<tr><td style='text-align:left'>{run_name}</td>"
+            for m in metrics:
+                row = df_run[df_run["Metric"] == m].iloc[0]
+                yield f"<td>{row['Estimate']:.4f}<br><small>[{row['CI Low']:.4f}; {row['CI High']:.4f}]</small></td>"
+            yield "</tr>"
+        yield "</table>"
+        yield "<div class='source'>Fonte: Elaboração própria.</div>"
 
+        boot_delta_path = BASE_DIR / "comparativo_avancado" / "bootstrap_deltas.csv"
+        if boot_delta_path.exists():
+            df_delta = pd.read_csv(boot_delta_path)
+            yield "<table><caption>Tabela 4.4.2. Diferenças Pareadas entre Runs (Run A - Run B)</caption>"
+            yield "<tr><th>Run A</th><th>Run B</th><th>Métrica</th><th>Delta</th><th>IC 95%</th><th>P(Delta &gt; 0)</th></tr>"
+            for _, row in df_delta.iterrows():
+                significant = row["CI Low"] > 0 or row["CI High"] < 0
+                delta = f"<b>{row['Delta']:+.4f}</b>" if significant else f"{row['Delta']:+.4f}"
+                yield f"<tr><td style='text-align:left'>{row['Run A']}</td><td style='text-align:left'>{row['Run B']}</td><td>{row['Metric']}</td><td>{delta}</td><td>[{row['CI Low']:+.4f}; {row['CI High']:+.4f}]</td><td>{row['P(Delta > 0)']:.3f}</td></tr>"
+            yield "</table>"
+            yield "<div class='source'>Fonte: Elaboração própria. Em negrito, diferenças cujo IC 95% não contém zero.</div>"
+
+def render_spatial():
+    import pandas as pd
+    import spatial_analysis
+    # 4.5 Diagnóstico espacial dos resíduos
+    moran_path = BASE_DIR / "comparativo_avancado" / "spatial_moran.csv"
+    if not moran_path.exists():
+        return
+    df_moran = pd.read_csv(moran_path)
+    df_moran = df_moran[df_moran["Scope"] == "BRASIL"]
+    if df_moran.empty:
+        return
+    yield "<h3>4.5 Diagnóstico Espacial dos Resíduos</h3>"
+    yield ("<p>Os resíduos (FCU observado menos probabilidade predita) dos setores de teste foram testados quanto à autocorrelação espacial, com uma matriz de k vizinhos mais próximos sobre os centróides. "
+           "Um Moran I positivo e significativo indica que o modelo erra de forma agrupada no espaço; os clusters locais (LISA) HH e LL apontam regiões de risco sistematicamente subestimado ou superestimado.</p>")
+    yield "<table><caption>Tabela 4.5. Autocorrelação Espacial dos Resíduos (BRASIL)</caption>"
+    yield "<tr><th>Run</th><th>Setores</th><th>Moran I</th><th>z (perm.)</th><th>p (perm.)</th><th>Clusters HH</th><th>Clusters LL</th></tr>"
+    for _, row in df_moran.iterrows():
+        yield (f"<tr><td style='text-align:left'>{row['Run']}</td><td>{int(row['N'])}</td><td>{row['Moran I']:.4f}</td>"
+               f"<td>{row['Z (perm)']:.2f}</td><td>{row['P (perm)']:.3f}</td><td>{int(row['HH'])}</td><td>{int(row['LL'])}</td></tr>")
+    yield "</table>"
+    yield f"<div class='source'>Fonte: Elaboração própria. k = {int(df_moran['K'].iloc[0])} vizinhos; {int(df_moran['Permutations'].iloc[0])} permutações.</div>"
+
+    cells_path = BASE_DIR / "comparativo_avancado" / "spatial_cells.csv"
+    if cells_path.exists():
+        df_cells = pd.read_csv(cells_path)
+        df_cells = df_cells[df_cells["Scope"] == "BRASIL"]
+        # Mapa do run recomendado (seção 3.1), ou do primeiro run com células
+        recommended = next((run_name for run_name, folder in RUNS if folder == elasticity_folder()), None)
+        run_name = recommended if recommended in set(df_cells["Run"]) else next(iter(df_cells["Run"]), None)
+        if run_name is not None:
+            cells = df_cells[df_cells["Run"] == run_name]
+            yield f"<h4>Resíduo médio e desempenho por célula do grid espacial - {run_name}</h4>"
+            yield "<div style='display:flex; gap:20px; align-items:flex-start; flex-wrap:wrap'>"
+            yield ("<div style='flex:1; min-width:300px; max-width:420px'>" + spatial_analysis.residual_map_svg(
+                cells["X"], cells["Y"], cells["Mean Residual"], cells["N"]) + "</div>")
+            worst = cells.dropna(subset=["AUC"]).sort_values("AUC").head(10)
+            if not worst.empty:
+                yield "<div style='flex:1; min-width:300px'><table><caption>Tabela 4.6. Células com Menor AUC (BRASIL)</caption>"
+                yield "<tr><th>Célula</th><th>Setores</th><th>Positivos</th><th>AUC</th><th>AUPRC</th><th>Resíduo Médio</th></tr>"
+                for _, row in worst.iterrows():
+                    yield (f"<tr><td>{row['Cell']}</td><td>{int(row['N'])}</td><td>{int(row['Positives'])}</td><td>{row['AUC']:.3f}</td>"
+                           f"<td>{row['AUPRC']:.3f}</td><td>{row['Mean Residual']:+.4f}</td></tr>")
+                yield "</table></div>"
+            yield "</div>"
+            yield "<div class='source'>Fonte: Elaboração própria. Círculos no centróide médio de cada célula de criar_grid_espacial, com área proporcional ao número de setores de teste.</div>"
+
+# Mapa da seção 4.6: carrega hotspot_tiles/index.json e, a cada movimento,
+# os tiles GeoJSON visíveis no zoom mais próximo da pirâmide (hotspots.py)
+HOTSPOT_MAP_SCRIPT = """
+<script>
+(function() {
+    var el = document.getElementById('hotspot-map'), select = document.getElementById('hotspot-layer');
+    var base = el.getAttribute('data-tiles'), index, map, layer, store = {}, requested = {};
+    function unavailable(reason) {
+        el.style.height = 'auto';
+        el.innerHTML = "<p style='padding:10px'>Mapa indisponível: " + reason + " A Tabela 4.7, abaixo, lista os setores da camada padrão.</p>";
+    }
+    if (typeof L === 'undefined') {
+        unavailable('o Leaflet não carregou (sem rede e sem a cópia local em comparativo_avancado/leaflet/, que o hotspots.py baixa).');
+        return;
+    }
+    function tileX(lon, z) { return Math.min(Math.pow(2, z) - 1, Math.max(0, Math.floor((lon + 180) / 360 * Math.pow(2, z)))); }
+    function tileY(lat, z) {
+        var r = Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI / 180;
+        return Math.min(Math.pow(2, z) - 1, Math.max(0, Math.floor((1 - Math.log(Math.tan(r) + 1 / Math.cos(r)) / Math.PI) / 2 * Math.pow(2, z))));
+    }
+    function tileZoom() { return Math.max(index.min_zoom, Math.min(index.max_zoom, Math.round(map.getZoom()))); }
+    function draw() {
+        var z = tileZoom(), sel = select.value, features = store[z] || {};
+        layer.clearLayers();
+        for (var id in features) { if (features[id].properties.r[sel] !== undefined) layer.addData(features[id]); }
+    }
+    function fetchTile(z, key) {
+        return fetch(base + '/' + key + '.json').then(function(r) { return r.ok ? r.json() : null; }).then(function(tile) {
+            if (!tile) return;
+            store[z] = store[z] || {};
+            tile.features.forEach(function(f) { store[z][f.id] = f; });
+        }).catch(function() {});
+    }
+    function load() {
+        var z = tileZoom(), view = map.getBounds(), b = index.bounds;
+        var west = Math.max(view.getWest(), b[0]), east = Math.min(view.getEast(), b[2]);
+        var south = Math.max(view.getSouth(), b[1]), north = Math.min(view.getNorth(), b[3]);
+        if (west > east || south > north) { draw(); return; }
+        var pending = [];
+        for (var x = tileX(west, z); x <= tileX(east, z); x++) {
+            for (var y = tileY(north, z); y <= tileY(south, z); y++) {
+                var key = z + '/' + x + '/' + y;
+                if (requested[key]) continue;
+                requested[key] = true;
+                pending.push(fetchTile(z, key));
+            }
+        }
+        Promise.all(pending).then(draw);
+    }
+    fetch(base + '/index.json').then(function(r) { return r.json(); }).then(function(data) {
+        index = data;
+        map = L.map(el);
+        L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {maxZoom: 18, attribution: '&copy; OpenStreetMap'}).once('tileerror', function() {
+            document.getElementById('hotspot-map-note').textContent = 'Mapa base (OpenStreetMap) indisponível sem rede; os setores continuam no mapa, sem o fundo.';
+        }).addTo(map);
+        layer = L.geoJSON(null, {
+            style: function() { return {color: '#b2182b', weight: 1, fillColor: '#ef3b2c', fillOpacity: 0.6}; },
+            pointToLayer: function(f, latlng) { return L.circleMarker(latlng, {radius: 4}); },
+            onEachFeature: function(f, l) {
+                var sel = select.value;
+                l.bindPopup('Setor ' + f.id + '<br>Posição: ' + f.properties.r[sel] + 'º<br>Probabilidade: ' + f.properties.p[sel]);
+            }
+        }).addTo(map);
+        map.fitBounds([[index.bounds[1], index.bounds[0]], [index.bounds[3], index.bounds[2]]]);
+        map.on('moveend', load);
+        select.onchange = draw;
+        load();
+    }).catch(function() {
+        unavailable(location.protocol === 'file:'
+            ? 'os tiles são carregados por HTTP (abra o relatório por um servidor, como python -m http.server, não como arquivo local).'
+            : 'não foi possível ler ' + base + '/index.json.');
+    });
+})();
+</script>
+"""
+
+def leaflet_tags():
+    """
+    Tags do Leaflet para o mapa da seção 4.6: a cópia local gravada por
+    hotspots.py, se conferir com o hash SRI, ou o CDN com integrity e
+    crossorigin.
+    """
+    import hotspots
+    if hotspots.leaflet_vendored(BASE_DIR / "comparativo_avancado" / hotspots.LEAFLET_DIR):
+        base = f"comparativo_avancado/{hotspots.LEAFLET_DIR}/"
+        return [f"<link rel='stylesheet' href='{base}leaflet.css'>", f"<script src='{base}leaflet.js'></script>"]
+    sri = hotspots.LEAFLET_FILES
+    return [f"<link rel='stylesheet' href='{hotspots.LEAFLET_URL}leaflet.css' integrity='{sri['leaflet.css']}' crossorigin=''>",
+            f"<script src='{hotspots.LEAFLET_URL}leaflet.js' integrity='{sri['leaflet.js']}' crossorigin=''></script>"]
+
+def render_hotspots():
+    import pandas as pd
+    # 4.6 Setores prioritários (top-k% de probabilidade, hotspots.py)
+    index_path = BASE_DIR / "comparativo_avancado" / "hotspot_tiles" / "index.json"
+    hotspots_path = BASE_DIR / "comparativo_avancado" / "hotspots.parquet"
+    if not index_path.exists() or not hotspots_path.exists():
+        return
+    index = json.loads(index_path.read_text(encoding="utf-8"))
+    layers = index.get("layers", [])
+    if not layers or index.get("bounds") is None:
+        return
+    df_hot = pd.read_parquet(hotspots_path, columns=["Run", "Scope", "Rank", "ID", "Prob"])
+    recommended = next((run_name for run_name, folder in RUNS if folder == elasticity_folder()), None)
+    default = next((i for i, layer in enumerate(layers) if layer["run"] == recommended and layer["scope"] == "BRASIL"),
+                   next((i for i, layer in enumerate(layers) if layer["scope"] == "BRASIL"), 0))
+
+    yield "<h3>4.6 Setores Prioritários (Top-k de Probabilidade)</h3>"
+    yield ("<p>O Recall@1% e a Precision@1% da Tabela 4.1 resumem os setores de teste no topo da lista ordenada; o mapa abaixo mostra quais são esses setores, para cada run e escopo (só o conjunto de teste, como nas métricas). "
+           "Os polígonos aparecem a partir de um zoom de bairro; em escalas menores, cada setor é um ponto no seu centróide.</p>")
+    yield from leaflet_tags()
+    options = "".join(f"<option value='{i}'{' selected' if i == default else ''}>{layer['run']} - {layer['scope']} (top {layer['k']})</option>"
+                      for i, layer in enumerate(layers))
+    yield f"<p>Camada: <select id='hotspot-layer'>{options}</select></p>"
+    yield "<div id='hotspot-map' data-tiles='comparativo_avancado/hotspot_tiles' style='height:420px; border:1px solid #ccc'></div>"
+    yield "<noscript><p>O mapa requer JavaScript; a Tabela 4.7, abaixo, lista os setores da camada padrão.</p></noscript>"
+    yield "<p id='hotspot-map-note' class='source'></p>"
+    yield HOTSPOT_MAP_SCRIPT
+    yield f"<div class='source'>Fonte: Elaboração própria. {index['sectors']} setores distintos em {len(layers)} camadas (run, escopo); mapa base &copy; OpenStreetMap.</div>"
+
+    layer = layers[default]
+    top = df_hot[(df_hot["Run"] == layer["run"]) & (df_hot["Scope"] == layer["scope"])].sort_values("Rank").head(10)
+    in_scope = df_hot[df_hot["Scope"] == layer["scope"]]
+    n_runs = in_scope["Run"].nunique()
+    runs_per_sector = in_scope.groupby("ID")["Run"].nunique()
+    if not top.empty:
+        yield f"<table><caption>Tabela 4.7. Dez Setores de Maior Probabilidade - {layer['run']} ({layer['scope']})</caption>"
+        yield f"<tr><th>Posição</th><th>Setor</th><th>Probabilidade</th><th>Runs com o Setor no Top-k (de {n_runs})</th></tr>"
+        for _, row in top.iterrows():
+            yield f"<tr><td>{int(row['Rank'])}º</td><td>{row['ID']}</td><td>{row['Prob']:.4f}</td><td>{runs_per_sector[row['ID']]}</td></tr>"
+        yield "</table>"
+        yield "<div class='source'>Fonte: Elaboração própria a partir dos arquivos output_final_master (hotspots.parquet).</div>"
+
+def render_ablation():
     # 5. Ablação
-    html.append("<h2>5. Análise de Ablação (Impacto das Interações)</h2>")
-    html.append(calculate_ablation_impact())
+    yield "<h2>5. Análise de Ablação (Impacto das Interações)</h2>"
+    yield calculate_ablation_impact()
+    yield from render_prediction_diff()
+
+def render_prediction_diff():
+    """Tabelas 5.1 e 5.2: diferenças de predição setor a setor (prediction_diff.py), escopo BRASIL."""
+    import pandas as pd
+    summary_path = BASE_DIR / "comparativo_avancado" / "prediction_diff_summary.csv"
+    if not summary_path.exists():
+        return
+    df_diff = pd.read_csv(summary_path)
+    df_diff = df_diff[df_diff["Scope"] == "BRASIL"]
+    overlap_col = next((c for c in df_diff.columns if c.endswith("Overlap")), None)
+    if df_diff.empty or overlap_col is None:
+        return
+    top_label = overlap_col.replace(" Overlap", "").replace("Top-", "Top ")
+    yield "<p>Além do AUC agregado, as predições dos dois modelos de cada par foram comparadas setor a setor (mesmos IDs), no escopo BRASIL.</p>"
+    yield "<table><caption>Tabela 5.1. Diferenças de Predição por Setor (Com vs. Sem Interações)</caption>"
+    yield f"<tr><th>Com Interações</th><th>Sem Interações</th><th>Setores</th><th>|Δp| Médio</th><th>|Δp| P95</th><th>Deslocamento Médio no Ranking</th><th>{top_label} Compartilhado</th></tr>"
+    for _, row in df_diff.iterrows():
+        yield (f"<tr><td style='text-align:left'>{row['Run A']}</td><td style='text-align:left'>{row['Run B']}</td><td>{int(row['N'])}</td>"
+               f"<td>{row['Mean Abs Delta']:.4f}</td><td>{row['P95 Abs Delta']:.4f}</td>"
+               f"<td>{row['Mean Abs Rank Shift (%)']:.1f}%</td><td>{row[overlap_col]:.0%}</td></tr>")
+    yield "</table>"
+    yield "<div class='source'>Fonte: Elaboração própria a partir dos arquivos output_final_master.</div>"
 
+    movers_path = BASE_DIR / "comparativo_avancado" / "prediction_diff_movers.csv"
+    if movers_path.exists():
+        df_movers = pd.read_csv(movers_path, dtype={"ID": str})
+        df_movers = df_movers[df_movers["Scope"] == "BRASIL"].groupby(["Run A", "Run B"], sort=False).head(5)
+        if not df_movers.empty:
+            yield "<table><caption>Tabela 5.2. Setores com Maior Mudança de Probabilidade (BRASIL)</caption>"
+            yield "<tr><th>Par</th><th>ID</th><th>p (Com)</th><th>p (Sem)</th><th>Δp</th><th>Posição (Com → Sem)</th></tr>"
+            for _, row in df_movers.iterrows():
+                pair = f"{row['Run A'].split('(')[0].strip()} × {row['Run B'].split('(')[0].strip()}"
+                yield (f"<tr><td style='text-align:left'>{pair}</td><td>{row['ID']}</td><td>{row['Prob A']:.4f}</td><td>{row['Prob B']:.4f}</td>"
+                       f"<td>{row['Delta']:+.4f}</td><td>{int(row['Rank A'])} → {int(row['Rank B'])}</td></tr>")
+            yield "</table>"
+            yield "<div class='source'>Fonte: Elaboração própria.</div>"
+
+def render_conclusion():
     # 6. Conclusão
-    html.append("<h2>6. Conclusão e Recomendação</h2>")
-    html.append("""
-    <p>Em termos de desempenho global, o modelo sem interações com limiar de correlação 0,80 (Run 6) apresenta a maior AUC. No entanto, o modelo com limiar 0,60 (Run 8) exibe Brier Score ligeiramente menor e comportamento de calibração mais estável. Na prática, ambos os modelos são equivalentes em desempenho, e a escolha entre eles deve considerar o equilíbrio desejado entre parcimônia e calibração.</p>
-    <p><strong>Recomendação:</strong> Neste relatório, adotamos a <strong>Run 8 (0.60, NoInt)</strong> como configuração padrão do Preditor FCU v3, por oferecer o melhor compromisso entre desempenho, calibração e estabilidade dos drivers de risco, além de ser um modelo mais parcimonioso (menos variáveis).</p>
-    """)
+    yield "<h2>6. Conclusão e Recomendação</h2>"
+    yield f"""
+    <p>Em termos de desempenho global, o modelo sem interações com limiar de correlação 0,80 ({run_label(BEST_AUC_RUN_FOLDER, short=True)}) apresenta a maior AUC. No entanto, o modelo com limiar 0,60 ({run_label(ELASTICITY_RUN_FOLDER, short=True)}) exibe Brier Score ligeiramente menor e comportamento de calibração mais estável. Na prática, ambos os modelos são equivalentes em desempenho, e a escolha entre eles deve considerar o equilíbrio desejado entre parcimônia e calibração.</p>
+    <p><strong>Recomendação:</strong> Neste relatório, adotamos a <strong>{run_label(ELASTICITY_RUN_FOLDER)}</strong> como configuração padrão do Preditor FCU v3, por oferecer o melhor compromisso entre desempenho, calibração e estabilidade dos drivers de risco, além de ser um modelo mais parcimonioso (menos variáveis).</p>
+    """
 
+def render_appendix():
     # Apêndice
-    html.append("<h2>Apêndice A. Glossário de Variáveis</h2>")
-    html.append("<table><caption>Tabela A.1. Dicionário de Dados</caption>")
-    html.append("<tr><th style='text-align:left'>Nome Técnico</th><th style='text-align:left'>Nome Descritivo</th></tr>")
+    yield "<h2>Apêndice A. Glossário de Variáveis</h2>"
+    yield "<table><caption>Tabela A.1. Dicionário de Dados</caption>"
+    yield "<tr><th style='text-align:left'>Nome Técnico</th><th style='text-align:left'>Nome Descritivo</th></tr>"
     for k, v in sorted(VAR_PRETTY_MAP.items()):
-        html.append(f"<tr><td style='text-align:left'>{k}</td><td style='text-align:left'>{v}</td></tr>")
-    html.append("</table>")
+        yield f"<tr><td style='text-align:left'>{k}</td><td style='text-align:left'>{v}</td></tr>"
+    yield "</table>"
+
+def render_footer():
+    yield "<div class='footer'>Relatório gerado automaticamente pelo sistema Preditor FCU v3.</div>"
+    yield "</body></html>"
+
+def _per_run(*parts):
+    return [BASE_DIR / folder / Path(*parts) for _, folder in RUNS]
+
+def _metrics_inputs():
+    return (_per_run("modelos", "metrics_BRASIL.json") + _per_run("treinamento", "log_treino_BRASIL.txt")
+            + _per_run("features_config", "selected_features_BRASIL.json"))
+
+def _advanced(*names):
+    return [BASE_DIR / "comparativo_avancado" / name for name in names]
 
-    html.append("<div class='footer'>Relatório gerado automaticamente pelo sistema Preditor FCU v3.</div>")
-    html.append("</body></html>")
+def _hotspot_inputs():
+    import hotspots
+    return _advanced("hotspots.parquet", Path("hotspot_tiles") / "index.json",
+                     *(Path(hotspots.LEAFLET_DIR) / name for name in hotspots.LEAFLET_FILES))
+
+def _elasticity_inputs():
+    elast_folder = elasticity_folder()
+    if not elast_folder:
+        return []
+    return sorted((BASE_DIR / elast_folder / "relatorios_finais").glob("elasticidade_*.png"))
+
+# Seções do relatório, na ordem: (nome, função que renderiza, arquivos de entrada).
+# Entradas None = sempre renderizada (cabeçalho com a data de geração);
+# lista vazia = texto fixo, que só muda com o código.
+SECTIONS = [
+    ("cabecalho", render_header, None),
+    ("resumo", render_summary, _metrics_inputs),
+    ("distribuicao", render_distribution,
+     lambda: _per_run("output_final", "relatorios_visuais", "table_distribution_comparative.csv")),
+    ("drivers", render_drivers,
+     lambda: [driver_reports.report_path(BASE_DIR / folder, scope) for _, folder in RUNS for scope in SCOPES]),
+    ("elasticidade", render_elasticity, _elasticity_inputs),
+    ("avancadas", render_advanced,
+     lambda: _advanced("advanced_metrics.csv", "calibration_bins.csv")
+     + sorted((BASE_DIR / "comparativo_avancado").glob("calib*.png"))),
+    ("estabilidade", render_driver_stability, lambda: _advanced("driver_stability.csv", "driver_rank_agreement.csv")),
+    ("bootstrap", render_bootstrap, lambda: _advanced("bootstrap_ci.csv", "bootstrap_deltas.csv")),
+    ("espacial", render_spatial, lambda: _advanced("spatial_moran.csv", "spatial_cells.csv")),
+    ("hotspots", render_hotspots, _hotspot_inputs),
+    ("ablacao", render_ablation, lambda: _metrics_inputs() + _advanced("prediction_diff_summary.csv", "prediction_diff_movers.csv")),
+    ("conclusao", render_conclusion, list),
+    ("apendice", render_appendix, list),
+    ("rodape", render_footer, list),
+]
+
+# Modo --split-sections: seções numeradas do relatório (1 a 6 e Apêndice A), cada
+# uma num fragmento HTML próprio; cabeçalho e rodapé ficam na página principal
+REPORT_PARTS = [
+    ("1", ["resumo"]),
+    ("2", ["distribuicao"]),
+    ("3", ["drivers", "elasticidade"]),
+    ("4", ["avancadas", "estabilidade", "bootstrap", "espacial", "hotspots"]),
+    ("5", ["ablacao"]),
+    ("6", ["conclusao"]),
+    ("A", ["apendice"]),
+]
+PART_HASH_LENGTH = 12
+
+# Carrega cada fragmento quando ele se aproxima da área visível. innerHTML não
+# executa <script>, então os scripts do fragmento são recriados em ordem (os
+# externos, como o Leaflet, antes dos que dependem deles) e as primeiras abas
+# de cada grupo são abertas, como no window.onload da página inteira.
+PART_LOADER_SCRIPT = """
+<script>
+(function() {
+    function runScripts(root) {
+        var scripts = Array.prototype.slice.call(root.querySelectorAll("script"));
+        return scripts.reduce(function(chain, old) {
+            return chain.then(function() {
+                var type = old.getAttribute("type");
+                if (type && type !== "text/javascript") return;
+                var script = document.createElement("script"), done = null;
+                if (old.src) {
+                    script.src = old.src;
+                    done = new Promise(function(resolve) { script.onload = script.onerror = resolve; });
+                } else {
+                    script.text = old.text;
+                }
+                old.parentNode.replaceChild(script, old);
+                return done;
+            });
+        }, Promise.resolve());
+    }
+    function activateTabs(root) {
+        ["tablinks-dist", "tablinks-drivers", "tablinks-calib", "tablinks-elast"].forEach(function(cls) {
+            var buttons = root.getElementsByClassName(cls);
+            if (buttons.length > 0) buttons[0].click();
+        });
+    }
+    function loadPart(part) {
+        fetch(part.getAttribute("data-src")).then(function(r) { return r.text(); }).then(function(html) {
+            part.innerHTML = html;
+            part.style.minHeight = "";
+            return runScripts(part);
+        }).then(function() { activateTabs(part); }).catch(function() {
+            part.innerHTML = "<p>Seção indisponível: os fragmentos são carregados por HTTP (abra o relatório por um servidor, não como arquivo local).</p>";
+        });
+    }
+    var parts = document.querySelectorAll("section.report-part");
+    if ("IntersectionObserver" in window) {
+        var observer = new IntersectionObserver(function(entries) {
+            entries.forEach(function(e) { if (e.isIntersecting) { observer.unobserve(e.target); loadPart(e.target); } });
+        }, {rootMargin: "800px 0px"});
+        for (var i = 0; i < parts.length; i++) observer.observe(parts[i]);
+    } else {
+        for (var j = 0; j < parts.length; j++) loadPart(parts[j]);
+    }
+})();
+</script>
+"""
+
+# Escrita do relatório: cada seção é um gerador de pedaços de HTML, gravados
+# no arquivo à medida que são produzidos (o documento nunca fica inteiro na
+# memória). O resultado é o mesmo de "\n".join das seções não vazias.
+def write_section(write, chunks, started):
+    """
+    Escreve com write os pedaços de uma seção, separados por quebra de linha.
+    Uma seção vazia não escreve nada; started indica se já há uma seção antes
+    (que pede o separador). Retorna o started atualizado.
+    """
+    chunks = iter(chunks)
+    head = list(itertools.islice(chunks, 2))
+    if not head or head == [""]:
+        return started
+    if started:
+        write("\n")
+    write("\n".join(head))
+    for chunk in chunks:
+        write("\n")
+        write(chunk)
+    return True
+
+def parts_dir(output_file):
+    return output_file.parent / f"{output_file.stem}_parts"
+
+def write_part(output_file, part, sections):
+    """
+    Grava as seções (iteradores de pedaços) do fragmento part em parts_dir,
+    calculando o hash enquanto escreve. O arquivo recebe o hash do conteúdo no
+    nome (part_<n>.<hash>.html; um fragmento que não mudou mantém o nome).
+    Retorna o nome gravado, ou None se todas as seções vierem vazias.
+    """
+    directory = parts_dir(output_file)
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f".part_{part}.tmp"
+    h = hashlib.sha256()
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        def write(text):
+            f.write(text)
+            h.update(text.encode("utf-8"))
+        started = False
+        for chunks in sections:
+            started = write_section(write, chunks, started)
+    if not started:
+        tmp_path.unlink()
+        return None
+    path = directory / f"part_{part}.{h.hexdigest()[:PART_HASH_LENGTH]}.html"
+    os.replace(tmp_path, path)
+    return path.name
+
+def remove_stale_parts(output_file, keep):
+    for stale in parts_dir(output_file).glob("part_*.html"):
+        if stale.name not in keep:
+            stale.unlink()
+
+# Build incremental: fragmentos HTML por seção, nomeados pelo hash das entradas
+FRAGMENT_DIR = BASE_DIR / "comparativo_avancado" / "cache_report"
+HASH_INDEX_FILE = FRAGMENT_DIR / "input_hashes.json"
+WATCH_INTERVAL = 0.5
+
+# Módulos cujo código entra no hash das seções (localizados sem importá-los): todo
+# módulo que uma função render_* ou de entradas importa, ou cujo formato de saída
+# ela lê (prediction_diff.py, para as Tabelas 5.1 e 5.2)
+CODE_MODULES = ("calibration", "driver_matrix", "driver_reports", "hotspots", "metrics_store", "prediction_diff",
+                "run_registry", "spatial_analysis")
+
+def code_version():
+    """Hash do código que renderiza as seções (este script e os módulos usados)."""
+    h = hashlib.sha256(repr((RUNS, SCOPES, LAZY_TABS)).encode("utf-8"))
+    for module_file in (__file__,) + tuple(importlib.util.find_spec(name).origin for name in CODE_MODULES):
+        h.update(Path(module_file).read_bytes())
+    return h.hexdigest()
+
+def file_digest(path, index):
+    """
+    SHA-256 do conteúdo de path ("missing" se não existir). O índice guarda o
+    hash por (tamanho, mtime); o arquivo só é relido quando um deles muda.
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return "missing"
+    key = str(path)
+    entry = index.get(key)
+    if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        return entry[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    index[key] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+    return index[key][2]
+
+def section_key(name, inputs, index, version):
+    h = hashlib.sha256(f"{name}\0{version}\n".encode("utf-8"))
+    for path in inputs:
+        rel = path.relative_to(BASE_DIR).as_posix()
+        h.update(f"{rel}\0{file_digest(path, index)}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def read_chunks(path):
+    """Pedaços de um fragmento do cache: as linhas, sem a quebra final de cada uma."""
+    with open(path, "r", encoding="utf-8", newline="\n") as f:
+        line = ""
+        for line in f:
+            yield line[:-1] if line.endswith("\n") else line
+        if line.endswith("\n"):
+            yield ""
+
+def cache_chunks(chunks, path):
+    """Repassa os pedaços de uma seção e os grava em path à medida que passam."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(chunks):
+            if i:
+                f.write("\n")
+            f.write(chunk)
+            yield chunk
+    os.replace(tmp_path, path)
+
+def render_section(name, render, inputs_fn, index, version, force=False):
+    """
+    Retorna (pedaços do fragmento, re-renderizado?). O fragmento do cache é
+    reaproveitado (a menos que force=True); senão render() é gravado no cache
+    enquanto o relatório é escrito.
+    """
+    key = section_key(name, inputs_fn(), index, version)
+    cached = FRAGMENT_DIR / f"{name}_{key}.html"
+    if cached.exists() and not force:
+        return read_chunks(cached), False
+    for stale in FRAGMENT_DIR.glob(f"{name}_*.html"):
+        stale.unlink()
+    return cache_chunks(render(), cached), True
+
+def generate_html_report(output_file, incremental=False, sections=None, lazy_tabs=False, split_sections=False):
+    """
+    Monta o relatório seção por seção. Com incremental=True, as seções cujas
+    entradas não mudaram vêm do cache de fragmentos em FRAGMENT_DIR. sections
+    (nomes de SECTIONS) implica incremental e força a re-renderização delas.
+    lazy_tabs=True gera as tabelas das abas das seções 2 e 3 sob demanda.
+    split_sections=True grava as seções numeradas em fragmentos separados
+    (write_part) e output_file vira só a página que os carrega.
+    """
+    global LAZY_TABS
+    LAZY_TABS = lazy_tabs
+    sections = set(sections or ())
+    incremental = incremental or bool(sections)
+    refresh_runs()
+    _METRICS.clear()
+    if incremental:
+        FRAGMENT_DIR.mkdir(parents=True, exist_ok=True)
+        index = json.loads(HASH_INDEX_FILE.read_text(encoding="utf-8")) if HASH_INDEX_FILE.exists() else {}
+        version = code_version()
+    
+    def section_chunks(name, render, inputs_fn):
+        if not incremental or inputs_fn is None:
+            return render()
+        chunks, fresh = render_section(name, render, inputs_fn, index, version, force=name in sections)
+        if fresh: rendered.append(name)
+        return chunks
     
-    with open(BASE_DIR / "comparativo_sensibilidade.html", "w", encoding="utf-8") as f:
-        f.write("\n".join(html))
-    print(f"HTML salvo em: {BASE_DIR / 'comparativo_sensibilidade.html'}")
+    # Uma passada pelas seções, na ordem, direto para o arquivo. Com
+    # split_sections, as seções de cada parte vão para o fragmento dela e a
+    # página recebe só a tag que o carrega.
+    part_of = {name: part for part, names in REPORT_PARTS for name in names} if split_sections else {}
+    rendered, parts = [], set()
+    tmp_path = output_file.with_name(f".{output_file.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        started = False
+        for part, group in itertools.groupby(SECTIONS, key=lambda section: part_of.get(section[0])):
+            if part is None:
+                for name, render, inputs_fn in group:
+                    if split_sections and name == "rodape":
+                        started = write_section(out.write, [PART_LOADER_SCRIPT], started)
+                    started = write_section(out.write, section_chunks(name, render, inputs_fn), started)
+                continue
+            part_name = write_part(output_file, part, (section_chunks(*section) for section in group))
+            if part_name:
+                parts.add(part_name)
+                placeholder = f"<section class='report-part' data-src='{parts_dir(output_file).name}/{part_name}' style='min-height:400px'></section>"
+                started = write_section(out.write, [placeholder], started)
+    os.replace(tmp_path, output_file)
+    
+    if incremental:
+        HASH_INDEX_FILE.write_text(json.dumps(index), encoding="utf-8")
+        print(f"Seções re-renderizadas: {', '.join(rendered) if rendered else 'nenhuma'}")
+    if split_sections:
+        remove_stale_parts(output_file, parts)
+        print(f"Fragmentos das seções salvos em: {parts_dir(output_file)}")
+    print(f"HTML salvo em: {output_file}")
+
+def watch_signature():
+    """Pastas de run e (caminho, mtime, tamanho) de todas as entradas de todas as seções."""
+    signature = [run_registry.listing_signature(BASE_DIR)]
+    for _, _, inputs_fn in SECTIONS:
+        for path in (inputs_fn() if inputs_fn else []):
+            try:
+                stat = path.stat()
+                signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append((str(path), None, None))
+    return signature
+
+def watch_report(output_file, interval=WATCH_INTERVAL, lazy_tabs=False, split_sections=False):
+    """Refaz o relatório (incremental) sempre que uma entrada muda, por polling."""
+    print(f"Observando os artefatos dos runs a cada {interval}s (Ctrl+C para sair)...")
+    last = watch_signature()
+    generate_html_report(output_file, incremental=True, lazy_tabs=lazy_tabs, split_sections=split_sections)
+    try:
+        while True:
+            time.sleep(interval)
+            current = watch_signature()
+            if current != last:
+                last = current
+                generate_html_report(output_file, incremental=True, lazy_tabs=lazy_tabs, split_sections=split_sections)
+    except KeyboardInterrupt:
+        print("Observação encerrada.")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Consolida os runs no relatório comparativo_sensibilidade.html.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-renderiza só as seções cujos arquivos de entrada mudaram (fragmentos em comparativo_avancado/cache_report).")
+    parser.add_argument("--watch", action="store_true",
+                        help="Observa os artefatos dos runs e refaz o relatório (incremental) quando algo muda.")
+    parser.add_argument("--lazy-tabs", action="store_true",
+                        help="Tabelas das abas (distribuição e matriz de drivers) como payload JSON, montadas quando a aba é aberta.")
+    parser.add_argument("--verify-lazy-tabs", action="store_true",
+                        help="Só confere se as tabelas de distribuição do --lazy-tabs têm o mesmo texto das do modo normal (não gera o relatório).")
+    parser.add_argument("--split-sections", action="store_true",
+                        help="Grava as seções 1 a 6 e o Apêndice A em fragmentos com hash no nome, carregados sob demanda pela página principal.")
+    parser.add_argument("--section", action="append", choices=[name for name, _, _ in SECTIONS], metavar="NOME",
+                        help="Re-renderiza só esta seção e reaproveita o cache das demais (pode repetir; implica --incremental). "
+                             f"Seções: {', '.join(name for name, _, _ in SECTIONS)}.")
+    return parser.parse_args(argv)
 
-def main():
-    generate_html_report(BASE_DIR / "comparativo_sensibilidade.html")
+def main(argv=None):
+    args = parse_args(argv)
+    output_file = BASE_DIR / "comparativo_sensibilidade.html"
+    if args.verify_lazy_tabs:
+        return 1 if verify_lazy_tabs() else 0
+    if args.watch:
+        watch_report(output_file, lazy_tabs=args.lazy_tabs, split_sections=args.split_sections)
+    else:
+        generate_html_report(output_file, incremental=args.incremental, sections=args.section,
+                             lazy_tabs=args.lazy_tabs, split_sections=args.split_sections)
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
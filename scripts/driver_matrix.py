@@ -0,0 +1,212 @@
+"""
+Matriz de drivers EBM (variável x escopo) de todos os runs como um cubo numpy.
+
+driver_cube pivota a tabela longa de driver_reports.py num array
+(run x variável x escopo), com 0.0 onde a variável não aparece no relatório,
+e uma máscara (run x variável) das variáveis presentes em cada run. A partir
+dele, a ordenação por |score| máximo, as cores do heatmap da seção 3 e as
+comparações entre runs (posição de cada driver, mudanças de posição) são
+operações sobre o array inteiro, sem laços por variável ou célula.
+
+A análise de estabilidade também sai do cubo, em operações matriciais sobre
+todos os pares (run, escopo) de uma vez: curvas de frequência numa grade de
+limiares de relevância, correlações de Spearman e Kendall (tau-b) entre os
+vetores de |score| de cada par e a sobreposição (Jaccard) dos top-k drivers.
+"""
+import numpy as np
+import pandas as pd
+
+# |score| que satura o heatmap
+HEATMAP_MAX = 1.5
+
+# Estabilidade: limiar da Tabela 4.3, grade de limiares das curvas e top-k do Jaccard
+STABILITY_THRESHOLD = 0.2
+THRESHOLD_GRID = np.round(np.arange(0.0, 1.5 + 1e-9, 0.05), 2)
+TOP_K = 10
+
+# Elementos por bloco de pares de variáveis no Kendall (limita a memória)
+KENDALL_BLOCK_ELEMENTS = 1 << 24
+
+def driver_cube(table, folders, scopes, rename=None):
+    """
+    Cubo dos drivers das pastas e escopos dados. rename (opcional) mapeia o
+    nome bruto da variável para o nome exibido; se dois nomes brutos viram o
+    mesmo, vale o último do relatório. Retorna um dict com values
+    (run x variável x escopo), present (run x variável), folders, features
+    (ordem de primeira aparição) e scopes.
+    """
+    folders, scopes = list(folders), list(scopes)
+    table = table[table["run"].isin(folders) & table["scope"].isin(scopes)]
+    if rename is not None:
+        table = table.assign(feature=table["feature"].map(rename))
+    table = table.drop_duplicates(["run", "scope", "feature"], keep="last")
+
+    features = pd.Index(pd.unique(table["feature"]))
+    run_pos = pd.Index(folders).get_indexer(table["run"])
+    feature_pos = features.get_indexer(table["feature"])
+    scope_pos = pd.Index(scopes).get_indexer(table["scope"])
+
+    values = np.zeros((len(folders), len(features), len(scopes)))
+    values[run_pos, feature_pos, scope_pos] = table["score"].to_numpy(dtype=float)
+    present = np.zeros((len(folders), len(features)), dtype=bool)
+    present[run_pos, feature_pos] = True
+    reported = np.zeros((len(folders), len(scopes)), dtype=bool)
+    reported[run_pos, scope_pos] = True
+    return {"values": values, "present": present, "reported": reported,
+            "folders": folders, "features": features, "scopes": scopes}
+
+def max_abs_scores(cube):
+    """|score| máximo de cada variável entre os escopos (run x variável)."""
+    return np.abs(cube["values"]).max(axis=2, initial=0.0)
+
+def run_matrix(cube, folder):
+    """
+    Matriz variável x escopo de um run, só com as variáveis do run, em ordem
+    decrescente de |score| máximo (empates na ordem de primeira aparição).
+    """
+    r = cube["folders"].index(folder)
+    keep = np.flatnonzero(cube["present"][r])
+    order = keep[np.argsort(-max_abs_scores(cube)[r, keep], kind="stable")]
+    return pd.DataFrame(cube["values"][r, order], index=cube["features"][order], columns=cube["scopes"])
+
+def heatmap_colors(values, max_val=HEATMAP_MAX):
+    """(cor de fundo, cor do texto) de cada célula, como arrays de strings no formato do relatório."""
+    norm = np.minimum(np.abs(values) / max_val, 1.0)
+    g = (255 * (1 - norm)).astype(int)
+    b = (200 * (1 - norm)).astype(int)
+    background = np.char.add(np.char.add(np.char.add("rgb(255, ", g.astype(str)), ", "), np.char.add(b.astype(str), ")"))
+    text = np.where(norm > 0.6, "#fff", "#000")
+    return background, text
+
+def driver_ranks(cube):
+    """
+    Posição (1 = mais importante) de cada variável em cada run, pelo |score|
+    máximo entre escopos; NaN onde a variável não aparece no run. Todos os
+    runs numa única ordenação.
+    """
+    scores = np.where(cube["present"], max_abs_scores(cube), -np.inf)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    ranks = np.empty(order.shape, dtype=float)
+    np.put_along_axis(ranks, order, np.arange(1, order.shape[1] + 1, dtype=float)[None, :], axis=1)
+    ranks[~cube["present"]] = np.nan
+    return ranks
+
+def rank_shifts(cube):
+    """Mudança de posição entre todos os pares de runs (run_a x run_b x variável): rank_b - rank_a."""
+    ranks = driver_ranks(cube)
+    return ranks[None, :, :] - ranks[:, None, :]
+
+def rank_shift_table(cube, folder_a, folder_b):
+    """
+    Variáveis presentes nos dois runs com a posição em cada um e a mudança
+    (positiva = caiu no ranking de folder_a para folder_b), ordenadas pela
+    maior mudança absoluta.
+    """
+    a, b = cube["folders"].index(folder_a), cube["folders"].index(folder_b)
+    ranks = driver_ranks(cube)
+    shift = ranks[b] - ranks[a]
+    both = np.flatnonzero(~np.isnan(shift))
+    df = pd.DataFrame({"Driver": cube["features"][both], f"Rank {folder_a}": ranks[a, both].astype(int),
+                       f"Rank {folder_b}": ranks[b, both].astype(int), "Shift": shift[both].astype(int)})
+    return df.iloc[np.argsort(-np.abs(df["Shift"].to_numpy()), kind="stable")].reset_index(drop=True)
+
+def frequency_curves(cube, thresholds=THRESHOLD_GRID):
+    """
+    Frequência de cada variável com |score| > limiar, somada sobre runs e
+    escopos, para cada limiar da grade (variável x limiar).
+    """
+    scores = np.abs(cube["values"]).transpose(0, 2, 1).reshape(-1, len(cube["features"]))
+    thresholds = np.asarray(thresholds, dtype=float)
+    counts = np.count_nonzero(scores[:, :, None] > thresholds[None, None, :], axis=0)
+    return pd.DataFrame(counts, index=cube["features"], columns=thresholds)
+
+def unit_scores(cube):
+    """
+    Vetores de |score| de cada par (run, escopo) com relatório, como matriz
+    (par x variável), e a lista de (pasta, escopo) de cada linha. Variáveis
+    ausentes do relatório contam como score 0.
+    """
+    runs, scopes = np.nonzero(cube["reported"])
+    units = [(cube["folders"][r], cube["scopes"][s]) for r, s in zip(runs, scopes)]
+    return np.abs(cube["values"][runs, :, scopes]), units
+
+def _average_ranks(x):
+    """Postos médios (empates recebem a média) de cada linha de x, todas as linhas de uma vez."""
+    n_rows, n = x.shape
+    order = np.argsort(x, axis=1, kind="stable")
+    sorted_x = np.take_along_axis(x, order, axis=1)
+    new_group = np.ones(x.shape, dtype=bool)
+    new_group[:, 1:] = sorted_x[:, 1:] != sorted_x[:, :-1]
+    flat = new_group.ravel()
+    group_id = np.cumsum(flat) - 1
+    starts = np.flatnonzero(flat)
+    ends = np.r_[starts[1:], flat.size]
+    # Grupos não atravessam linhas (cada linha abre um grupo novo)
+    average = (starts + ends - 1) / 2 - (starts // n) * n + 1
+    ranks = np.empty(x.shape)
+    np.put_along_axis(ranks, order, average[group_id].reshape(x.shape), axis=1)
+    return ranks
+
+def spearman_matrix(scores):
+    """Spearman entre todas as linhas de scores (par x par): Pearson dos postos médios."""
+    ranks = _average_ranks(scores)
+    ranks -= ranks.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum("ij,ij->i", ranks, ranks))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (ranks @ ranks.T) / np.outer(norms, norms)
+
+def kendall_matrix(scores, block_elements=KENDALL_BLOCK_ELEMENTS):
+    """
+    Kendall tau-b entre todas as linhas de scores (par x par). Para cada
+    linha, o sinal de x_i - x_j em cada par de variáveis i < j; o numerador
+    (concordantes - discordantes) é o produto dessas matrizes de sinais e o
+    denominador vem do número de pares sem empate de cada linha. Os pares de
+    variáveis são processados em blocos de até block_elements elementos.
+    """
+    n_units, n_features = scores.shape
+    i, j = np.triu_indices(n_features, 1)
+    block = max(1, block_elements // max(n_units, 1))
+    concordance = np.zeros((n_units, n_units))
+    untied = np.zeros(n_units)
+    for start in range(0, i.size, block):
+        signs = np.sign(scores[:, i[start:start + block]] - scores[:, j[start:start + block]])
+        concordance += signs @ signs.T
+        untied += np.abs(signs).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return concordance / np.sqrt(np.outer(untied, untied))
+
+def topk_jaccard_matrix(scores, k=TOP_K):
+    """
+    Jaccard dos top-k drivers (maiores |score|, só scores > 0) entre todas as
+    linhas de scores (par x par).
+    """
+    n_units, n_features = scores.shape
+    k = min(k, n_features)
+    members = np.zeros(scores.shape, dtype=bool)
+    if k > 0:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        members[np.arange(n_units)[:, None], top] = True
+        members &= scores > 0
+    members = members.astype(float)
+    inter = members @ members.T
+    sizes = members.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - inter
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return inter / union
+
+def agreement_table(cube, labels=None, k=TOP_K):
+    """
+    Spearman, Kendall tau-b e Jaccard top-k de cada par de (run, escopo) com
+    relatório (triângulo superior), como tabela longa. labels mapeia pasta
+    para o nome do run.
+    """
+    scores, units = unit_scores(cube)
+    a, b = np.triu_indices(len(units), 1)
+    names = [(labels or {}).get(folder, folder) for folder, _ in units]
+    return pd.DataFrame({
+        "Run A": [names[x] for x in a], "Scope A": [units[x][1] for x in a],
+        "Run B": [names[x] for x in b], "Scope B": [units[x][1] for x in b],
+        "Spearman": spearman_matrix(scores)[a, b],
+        "Kendall": kendall_matrix(scores)[a, b],
+        f"Jaccard@{k}": topk_jaccard_matrix(scores, k)[a, b],
+    })
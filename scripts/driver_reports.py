@@ -0,0 +1,127 @@
+"""
+Leitura dos drivers EBM de relatorio_analise_{escopo}.txt, com cache em Parquet.
+
+Os relatórios de todos os runs e escopos são lidos para uma tabela longa
+(run, scope, feature, score), guardada em CACHE_FILE junto com o caminho,
+mtime e tamanho de cada relatório. Numa nova leitura só os arquivos cujo
+(mtime, tamanho) mudou são lidos de novo; com os logs intactos nenhum texto
+é lido. advanced_evaluation.py e consolidate_results.py usam a mesma tabela.
+
+pandas só é importado ao montar a tabela; report_path e parse_driver_report
+usam apenas a biblioteca padrão.
+"""
+import os
+from pathlib import Path
+
+# Relativo ao BASE_DIR de cada script
+CACHE_FILE = Path("comparativo_avancado") / "cache_drivers" / "driver_reports.parquet"
+
+COLUMNS = ["run", "scope", "feature", "score"]
+_CACHE_COLUMNS = ["path", "mtime_ns", "size", "position"] + COLUMNS
+
+def report_path(log_dir, scope):
+    return Path(log_dir) / "relatorios" / f"relatorio_analise_{scope}.txt"
+
+def parse_driver_report(txt_path):
+    """
+    Lê a tabela "Fatores de Influência (EBM)" de um relatório e retorna
+    {feature: score} na ordem do arquivo ({} se o arquivo não existir).
+    """
+    drivers = {}
+    try:
+        with open(txt_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return drivers
+
+    start_idx = -1
+    for i, line in enumerate(lines):
+        if "Fatores de Influência (EBM)" in line:
+            start_idx = i + 3
+            break
+
+    if start_idx != -1:
+        for i in range(start_idx, len(lines)):
+            line = lines[i].strip()
+            if not line or "──────" in line:
+                if line and "──────" in line: break
+                continue
+            if "feature_pretty" in line: continue
+
+            parts = line.rsplit(maxsplit=1)
+            if len(parts) == 2:
+                name = parts[0].strip()
+                try:
+                    drivers[name] = float(parts[1])
+                except ValueError:
+                    continue
+    return drivers
+
+def _read_cache(cache_path):
+    import pandas as pd
+    if not cache_path.exists():
+        return pd.DataFrame(columns=_CACHE_COLUMNS)
+    try:
+        return pd.read_parquet(cache_path)
+    except Exception as e:
+        print(f"Cache de drivers ilegível ({e}); relendo os relatórios.")
+        return pd.DataFrame(columns=_CACHE_COLUMNS)
+
+def _write_cache(cache, cache_path):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    cache.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+
+def load_driver_table(base_dir, folders, scopes, use_cache=True):
+    """
+    Tabela longa (run, scope, feature, score) dos relatórios de cada pasta de
+    run e escopo, na ordem de folders x scopes e, dentro de cada relatório,
+    na ordem do arquivo. Relatórios ausentes não geram linhas.
+    """
+    import pandas as pd
+    base_dir = Path(base_dir)
+    cache_path = base_dir / CACHE_FILE
+    cache = _read_cache(cache_path) if use_cache else pd.DataFrame(columns=_CACHE_COLUMNS)
+    cached = {path: group for path, group in cache.groupby("path", sort=False)}
+
+    frames = []
+    changed = False
+    for folder in folders:
+        for scope in scopes:
+            path = report_path(base_dir / folder, scope)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            key = str(path)
+            group = cached.get(key)
+            if group is None or group["mtime_ns"].iat[0] != stat.st_mtime_ns or group["size"].iat[0] != stat.st_size:
+                try:
+                    drivers = parse_driver_report(path)
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"Erro ao ler {path}: {e}")
+                    continue
+                # Relatório sem drivers vira uma linha com feature nula, para não ser relido
+                items = list(drivers.items()) or [(None, float("nan"))]
+                group = pd.DataFrame({
+                    "path": key, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                    "position": range(len(items)), "run": folder, "scope": scope,
+                    "feature": [name for name, _ in items], "score": [score for _, score in items],
+                }, columns=_CACHE_COLUMNS)
+                cached[key] = group
+                changed = True
+            frames.append(group)
+
+    if use_cache and changed:
+        _write_cache(pd.concat(list(cached.values()), ignore_index=True), cache_path)
+
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    table = pd.concat(frames, ignore_index=True)
+    return table.loc[table["feature"].notna(), COLUMNS].reset_index(drop=True)
+
+def drivers_of(table, run, scope):
+    """{feature: score} de um (run, escopo) da tabela, na ordem do relatório."""
+    rows = table[(table["run"] == run) & (table["scope"] == scope)]
+    return dict(zip(rows["feature"], rows["score"]))
@@ -0,0 +1,395 @@
+"""
+Setores prioritários (top-k% de probabilidade) de cada run e escopo, em mapa.
+
+Para cada run e coluna prob_fcu_* do output_final_master.geoparquet, os k
+setores de maior probabilidade saem de uma seleção parcial (np.argpartition,
+O(n)) e só eles são ordenados. A seleção é feita entre os setores de teste do
+escopo (o manifesto de split de advanced_evaluation.py), com FCU e predição,
+e k é o do Recall@k da Tabela 4.1: os setores do mapa são os que o
+Recall@1% e a Precision@1% contam. Só as colunas ID, FCU e prob_fcu_* são
+lidas do master inteiro; a geometria é lida apenas dos row groups que contêm
+setores selecionados, uma vez por setor (o primeiro run que o seleciona), e
+simplificada.
+
+Saídas em comparativo_avancado/:
+
+- hotspots.parquet: GeoParquet (WKB, CRS do master) com uma linha por
+  (run, escopo, setor): posição, probabilidade e geometria simplificada. As
+  geometrias repetidas entre runs são idênticas, então a codificação por
+  dicionário do Parquet as guarda uma vez só;
+- hotspots.fgb: o mesmo em FlatGeobuf, se geopandas e pyogrio estiverem
+  instalados;
+- hotspot_tiles/{z}/{x}/{y}.json: pirâmide de tiles GeoJSON (Web Mercator),
+  com cada setor uma vez por tile e as posições de todas as camadas
+  (run, escopo) nas propriedades. Abaixo de POLYGON_MIN_ZOOM os setores são
+  pontos no centróide; a partir dele, polígonos simplificados para meio pixel
+  do zoom. hotspot_tiles/index.json lista as camadas, zooms e limites, e é o
+  que o mapa da seção 4.6 do relatório carrega primeiro;
+- leaflet/leaflet.js e leaflet/leaflet.css: cópia local do Leaflet usada pelo
+  mapa, baixada do CDN e conferida contra o hash SRI (sem rede, ou com
+  --offline, o relatório usa o CDN com o mesmo hash).
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import run_registry
+
+# numpy, pandas, pyarrow e spatial_analysis são importados dentro das funções
+# que os usam: `-h` (e `cli.py hotspots -h`) não carrega nada pesado.
+
+# Configuração
+BASE_DIR = run_registry.BASE_DIR
+OUTPUT_DIR = BASE_DIR / "comparativo_avancado"
+GEOPARQUET_FILE = "hotspots.parquet"
+FLATGEOBUF_FILE = "hotspots.fgb"
+TILES_DIR = "hotspot_tiles"
+
+PROB_PREFIX = "prob_fcu_"
+TOP_K_PERCENT = 1
+# Tolerância de simplificação das geometrias exportadas, na unidade do CRS
+SIMPLIFY_TOLERANCE = {"geographic": 1e-4, "projected": 10.0}
+MIN_ZOOM = 4
+MAX_ZOOM = 12
+POLYGON_MIN_ZOOM = 9
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798
+# Leaflet do mapa da seção 4.6: cópia local em comparativo_avancado/leaflet/,
+# ou o CDN, sempre conferidos pelo hash SRI publicado para a versão 1.9.4
+LEAFLET_DIR = "leaflet"
+LEAFLET_URL = "https://unpkg.com/leaflet@1.9.4/dist/"
+LEAFLET_FILES = {
+    "leaflet.css": "sha256-p4NxAoJBhIIN+hmNHrzRCf9tD/miZyoHS5obTRR9BMY=",
+    "leaflet.js": "sha256-20nQCchB9co0qIjJZRGuk2/Z9VM+kNiyxNV1lvTlZBo=",
+}
+LEAFLET_TIMEOUT = 10
+
+def top_k_rows(p, k_percent=TOP_K_PERCENT):
+    """
+    Posições das k maiores probabilidades de p, da maior para a menor. NaN
+    fica de fora, e k = int(k_percent% dos demais), como no Recall@k de
+    advanced_evaluation.py. Seleção parcial com argpartition; só os k
+    selecionados são ordenados.
+    """
+    import numpy as np
+    p = np.asarray(p, dtype=float)
+    k = int(np.count_nonzero(~np.isnan(p)) * k_percent / 100)
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    scores = np.where(np.isnan(p), -np.inf, p)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+def _master_ids(table):
+    import numpy as np
+    import pyarrow as pa
+    ids = table["ID"]
+    if pa.types.is_integer(ids.type):
+        return ids.to_numpy().astype(str)
+    return np.char.strip(ids.to_numpy(zero_copy_only=False).astype(str))
+
+def _geo_column(master_path):
+    import pyarrow.parquet as pq
+    metadata = pq.read_schema(master_path).metadata or {}
+    try:
+        return json.loads(metadata[b"geo"])["columns"]["geometry"]
+    except (KeyError, ValueError):
+        return {}
+
+def select_hotspots(master_paths, test_ids, k_percent=TOP_K_PERCENT):
+    """
+    Top-k de cada run {run: master} e coluna prob_fcu_*, entre os setores de
+    teste do escopo ({escopo: IDs}) com FCU, e a geometria simplificada de
+    cada setor selecionado. Escopos sem split ficam de fora. Retorna
+    (DataFrame com Run, Scope, Rank, ID e Prob, {ID: geometria shapely},
+    coluna "geo" do primeiro master).
+    """
+    import numpy as np
+    import pandas as pd
+    import pyarrow.parquet as pq
+    import id_index
+    import spatial_analysis
+    import shapely
+    scope_index = id_index.build_scope_index(test_ids)
+    first = next(iter(master_paths.values()))
+    geo_column = _geo_column(first)
+    geographic = spatial_analysis._is_geographic(first)
+    tolerance = SIMPLIFY_TOLERANCE["geographic" if geographic else "projected"]
+
+    frames, geometries = [], {}
+    for run, master_path in master_paths.items():
+        names = [name for name in pq.read_schema(master_path).names if name.startswith(PROB_PREFIX)
+                 and name[len(PROB_PREFIX):].replace("_", " ") in test_ids]
+        table = pq.read_table(master_path, columns=["ID", "FCU"] + names, memory_map=True)
+        ids = _master_ids(table)
+        # Linhas de teste de cada escopo, com o rótulo observado (como no Recall@k)
+        masks = id_index.scope_masks(id_index.encode_ids(ids, scope_index), scope_index)
+        labelled = table["FCU"].is_valid().to_numpy(zero_copy_only=False)
+        selected = []
+        for column in names:
+            scope = column[len(PROB_PREFIX):].replace("_", " ")
+            p = np.asarray(table[column].to_numpy(zero_copy_only=False), dtype=float)
+            rows = top_k_rows(np.where(masks[scope] & labelled, p, np.nan), k_percent)
+            selected.append(rows)
+            frames.append(pd.DataFrame({"Run": run, "Scope": scope,
+                                        "Rank": np.arange(1, rows.size + 1), "ID": ids[rows], "Prob": p[rows]}))
+        rows = np.unique(np.concatenate(selected)) if selected else np.empty(0, dtype=np.int64)
+        # Geometria só dos setores que nenhum run anterior selecionou
+        rows = rows[np.fromiter((sector not in geometries for sector in ids[rows]), dtype=bool, count=rows.size)]
+        if rows.size:
+            shapes = shapely.simplify(shapely.from_wkb(spatial_analysis.read_geometry_rows(master_path, rows)), tolerance,
+                                      preserve_topology=True)
+            geometries.update(zip(ids[rows], shapes))
+        print(f"  {run}: {len(names)} escopos, {rows.size} geometrias novas")
+    hotspots = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Run", "Scope", "Rank", "ID", "Prob"])
+    return hotspots, geometries, geo_column
+
+def write_geoparquet(hotspots, geometries, geo_column, path):
+    """GeoParquet 1.1 (WKB) das linhas de hotspots, com o CRS do master e o bbox recalculado."""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import shapely
+    shapes = np.array([geometries[sector] for sector in hotspots["ID"]], dtype=object)
+    table = pa.Table.from_pandas(hotspots, preserve_index=False)
+    table = table.append_column("geometry", pa.array(shapely.to_wkb(shapes), type=pa.binary()))
+    column = {"encoding": "WKB", "geometry_types": sorted({shape.geom_type for shape in shapes})}
+    if "crs" in geo_column:
+        column["crs"] = geo_column["crs"]
+    if shapes.size:
+        column["bbox"] = shapely.total_bounds(shapes).tolist()
+    metadata = {b"geo": json.dumps({"version": "1.1.0", "primary_column": "geometry",
+                                    "columns": {"geometry": column}}).encode("utf-8")}
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+def write_flatgeobuf(path_parquet, path):
+    """FlatGeobuf a partir do GeoParquet; False (sem gravar) se geopandas/pyogrio não estiverem instalados."""
+    try:
+        import geopandas as gpd
+        import pyogrio  # noqa: F401
+    except ImportError:
+        return False
+    gdf = gpd.read_parquet(path_parquet)
+    tmp_path = path.with_name(f".tmp_{path.name}")
+    gdf.to_file(tmp_path, driver="FlatGeobuf", engine="pyogrio")
+    os.replace(tmp_path, path)
+    return True
+
+def _lonlat(shapes, geo_column):
+    """Geometrias em lon/lat (EPSG:4326); pyproj só é usado quando o CRS é projetado."""
+    import numpy as np
+    import shapely
+    crs = geo_column.get("crs")
+    if crs is None or (isinstance(crs, dict) and crs.get("type") == "GeographicCRS"):
+        return shapes
+    from pyproj import CRS, Transformer
+    source = CRS.from_json_dict(crs) if isinstance(crs, dict) else CRS.from_user_input(crs)
+    transformer = Transformer.from_crs(source, "EPSG:4326", always_xy=True)
+    return shapely.transform(shapes, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+def _tile_x(lon, zoom):
+    import numpy as np
+    return np.clip(np.floor((np.asarray(lon) + 180.0) / 360.0 * 2 ** zoom), 0, 2 ** zoom - 1).astype(np.int64)
+
+def _tile_y(lat, zoom):
+    import numpy as np
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * 2 ** zoom
+    return np.clip(np.floor(y), 0, 2 ** zoom - 1).astype(np.int64)
+
+def _feature_tiles(bounds, zoom):
+    """(feature, x, y) de cada tile do zoom tocado pelo bbox de cada feature."""
+    import numpy as np
+    x0, x1 = _tile_x(bounds[:, 0], zoom), _tile_x(bounds[:, 2], zoom)
+    # y cresce para o sul: o topo do bbox dá o menor y
+    y0, y1 = _tile_y(bounds[:, 3], zoom), _tile_y(bounds[:, 1], zoom)
+    width, height = x1 - x0 + 1, y1 - y0 + 1
+    feature = np.repeat(np.arange(bounds.shape[0]), width * height)
+    first = np.r_[0, np.cumsum(width * height)[:-1]]
+    offset = np.arange(feature.size) - first[feature]
+    return feature, x0[feature] + offset % width[feature], y0[feature] + offset // width[feature]
+
+def _geometry_json(shapes, decimals):
+    """
+    GeoJSON (texto) de cada geometria, com coordenadas arredondadas. Polígonos
+    viram MultiPolygon; as demais geometrias, o ponto do centróide.
+    """
+    import numpy as np
+    import shapely
+    result = [None] * shapes.size
+    polygonal = np.isin(shapely.get_type_id(shapes), [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON])
+    points = np.flatnonzero(~polygonal)
+    if points.size:
+        coords = np.round(shapely.get_coordinates(shapely.centroid(shapes[points])), decimals).tolist()
+        for i, xy in zip(points, coords):
+            result[i] = json.dumps({"type": "Point", "coordinates": xy}, separators=(",", ":"))
+    polygons = np.flatnonzero(polygonal)
+    if polygons.size:
+        geom_type, coords, offsets = shapely.to_ragged_array(shapes[polygons])
+        coords = np.round(coords, decimals).tolist()
+        if geom_type == shapely.GeometryType.POLYGON:
+            offsets = offsets + (np.arange(polygons.size + 1),)
+        ring_offsets, polygon_offsets, geometry_offsets = offsets
+        rings = [coords[a:b] for a, b in zip(ring_offsets[:-1], ring_offsets[1:])]
+        parts = [rings[a:b] for a, b in zip(polygon_offsets[:-1], polygon_offsets[1:])]
+        for i, a, b in zip(polygons, geometry_offsets[:-1], geometry_offsets[1:]):
+            result[i] = json.dumps({"type": "MultiPolygon", "coordinates": parts[a:b]}, separators=(",", ":"))
+    return result
+
+def write_tiles(hotspots, geometries, geo_column, tiles_dir, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """
+    Pirâmide de tiles GeoJSON dos setores de hotspots em tiles_dir, trocada
+    atomicamente (diretório temporário renomeado no fim). Retorna o índice
+    gravado em index.json.
+    """
+    import numpy as np
+    import shapely
+    layers = hotspots[["Run", "Scope"]].drop_duplicates().reset_index(drop=True)
+    layer_of = {(run, scope): i for i, (run, scope) in enumerate(layers.itertuples(index=False))}
+    sectors = list(geometries)
+    shapes = _lonlat(np.array([geometries[sector] for sector in sectors], dtype=object), geo_column)
+
+    # Propriedades: posição e probabilidade de cada setor em cada camada
+    ranks, probs = {sector: {} for sector in sectors}, {sector: {} for sector in sectors}
+    layer_codes = [layer_of[key] for key in zip(hotspots["Run"], hotspots["Scope"])]
+    for sector, layer, rank, prob in zip(hotspots["ID"], layer_codes, hotspots["Rank"], hotspots["Prob"]):
+        ranks[sector][layer] = int(rank)
+        probs[sector][layer] = round(float(prob), 4)
+    heads = [json.dumps({"type": "Feature", "id": sector, "properties": {"r": ranks[sector], "p": probs[sector]}},
+                        separators=(",", ":"))[:-1] for sector in sectors]
+
+    tmp_dir = tiles_dir.with_name(f".{tiles_dir.name}.tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    centroids = shapely.centroid(shapes)
+    n_tiles = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        degrees_per_pixel = 360.0 / (TILE_SIZE * 2 ** zoom)
+        decimals = max(0, math.ceil(-math.log10(degrees_per_pixel)))
+        if zoom >= POLYGON_MIN_ZOOM:
+            level = shapely.simplify(shapes, degrees_per_pixel / 2, preserve_topology=True)
+        else:
+            level = centroids
+        bounds = shapely.bounds(level)
+        geometry = _geometry_json(level, decimals)
+        feature, x, y = _feature_tiles(bounds, zoom)
+        order = np.lexsort((feature, y, x))
+        feature, x, y = feature[order], x[order], y[order]
+        breaks = np.flatnonzero((np.diff(x) != 0) | (np.diff(y) != 0)) + 1
+        for chunk in np.split(np.arange(feature.size), breaks):
+            if chunk.size == 0:
+                continue
+            tile_path = tmp_dir / str(zoom) / str(x[chunk[0]]) / f"{y[chunk[0]]}.json"
+            tile_path.parent.mkdir(parents=True, exist_ok=True)
+            body = ",".join(f'{heads[i]},"geometry":{geometry[i]}}}' for i in feature[chunk])
+            tile_path.write_text(f'{{"type":"FeatureCollection","features":[{body}]}}', encoding="utf-8")
+            n_tiles += 1
+
+    index = {
+        "layers": [{"run": run, "scope": scope, "k": int(count)} for (run, scope), count in
+                   zip(layers.itertuples(index=False), hotspots.groupby(["Run", "Scope"], sort=False).size())],
+        "min_zoom": min_zoom, "max_zoom": max_zoom, "polygon_min_zoom": POLYGON_MIN_ZOOM,
+        "bounds": shapely.total_bounds(shapes).tolist() if shapes.size else None,
+        "sectors": len(sectors), "tiles": n_tiles,
+    }
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    (tmp_dir / "index.json").write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    old_dir = tiles_dir.with_name(f".{tiles_dir.name}.old")
+    if tiles_dir.exists():
+        os.replace(tiles_dir, old_dir)
+    os.replace(tmp_dir, tiles_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return index
+
+def sri_hash(data):
+    """Hash SRI (sha256-<base64>) de um conteúdo, no formato do atributo integrity."""
+    import base64
+    import hashlib
+    return "sha256-" + base64.b64encode(hashlib.sha256(data).digest()).decode("ascii")
+
+def leaflet_vendored(leaflet_dir):
+    """True se leaflet_dir tem os arquivos do Leaflet com o hash SRI esperado."""
+    return all((leaflet_dir / name).exists() and sri_hash((leaflet_dir / name).read_bytes()) == integrity
+               for name, integrity in LEAFLET_FILES.items())
+
+def vendor_leaflet(leaflet_dir):
+    """
+    Baixa leaflet.js e leaflet.css para leaflet_dir, conferindo o hash SRI, para
+    o mapa não depender do CDN. Arquivos já presentes com o hash certo não são
+    baixados de novo. Retorna True se os dois ficaram disponíveis localmente.
+    """
+    import urllib.request
+    for name, integrity in LEAFLET_FILES.items():
+        path = leaflet_dir / name
+        if path.exists() and sri_hash(path.read_bytes()) == integrity:
+            continue
+        try:
+            with urllib.request.urlopen(LEAFLET_URL + name, timeout=LEAFLET_TIMEOUT) as response:
+                data = response.read()
+        except OSError as e:
+            print(f"Leaflet não baixado ({name}: {e}); o relatório usará o CDN.")
+            return False
+        if sri_hash(data) != integrity:
+            print(f"Leaflet não copiado: {name} não confere com o hash SRI esperado.")
+            return False
+        leaflet_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{name}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta os setores top-k% de cada run e escopo (GeoParquet, FlatGeobuf e tiles).")
+    parser.add_argument("--runs", nargs="+", metavar="PASTA", help="Pastas log_v3_* a exportar (padrão: todos os runs com master).")
+    parser.add_argument("--top-k-percent", type=float, default=TOP_K_PERCENT,
+                        help="Tamanho do top-k, em %% dos setores de teste do escopo (padrão: 1, o do Recall@1%%).")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM, help="Menor zoom da pirâmide de tiles.")
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM, help="Maior zoom da pirâmide de tiles.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Não baixa o Leaflet; o mapa usa a cópia local já existente ou o CDN.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    registry = run_registry.load_registry(BASE_DIR)
+    runs = [run for run in registry if run["has_master"]]
+    if args.runs:
+        by_folder = {run["folder"]: run for run in runs}
+        for folder in args.runs:
+            if folder not in by_folder:
+                print(f"Run sem output_final_master em {BASE_DIR}: {folder}")
+        runs = [by_folder[folder] for folder in args.runs if folder in by_folder]
+    if not runs:
+        print("Nenhum run com output_final_master para exportar.")
+        return 1
+
+    # Mesmo conjunto de teste das métricas da Tabela 4.1 (manifesto de split)
+    import advanced_evaluation
+    test_split = advanced_evaluation.load_test_split(advanced_evaluation.SCOPES, advanced_evaluation.INPUT_FILE)
+    test_ids = {scope: ids for scope, (ids, _) in test_split.items()}
+
+    master_paths = {run["label"]: BASE_DIR / run["folder"] / run_registry.MASTER_FILE for run in runs}
+    print(f"Selecionando o top {args.top_k_percent:g}% dos setores de teste de {len(runs)} runs...")
+    hotspots, geometries, geo_column = select_hotspots(master_paths, test_ids, args.top_k_percent)
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    write_geoparquet(hotspots, geometries, geo_column, OUTPUT_DIR / GEOPARQUET_FILE)
+    print(f"{len(hotspots)} linhas ({len(geometries)} setores) salvas em {GEOPARQUET_FILE}")
+    if write_flatgeobuf(OUTPUT_DIR / GEOPARQUET_FILE, OUTPUT_DIR / FLATGEOBUF_FILE):
+        print(f"FlatGeobuf salvo em {FLATGEOBUF_FILE}")
+    else:
+        print("geopandas/pyogrio não instalados; FlatGeobuf não gerado.")
+    index = write_tiles(hotspots, geometries, geo_column, OUTPUT_DIR / TILES_DIR, args.min_zoom, args.max_zoom)
+    print(f"{index['tiles']} tiles (zoom {args.min_zoom} a {args.max_zoom}) salvos em {TILES_DIR}/")
+    if leaflet_vendored(OUTPUT_DIR / LEAFLET_DIR) or (not args.offline and vendor_leaflet(OUTPUT_DIR / LEAFLET_DIR)):
+        print(f"Leaflet local em {LEAFLET_DIR}/")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
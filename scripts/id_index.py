@@ -0,0 +1,91 @@
+"""
+Índice de IDs de setor para o recorte por escopo.
+
+Os IDs (texto) são codificados uma única vez numa chave int64 compacta:
+o próprio código do setor quando todos os IDs são numéricos (códigos IBGE)
+ou, caso contrário, a posição do ID num vocabulário ordenado com todos os IDs
+de teste. Cada escopo guarda suas chaves ordenadas, e o filtro de um run vira
+uma busca binária vetorizada (np.searchsorted) em vez de um isin sobre strings.
+"""
+import hashlib
+import numpy as np
+
+# Códigos de setor IBGE têm 15 dígitos; int64 comporta até 18 com folga
+MAX_INT_DIGITS = 18
+
+# Máscaras por escopo já calculadas, indexadas pelo digest das chaves do run.
+# Runs cujo master tem os mesmos IDs na mesma ordem reaproveitam as máscaras.
+_MASK_CACHE = {}
+
+def _parse_int_ids(ids):
+    """Converte IDs numéricos (texto) em int64; retorna None se algum não for numérico."""
+    arr = np.char.strip(np.asarray(ids, dtype=str))
+    if arr.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if not np.char.isdigit(arr).all() or np.char.str_len(arr).max() > MAX_INT_DIGITS:
+        return None
+    return arr.astype(np.int64)
+
+def build_scope_index(test_ids_by_scope):
+    """
+    Monta o índice {"vocab": ..., "keys": {escopo: chaves int64 ordenadas}}.
+    "vocab" é None quando os IDs são numéricos (a chave é o próprio código).
+    """
+    parsed = {scope: _parse_int_ids(ids) for scope, ids in test_ids_by_scope.items()}
+
+    if all(keys is not None for keys in parsed.values()):
+        return {"vocab": None, "keys": {scope: np.unique(keys) for scope, keys in parsed.items()}}
+
+    vocab = np.unique(np.concatenate([np.char.strip(np.asarray(ids, dtype=str)) for ids in test_ids_by_scope.values()]))
+    keys = {}
+    for scope, ids in test_ids_by_scope.items():
+        keys[scope] = np.unique(np.searchsorted(vocab, np.char.strip(np.asarray(ids, dtype=str)))).astype(np.int64)
+    return {"vocab": vocab, "keys": keys}
+
+def encode_ids(ids, index):
+    """
+    Codifica IDs de um run na mesma chave int64 do índice. IDs fora do
+    vocabulário (ou não numéricos, no modo numérico) recebem -1.
+    """
+    vocab = index["vocab"]
+    raw = np.asarray(ids)
+    if vocab is None and np.issubdtype(raw.dtype, np.integer):
+        # IDs já inteiros (coluna int no Parquet): a chave é o próprio valor
+        return raw.astype(np.int64)
+
+    arr = np.char.strip(raw.astype(str))
+
+    if vocab is None:
+        keys = _parse_int_ids(arr)
+        if keys is not None:
+            return keys
+        # IDs do run fora do padrão numérico: codifica só os válidos
+        valid = np.char.isdigit(arr) & (np.char.str_len(arr) <= MAX_INT_DIGITS)
+        keys = np.full(arr.shape, -1, dtype=np.int64)
+        keys[valid] = arr[valid].astype(np.int64)
+        return keys
+
+    if vocab.size == 0:
+        return np.full(arr.shape, -1, dtype=np.int64)
+    pos = np.searchsorted(vocab, arr)
+    found = vocab[np.minimum(pos, vocab.size - 1)] == arr
+    return np.where(found, pos, -1).astype(np.int64)
+
+def member_mask(keys, sorted_keys):
+    """Máscara booleana de keys contidas em sorted_keys (busca binária vetorizada)."""
+    if sorted_keys.size == 0:
+        return np.zeros(keys.shape, dtype=bool)
+    pos = np.searchsorted(sorted_keys, keys)
+    return sorted_keys[np.minimum(pos, sorted_keys.size - 1)] == keys
+
+def scope_masks(keys, index):
+    """
+    Retorna {escopo: máscara booleana} para as chaves de um run, reutilizando
+    o cache quando outro run já tinha exatamente as mesmas chaves.
+    """
+    digest = hashlib.blake2b(np.ascontiguousarray(keys).tobytes(), digest_size=16).hexdigest()
+    masks = _MASK_CACHE.get(digest)
+    if masks is None:
+        masks = {scope: member_mask(keys, scope_keys) for scope, scope_keys in index["keys"].items()}
+        _MASK_CACHE[digest] = masks
+    return masks
@@ -0,0 +1,221 @@
+"""
+Tabela única de métricas de todos os runs e escopos (Parquet particionado).
+
+A ingestão junta, numa tabela longa (run, pasta, escopo, métrica, valor,
+origem), o que hoje está espalhado pela árvore de logs:
+
+- AUC e Brier de modelos/metrics_{escopo}.json (ou, na falta dele, da linha
+  "AUC=..., Brier=..." de treinamento/log_treino_{escopo}.txt);
+- número de variáveis de features_config/selected_features_{escopo}.json
+  (ou do "Shapes: Treino=(n, k)" do log de treino);
+- as métricas de eventos raros de comparativo_avancado/advanced_metrics.csv.
+  Linhas do modo streaming (aproximadas) entram com origem
+  "advanced_metrics_streaming" e o limite de erro como a métrica error_bound.
+
+Cada run vira uma partição threshold=<t>/interactions=<true|false>/<pasta>.parquet
+em STORE_DIR, com threshold e variante do registro de runs (run_registry: o
+arquivo de configuração do run ou, na falta dele, o nome da pasta), os
+mesmos dos rótulos do relatório. O manifest.json guarda (mtime, tamanho) das fontes de cada run;
+numa nova ingestão só os runs com alguma fonte alterada são relidos. O
+relatório e as análises ad hoc consultam esta tabela (read_store), não os logs.
+"""
+import json
+import os
+import re
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import run_registry
+
+# Relativo ao BASE_DIR de cada script
+STORE_DIR = Path("comparativo_avancado") / "metrics_store"
+ADVANCED_FILE = Path("comparativo_avancado") / "advanced_metrics.csv"
+
+COLUMNS = ["run", "folder", "threshold", "interactions", "scope", "metric", "value", "source"]
+
+# Colunas fixas de advanced_metrics.csv -> (escopo, métrica)
+ADVANCED_COLUMNS = {
+    "AUPRC (Global)": ("BRASIL", "auprc"),
+    "AUPRC (Média Local)": ("BRASIL", "auprc_media_local"),
+}
+# Colunas Recall@k / Precision@k (Global): uma de cada por k de
+# advanced_evaluation.K_PERCENTS, que pode mudar
+ADVANCED_K_PATTERN = re.compile(r"^(Recall|Precision)@([0-9.]+)% \(Global\)$")
+
+# Limite de erro das linhas aproximadas (Mode = "streaming")
+ADVANCED_BOUND_COLUMN = "Max Error Bound"
+ADVANCED_BOUND_METRIC = ("BRASIL", "error_bound")
+
+PARTITIONING = ds.partitioning(pa.schema([("threshold", pa.float64()), ("interactions", pa.bool_())]), flavor="hive")
+
+def read_log_metrics(log_dir, scope):
+    """(auc, brier, origem) do JSON de métricas, com fallback para o log de treino; (None, None, None) se nada for encontrado."""
+    try:
+        with open(log_dir / "modelos" / f"metrics_{scope}.json", "r") as f:
+            data = json.load(f)
+        return data.get("auc", 0), data.get("brier_score", 0), "metrics_json"
+    except FileNotFoundError:
+        try:
+            log_path = log_dir / "treinamento" / f"log_treino_{scope}.txt"
+            with open(log_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            match = re.search(r"AUC=(\d+\.\d+), Brier=(\d+\.\d+)", content)
+            if match:
+                return float(match.group(1)), float(match.group(2)), "log_treino"
+        except FileNotFoundError:
+            pass
+        return None, None, None
+
+def read_feature_count(log_dir, scope):
+    """(número de variáveis selecionadas, origem); 0 se não houver registro."""
+    try:
+        with open(log_dir / "features_config" / f"selected_features_{scope}.json", "r") as f:
+            data = json.load(f)
+        return len(data), "selected_features"
+    except FileNotFoundError:
+        try:
+            log_path = log_dir / "treinamento" / f"log_treino_{scope}.txt"
+            with open(log_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            match = re.search(r"Shapes: Treino=\(\d+, (\d+)\)", content)
+            if match:
+                return int(match.group(1)), "log_treino"
+        except FileNotFoundError:
+            pass
+        return 0, None
+
+def advanced_k_column(kind, k_percent):
+    """Nome da coluna Recall@k / Precision@k (kind = "Recall" ou "Precision") em advanced_metrics.csv."""
+    return f"{kind}@{k_percent:g}% (Global)"
+
+def advanced_columns(columns):
+    """
+    {coluna: (escopo, métrica)} das colunas de métricas entre columns (o
+    cabeçalho de advanced_metrics.csv): as fixas e todas as Recall@k /
+    Precision@k, na ordem em que aparecem.
+    """
+    mapping = {}
+    for column in columns:
+        match = ADVANCED_K_PATTERN.match(column)
+        if match:
+            mapping[column] = ("BRASIL", f"{match.group(1).lower()}@{match.group(2)}%")
+        elif column in ADVANCED_COLUMNS:
+            mapping[column] = ADVANCED_COLUMNS[column]
+    return mapping
+
+def _source_files(base_dir, folder, scopes):
+    log_dir = base_dir / folder
+    files = [base_dir / ADVANCED_FILE]
+    for scope in scopes:
+        files += [log_dir / "modelos" / f"metrics_{scope}.json",
+                  log_dir / "treinamento" / f"log_treino_{scope}.txt",
+                  log_dir / "features_config" / f"selected_features_{scope}.json"]
+    return files
+
+def _signature(files):
+    signature = []
+    for path in files:
+        try:
+            stat = path.stat()
+            signature.append([path.as_posix(), stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            signature.append([path.as_posix(), None, None])
+    return signature
+
+def _run_rows(base_dir, run_name, folder, scopes, df_adv):
+    log_dir = base_dir / folder
+    rows = []
+    for scope in scopes:
+        auc, brier, source = read_log_metrics(log_dir, scope)
+        if auc is not None:
+            rows.append((scope, "auc", auc, source))
+            rows.append((scope, "brier", brier, source))
+        count, source = read_feature_count(log_dir, scope)
+        rows.append((scope, "n_features", count, source))
+    if df_adv is not None and "Folder" in df_adv.columns:
+        # Pela pasta: o rótulo "Run N" é posicional e muda quando pastas entram ou saem
+        for _, row in df_adv[df_adv["Folder"] == folder].iterrows():
+            approximate = row.get("Mode") == "streaming"
+            source = "advanced_metrics_streaming" if approximate else "advanced_metrics"
+            for column, (scope, metric) in advanced_columns(row.index).items():
+                if pd.notna(row[column]):
+                    rows.append((scope, metric, row[column], source))
+            if approximate and pd.notna(row.get(ADVANCED_BOUND_COLUMN)):
+                rows.append(ADVANCED_BOUND_METRIC + (row[ADVANCED_BOUND_COLUMN], source))
+    df = pd.DataFrame(rows, columns=["scope", "metric", "value", "source"])
+    df.insert(0, "folder", folder)
+    df.insert(0, "run", run_name)
+    df["value"] = df["value"].astype(float)
+    return df
+
+def _partition_path(store_dir, run):
+    """Arquivo do run (registro de run_registry) na partição threshold/interactions."""
+    return (store_dir / "data" / f"threshold={run['threshold']}" / f"interactions={str(run['interactions']).lower()}"
+            / f"{run['folder']}.parquet")
+
+def ingest(base_dir, runs, scopes, force=False):
+    """
+    Atualiza o store com os runs [(nome, pasta)] e escopos dados, relendo só
+    os runs cujas fontes mudaram (ou todos, com force=True). Retorna o número
+    de runs reprocessados.
+    """
+    base_dir = Path(base_dir)
+    store_dir = base_dir / STORE_DIR
+    manifest_path = store_dir / "manifest.json"
+    manifest = {}
+    if manifest_path.exists() and not force:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    # Chaves de partição do registro, a mesma fonte dos rótulos do relatório
+    registry = {run["folder"]: run for run in run_registry.load_registry(base_dir)}
+    df_adv = None
+    refreshed = 0
+    for run_name, folder in runs:
+        run = registry.get(folder)
+        if run is None:
+            print(f"Pasta fora do registro de runs, ignorada: {folder}")
+            continue
+        partition = _partition_path(store_dir, run)
+        signature = {"run": run_name, "scopes": list(scopes), "partition": partition.relative_to(store_dir).as_posix(),
+                     "files": _signature(_source_files(base_dir, folder, scopes))}
+        if manifest.get(folder) == signature and partition.exists():
+            continue
+        # Metadados do run mudaram: a partição antiga sairia duplicada na leitura
+        for stale in (store_dir / "data").glob(f"*/*/{folder}.parquet"):
+            if stale != partition:
+                stale.unlink()
+        if df_adv is None and (base_dir / ADVANCED_FILE).exists():
+            df_adv = pd.read_csv(base_dir / ADVANCED_FILE)
+            if "Folder" not in df_adv.columns:
+                print(f"Aviso: {ADVANCED_FILE.name} sem a coluna Folder (versão antiga); rode advanced_evaluation.py de novo.")
+        partition.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = partition.with_name(f".{partition.name}.tmp")
+        _run_rows(base_dir, run_name, folder, scopes, df_adv).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, partition)
+        manifest[folder] = signature
+        refreshed += 1
+
+    if refreshed:
+        manifest_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    return refreshed
+
+def read_store(base_dir, folders=None):
+    """Tabela longa do store (COLUMNS), opcionalmente só das pastas dadas."""
+    data_dir = Path(base_dir) / STORE_DIR / "data"
+    if not data_dir.exists():
+        return pd.DataFrame(columns=COLUMNS)
+    dataset = ds.dataset(data_dir, format="parquet", partitioning=PARTITIONING)
+    table = dataset.to_table(filter=ds.field("folder").isin(list(folders)) if folders is not None else None)
+    return table.to_pandas()[COLUMNS]
+
+def load_metrics(base_dir, runs, scopes):
+    """Ingestão incremental seguida da leitura dos runs dados."""
+    ingest(base_dir, runs, scopes)
+    return read_store(base_dir, [folder for _, folder in runs])
+
+def metric_lookup(table):
+    """{(pasta, escopo, métrica): valor} para consultas pontuais."""
+    return dict(zip(zip(table["folder"], table["scope"], table["metric"]), table["value"]))
@@ -1,75 +1,333 @@
+import gzip
+import hashlib
+import io
+import json
 import os
-import shutil
 import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+OUTPUT_DIR_NAME = "deploy_vercel"
+HTML_FILE = "comparativo_sensibilidade.html"
+
+# Hex digits of the content hash that go into asset names
+HASH_LENGTH = 12
+# Text formats that get precompressed .gz/.br siblings
+COMPRESSIBLE_SUFFIXES = {".html", ".css", ".js", ".json", ".svg"}
+WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# PNG plots: WebP/AVIF quality, thumbnail width (mobile) and the <picture> sizes hint
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+THUMB_WIDTH = 480
+PICTURE_SIZES = "(max-width: 600px) 100vw, 50vw"
+
+# Cache-Control for vercel.json: content-hashed assets never change under the same name,
+# while index.html must be revalidated to pick up new asset names
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PAGE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+# A whole <img ...> tag (PNG plots become <picture>), src='...' / src="..." (other
+# images, scripts), data-tiles='...' (hotspot map tile folders), data-src='...'
+# (section fragments of a report built with --split-sections), or a whole <link ...>
+# tag (stylesheets, e.g. the vendored Leaflet CSS; other links are left alone)
+ASSET_PATTERN = re.compile(r"""(<img\b[^>]*>)|\b(src|data-tiles|data-src)=(['"])(.*?)\3|(<link\b[^>]*>)""")
+SRC_PATTERN = re.compile(r"""\bsrc=(['"])(.*?)\1""")
+HREF_PATTERN = re.compile(r"""\bhref=(['"])(.*?)\1""")
+STYLESHEET_PATTERN = re.compile(r"""\brel=(['"])stylesheet\1""")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:HASH_LENGTH]
+
+def dir_digest(path, pool):
+    """Hash of a folder: relative path and content hash of every file, in sorted order."""
+    files = sorted(p for p in path.rglob("*") if p.is_file())
+    h = hashlib.blake2b(digest_size=16)
+    for file, digest in zip(files, pool.map(file_digest, files)):
+        h.update(f"{file.relative_to(path).as_posix()}\0{digest}\n".encode("utf-8"))
+    return h.hexdigest()[:HASH_LENGTH]
+
+def hashed_name(rel_path, digest):
+    """Flat, content-hashed asset name: e.g. calib_60_BRASIL.<hash>.png."""
+    rel_path = Path(str(rel_path).replace("\\", "/"))
+    return f"{rel_path.stem}.{digest}{rel_path.suffix}"
+
+def copy_file(src, dst):
+    """Copy src to dst unless dst already exists (content-hashed names never change content)."""
+    if dst.exists():
+        return False
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return True
+
+def copy_dir(src, dst, pool):
+    """Copy the folder src to dst (file by file, in the pool) unless dst already exists."""
+    if dst.exists():
+        return False
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    files = [p for p in src.rglob("*") if p.is_file()]
+    list(pool.map(lambda p: copy_file(p, tmp / p.relative_to(src)), files))
+    os.replace(tmp, dst)
+    return True
+
+def compress_file(path):
+    """Write path.gz (and path.br, if brotli is installed) when missing or older than path."""
+    mtime = path.stat().st_mtime_ns
+    targets = [(path.with_name(path.name + ".gz"), lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        targets.append((path.with_name(path.name + ".br"), lambda data: brotli.compress(data, quality=11)))
+    targets = [(dst, compress) for dst, compress in targets if not dst.exists() or dst.stat().st_mtime_ns < mtime]
+    if not targets:
+        return 0
+    data = path.read_bytes()
+    for dst, compress in targets:
+        tmp = dst.with_name(f".{dst.name}.tmp")
+        tmp.write_bytes(compress(data))
+        os.replace(tmp, dst)
+    return len(targets)
+
+def _encode(image, fmt, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **params)
+    return buffer.getvalue()
+
+def _write_bytes(dst, data):
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, dst)
+
+def optimize_png(src, base, assets_dir):
+    """
+    Variants of a PNG plot under the content-hashed base name: the PNG
+    recompressed losslessly (or the original, if smaller), WebP and AVIF (if
+    Pillow supports it), and THUMB_WIDTH thumbnails of both. Only missing
+    variants are encoded. Returns (names and image size, files written).
+    """
+    from PIL import Image, features
+    formats = [("webp", "WEBP", {"quality": WEBP_QUALITY, "method": 6})]
+    if features.check("avif"):
+        formats.append(("avif", "AVIF", {"quality": AVIF_QUALITY}))
+    with Image.open(src) as image:
+        width, height = image.size
+        variants = {"png": f"{base}.png", "size": (width, height), "sources": {}}
+        targets = []
+        for ext, fmt, params in formats:
+            widths = [w for w in (THUMB_WIDTH, width) if w <= width]
+            variants["sources"][ext] = [(w, f"{base}.w{w}.{ext}" if w < width else f"{base}.{ext}") for w in widths]
+            targets += [(assets_dir / name, fmt, params, w) for w, name in variants["sources"][ext]]
+        missing = [t for t in targets if not t[0].exists()]
+        written = len(missing)
+        if not (assets_dir / variants["png"]).exists():
+            written += 1
+            image.load()
+            original = src.read_bytes()
+            recompressed = _encode(image, "PNG", optimize=True)
+            _write_bytes(assets_dir / variants["png"], min(original, recompressed, key=len))
+        if missing:
+            image.load()
+            for dst, fmt, params, w in missing:
+                resized = image if w == width else image.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+                _write_bytes(dst, _encode(resized, fmt, **params))
+    return variants, written
+
+def _variant_names(variants):
+    return [variants["png"]] + [name for srcset in variants["sources"].values() for _, name in srcset]
+
+def picture_tag(img_tag, variants):
+    """<picture> with AVIF/WebP sources (full size and thumbnail) around the <img>, which keeps the PNG fallback."""
+    width, height = variants["size"]
+    img = SRC_PATTERN.sub(lambda m: f"src={m.group(1)}assets/{variants['png']}{m.group(1)}", img_tag, count=1)
+    extra = ""
+    if " width=" not in img:
+        extra += f" width='{width}' height='{height}'"
+    if " loading=" not in img:
+        extra += " loading='lazy' decoding='async'"
+    img = img[:-1].rstrip("/ ") + extra + ">"
+    sources = "".join(
+        f"<source type='image/{ext}' srcset='{', '.join(f'assets/{name} {w}w' for w, name in srcset)}' sizes='{PICTURE_SIZES}'>"
+        for ext, srcset in sorted(variants["sources"].items()))
+    return f"<picture>{sources}{img}</picture>"
+
+def write_if_changed(path, text):
+    """Write text to path only if it differs, so an unchanged rebuild leaves mtimes (and .gz/.br) alone."""
+    data = text.encode("utf-8")
+    if path.exists() and path.read_bytes() == data:
+        return False
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return True
+
+def remove_stale(assets_dir, keep):
+    """Remove assets (and their .gz/.br siblings) no longer referenced by the HTML."""
+    removed = 0
+    for entry in assets_dir.iterdir():
+        name = entry.name
+        for suffix in (".gz", ".br"):
+            name = name.removesuffix(suffix)
+        if name in keep:
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry)
+        else:
+            entry.unlink()
+        removed += 1
+    return removed
+
+def _is_local(rel_path):
+    return bool(rel_path) and "://" not in rel_path and not rel_path.startswith(("data:", "#"))
+
+def local_references(text):
+    """Local asset paths referenced by text (CDN URLs and data: URIs stay as they are), as {path: attribute}."""
+    references = {}
+    for m in ASSET_PATTERN.finditer(text):
+        if m.group(1):
+            src = SRC_PATTERN.search(m.group(1))
+            rel_path, attr = (src.group(2), "src") if src else (None, None)
+        elif m.group(5):
+            href = HREF_PATTERN.search(m.group(5)) if STYLESHEET_PATTERN.search(m.group(5)) else None
+            rel_path, attr = (href.group(2), "href") if href else (None, None)
+        else:
+            rel_path, attr = m.group(4), m.group(2)
+        if _is_local(rel_path):
+            references[rel_path] = attr
+    return references
+
+def missing_references(output_dir, texts):
+    """Local src/href/data-* paths in the packaged page and fragments that don't resolve inside output_dir."""
+    missing = set()
+    for text in texts:
+        for rel_path in local_references(text):
+            if not (output_dir / rel_path).exists():
+                missing.add(rel_path)
+    return sorted(missing)
+
+def vercel_config():
+    """vercel.json: long-lived, immutable caching for assets/; the page itself is always revalidated."""
+    def rule(source, value):
+        return {"source": source, "headers": [{"key": "Cache-Control", "value": value}]}
+    return {"headers": [rule("/assets/(.*)", ASSET_CACHE_CONTROL), rule("/", PAGE_CACHE_CONTROL),
+                        rule("/index.html", PAGE_CACHE_CONTROL)]}
+
 def package_report():
     base_dir = Path.cwd()
-    output_dir = base_dir / "deploy_vercel"
+    output_dir = base_dir / OUTPUT_DIR_NAME
     assets_dir = output_dir / "assets"
-    
-    # Clean up previous build
-    if output_dir.exists():
-        shutil.rmtree(output_dir)
-    
-    output_dir.mkdir(parents=True)
-    assets_dir.mkdir()
-    
-    html_file = base_dir / "comparativo_sensibilidade.html"
+
+    html_file = base_dir / HTML_FILE
     if not html_file.exists():
         print("Erro: Relatório HTML não encontrado.")
         return
 
     with open(html_file, "r", encoding="utf-8") as f:
         content = f.read()
-        
-    # Find all images
-    # Matches src='...' or src="..."
-    images = re.findall(r"src=['\"](.*?)['\"]", content)
-    
-    new_content = content
-    
-    print(f"Encontradas {len(images)} imagens para copiar.")
-    
-    for img_rel_path in images:
-        # img_rel_path is relative to base_dir in the original HTML context
-        # e.g. "comparativo_avancado/calib_60_BRASIL.png"
-        # or "log_v3_60_noint/relatorios_finais/..."
-        
-        src_path = base_dir / img_rel_path
-        
-        if src_path.exists():
-            # Flatten filename to avoid subdirectories in assets
-            # e.g. calib_60_BRASIL.png
-            # But we might have name collisions if we flatten too much?
-            # Let's keep unique names by replacing slashes with underscores if needed, 
-            # or just use the original filename if unique.
-            # Safe approach: hash or keep structure?
-            # Vercel likes flat or simple structure.
-            # Let's replace path separators with underscores for the new filename
-            
-            # Normalize path separators
-            safe_name = str(img_rel_path).replace("/", "_").replace("\\", "_")
-            
-            dst_path = assets_dir / safe_name
-            shutil.copy2(src_path, dst_path)
-            
-            # Update HTML content
-            # We need to replace the original path with "assets/safe_name"
-            # Be careful with replace() if multiple images share substrings, but here paths are usually distinct.
-            new_content = new_content.replace(img_rel_path, f"assets/{safe_name}")
-            
-        else:
-            print(f"Aviso: Imagem não encontrada: {src_path}")
-            
-    # Save new HTML
-    with open(output_dir / "index.html", "w", encoding="utf-8") as f:
-        f.write(new_content)
-        
+
+    # Local asset paths referenced by the HTML and by its section fragments (data-src),
+    # relative to base_dir, e.g. "comparativo_avancado/calib_60_BRASIL.png"
+    references = local_references(content)
+    fragments = {}
+    for rel_path, attr in references.items():
+        if attr == "data-src" and (base_dir / rel_path).is_file():
+            fragments[rel_path] = (base_dir / rel_path).read_text(encoding="utf-8")
+    for text in fragments.values():
+        references.update(local_references(text))
+    references = set(references) - set(fragments)
+    print(f"Encontrados {len(references)} assets locais para empacotar" + (f" e {len(fragments)} fragmentos de seção." if fragments else "."))
+
+    assets_dir.mkdir(parents=True, exist_ok=True)
+    renamed, images = {}, {}
+    copied = 0
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        files = sorted(r for r in references if (base_dir / r).is_file())
+        dirs = sorted(r for r in references if (base_dir / r).is_dir())
+        for rel_path in sorted(references - set(files) - set(dirs)):
+            print(f"Aviso: Asset não encontrado: {base_dir / rel_path}")
+
+        # Identical files (same content hash) share one asset, named after the first path
+        by_digest = {}
+        for rel_path, digest in zip(files, pool.map(lambda r: file_digest(base_dir / r), files)):
+            by_digest.setdefault(digest, rel_path)
+            renamed[rel_path] = hashed_name(by_digest[digest], digest)
+        unique = sorted(set(by_digest.values()))
+        pngs = [r for r in unique if r.lower().endswith(".png")]
+        others = [r for r in unique if not r.lower().endswith(".png")]
+        copied += sum(pool.map(lambda r: copy_file(base_dir / r, assets_dir / renamed[r]), others))
+        # PNG plots: lossless recompression, WebP/AVIF and thumbnails, encoded in the pool
+        for rel_path, (variants, written) in zip(pngs, pool.map(lambda r: optimize_png(base_dir / r, Path(renamed[r]).stem, assets_dir), pngs)):
+            images[renamed[rel_path]] = variants
+            copied += written
+        # Tile folders: hashed as a whole, copied file by file
+        for rel_path in dirs:
+            renamed[rel_path] = hashed_name(rel_path, dir_digest(base_dir / rel_path, pool))
+            copied += copy_dir(base_dir / rel_path, assets_dir / renamed[rel_path], pool)
+
+        # Single pass over the HTML: <img> tags of PNG plots become <picture>, and every
+        # other src/data-tiles attribute and stylesheet href is rewritten at once
+        def rewrite(m):
+            if m.group(5):
+                href = HREF_PATTERN.search(m.group(5)) if STYLESHEET_PATTERN.search(m.group(5)) else None
+                name = renamed.get(href.group(2)) if href else None
+                if name is None:
+                    return m.group(0)
+                return HREF_PATTERN.sub(lambda h: f"href={h.group(1)}assets/{name}{h.group(1)}", m.group(5), count=1)
+            if m.group(1):
+                src = SRC_PATTERN.search(m.group(1))
+                name = renamed.get(src.group(2)) if src else None
+                if name in images:
+                    return picture_tag(m.group(1), images[name])
+                if name is None:
+                    return m.group(0)
+                return SRC_PATTERN.sub(lambda s: f"src={s.group(1)}assets/{name}{s.group(1)}", m.group(1), count=1)
+            attr, quote, rel_path = m.group(2), m.group(3), m.group(4)
+            if rel_path not in renamed:
+                return m.group(0)
+            return f"{attr}={quote}assets/{renamed[rel_path]}{quote}"
+        # Section fragments: rewritten like the page, then named after the hash of the result
+        packaged = {}
+        for rel_path, text in fragments.items():
+            text = packaged[rel_path] = ASSET_PATTERN.sub(rewrite, text)
+            digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()[:HASH_LENGTH]
+            renamed[rel_path] = f"{Path(rel_path).name.split('.')[0]}.{digest}.html"
+            if not (assets_dir / renamed[rel_path]).exists():
+                _write_bytes(assets_dir / renamed[rel_path], text.encode("utf-8"))
+                copied += 1
+        new_content = ASSET_PATTERN.sub(rewrite, content)
+        # Every local reference of the package must point at a file it ships
+        missing = missing_references(output_dir, [new_content] + list(packaged.values()))
+
+        keep = set(renamed.values()) | {name for variants in images.values() for name in _variant_names(variants)}
+        removed = remove_stale(assets_dir, keep)
+        html_changed = write_if_changed(output_dir / "index.html", new_content)
+        write_if_changed(output_dir / "vercel.json", json.dumps(vercel_config(), indent=2) + "\n")
+
+        text_files = [output_dir / "index.html"] + [p for p in assets_dir.rglob("*")
+                                                    if p.is_file() and p.suffix in COMPRESSIBLE_SUFFIXES]
+        compressed = sum(pool.map(compress_file, text_files))
+
     print(f"Pacote criado com sucesso em: {output_dir}")
     print("Conteúdo:")
-    print(f" - index.html")
-    print(f" - assets/ ({len(list(assets_dir.glob('*')))} arquivos)")
+    print(f" - index.html ({'atualizado' if html_changed else 'sem mudanças'}) e vercel.json (assets em cache por 1 ano)")
+    print(f" - assets/ ({len(renamed)} referenciados, {len(set(renamed.values()))} distintos: {copied} arquivos novos, {removed} removidos)")
+    print(f" - {len(images)} imagens PNG otimizadas (PNG sem perdas, WebP/AVIF e miniaturas de {THUMB_WIDTH}px)")
+    print(f" - {compressed} arquivos pré-comprimidos ({'.gz e .br' if brotli is not None else '.gz; instale brotli para .br'})")
+    for rel_path in missing:
+        print(f"Aviso: index.html referencia um arquivo que não está no pacote: {rel_path}")
+    if not missing:
+        print(" - todas as referências locais (src, href, data-tiles, data-src) resolvem dentro do pacote")
 
 if __name__ == "__main__":
     package_report()
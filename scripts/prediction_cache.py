@@ -0,0 +1,74 @@
+"""
+Cache das predições de teste de cada run em Arrow IPC (Feather v2) sem compressão.
+
+A primeira avaliação de um run lê o output_final_master.geoparquet uma vez e
+grava o recorte (ID, FCU, prob_fcu_*) das linhas de teste em
+CACHE_DIR/<pasta>.arrow. As passadas seguintes (métricas, bootstrap,
+calibração, diff) abrem o arquivo por memory map: sem compressão, as colunas
+Arrow apontam direto para as páginas do arquivo (zero-copy), e processos
+diferentes que abrem o mesmo run compartilham essas páginas pelo cache do
+sistema operacional, sem cópia por processo.
+
+O arquivo guarda nos metadados do schema o (mtime, tamanho) do master e o
+digest dos IDs de teste; se qualquer um mudar, o recorte é refeito.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Relativo ao BASE_DIR de cada script
+CACHE_DIR = Path("comparativo_avancado") / "cache_predictions"
+METADATA_KEY = b"preditor_fcu.prediction_cache"
+
+def cache_path(base_dir, folder):
+    return Path(base_dir) / CACHE_DIR / f"{folder}.arrow"
+
+def ids_digest(test_ids):
+    """Digest dos IDs de teste (texto), independente da ordem."""
+    ids = np.unique(np.asarray(test_ids, dtype=str))
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\n".join(ids).encode("utf-8"))
+    return h.hexdigest()
+
+def _signature(master_path, digest):
+    stat = Path(master_path).stat()
+    return {"master": Path(master_path).name, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "ids": digest}
+
+def _stored_signature(path):
+    try:
+        with pa.memory_map(str(path), "r") as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    raw = metadata.get(METADATA_KEY)
+    return json.loads(raw) if raw else None
+
+def ensure(base_dir, folder, master_path, digest, read):
+    """
+    Caminho do cache do run, refazendo-o com read() (que retorna a pa.Table
+    do recorte de teste) quando o master ou os IDs de teste mudaram.
+    """
+    path = cache_path(base_dir, folder)
+    signature = _signature(master_path, digest)
+    if path.exists() and _stored_signature(path) == signature:
+        return path
+    table = read()
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps(signature).encode("utf-8")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    feather.write_feather(table.replace_schema_metadata(metadata), tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    return path
+
+def open_table(path, columns=None):
+    """pa.Table do cache por memory map (zero-copy); columns restringe às colunas presentes."""
+    table = feather.read_table(path, memory_map=True)
+    if columns is None:
+        return table
+    return table.select([name for name in columns if name in table.column_names])
@@ -0,0 +1,222 @@
+"""
+Diferenças de predição entre runs, setor a setor, a partir dos masters.
+
+Os output_final_master.geoparquet de todos os runs comparados são alinhados
+pelo ID uma única vez: os IDs de cada run viram chaves int64 (id_index.py),
+as chaves ordenadas dos runs são intersectadas (merge ordenado) e cada run
+guarda só as posições das suas linhas comuns. Depois, cada coluna prob_fcu_*
+é lida sozinha (sem geometria) e reordenada por essas posições, então a
+memória é a de uma coluna decodificada por run, não a de um GeoDataFrame por
+run. Do master (Parquet) a coluna é decodificada inteira em memória; só o
+cache Arrow de --test-set é aberto por memory map, sem cópia.
+
+Para cada par de runs e escopo saem: delta de probabilidade por setor (média,
+média absoluta, p95 e máximo), deslocamento de posição no ranking, fração do
+top-k% compartilhada e os setores que mais mudaram.
+
+Por padrão compara, em cada threshold, o run com interações ao sem
+interações (os pares da Tabela 5); com --runs, cada pasta contra a primeira.
+Com --test-set, compara só as linhas de teste, a partir do cache Arrow de
+predições (prediction_cache.py) gravado por advanced_evaluation.py.
+"""
+import argparse
+import sys
+from functools import reduce
+from pathlib import Path
+
+import run_registry
+
+# numpy, pandas, pyarrow e os módulos de IDs/cache são importados dentro das
+# funções que os usam: `-h` (e `cli.py diff -h`) não carrega nada pesado.
+
+# Configuração
+BASE_DIR = run_registry.BASE_DIR.resolve()
+OUTPUT_DIR = BASE_DIR / "comparativo_avancado"
+SUMMARY_FILE = "prediction_diff_summary.csv"
+MOVERS_FILE = "prediction_diff_movers.csv"
+
+PROB_PREFIX = "prob_fcu_"
+TOP_K_PERCENT = 1
+N_MOVERS = 10
+
+def _read_column(path, column):
+    """
+    Uma coluna de um master (Parquet: o arquivo é mapeado, mas a coluna é
+    decodificada inteira em memória) ou de um cache de predições (.arrow, por
+    memory map, sem cópia).
+    """
+    import pyarrow.parquet as pq
+    import prediction_cache
+    if Path(path).suffix == ".arrow":
+        return prediction_cache.open_table(path, [column])[column]
+    return pq.read_table(path, columns=[column], memory_map=True)[column]
+
+def _column_names(path):
+    import pyarrow.parquet as pq
+    import prediction_cache
+    if Path(path).suffix == ".arrow":
+        return prediction_cache.open_table(path).column_names
+    return pq.read_schema(path).names
+
+def _read_ids(master_path):
+    """Coluna ID de um master (inteira, ou texto sem espaços nas pontas)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    ids = _read_column(master_path, "ID")
+    if pa.types.is_integer(ids.type):
+        return ids.to_numpy()
+    return pc.utf8_trim_whitespace(pc.cast(ids, pa.string())).to_numpy(zero_copy_only=False)
+
+def align_runs(master_paths):
+    """
+    Alinha os masters {run: caminho} pelo ID. Retorna (IDs comuns, {run:
+    posições das linhas comuns no master}), na ordem das chaves codificadas.
+    """
+    import numpy as np
+    import id_index
+    raw = {run: _read_ids(path) for run, path in master_paths.items()}
+    index = id_index.build_scope_index(raw)
+    common = reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), index["keys"].values())
+    positions = {}
+    for run, ids in raw.items():
+        keys = id_index.encode_ids(ids, index)
+        order = np.argsort(keys, kind="stable")
+        positions[run] = order[np.searchsorted(keys[order], common)]
+    first = next(iter(raw))
+    return raw[first][positions[first]].astype(str), positions
+
+def read_prob(master_path, column, positions):
+    """Uma coluna de probabilidade do master, reordenada pelas posições do alinhamento."""
+    import numpy as np
+    values = _read_column(master_path, column).to_numpy()
+    return np.asarray(values, dtype=float)[positions]
+
+def _ranks(p):
+    """Posição de cada setor (1 = maior probabilidade), empates pela ordem do alinhamento."""
+    import numpy as np
+    ranks = np.empty(p.size, dtype=np.int64)
+    ranks[np.argsort(-p, kind="stable")] = np.arange(1, p.size + 1)
+    return ranks
+
+def diff_pair(ids, p_a, p_b, k_percent=TOP_K_PERCENT, n_movers=N_MOVERS):
+    """
+    Compara as probabilidades alinhadas de dois runs (setores com as duas
+    predições). Retorna (dict de resumo, DataFrame dos maiores deslocamentos),
+    ou (None, None) sem setores em comum.
+    """
+    import numpy as np
+    import pandas as pd
+    valid = ~(np.isnan(p_a) | np.isnan(p_b))
+    ids, p_a, p_b = ids[valid], p_a[valid], p_b[valid]
+    n = p_a.size
+    if n == 0:
+        return None, None
+    delta = p_b - p_a
+    abs_delta = np.abs(delta)
+    rank_a, rank_b = _ranks(p_a), _ranks(p_b)
+    k = max(1, int(n * k_percent / 100))
+
+    summary = {
+        "N": n,
+        "Mean Delta": delta.mean(),
+        "Mean Abs Delta": abs_delta.mean(),
+        "P95 Abs Delta": np.percentile(abs_delta, 95),
+        "Max Abs Delta": abs_delta.max(),
+        "Mean Abs Rank Shift (%)": np.abs(rank_b - rank_a).mean() / n * 100,
+        f"Top-{k_percent:g}% Overlap": np.count_nonzero((rank_a <= k) & (rank_b <= k)) / k,
+    }
+
+    top = np.argpartition(-abs_delta, min(n_movers, n) - 1)[:n_movers]
+    top = top[np.argsort(-abs_delta[top], kind="stable")]
+    movers = pd.DataFrame({"ID": ids[top], "Prob A": p_a[top], "Prob B": p_b[top], "Delta": delta[top],
+                           "Rank A": rank_a[top], "Rank B": rank_b[top]})
+    return summary, movers
+
+def diff_runs(master_paths, pairs, k_percent=TOP_K_PERCENT, n_movers=N_MOVERS):
+    """
+    Compara os pares [(run_a, run_b)] em todas as colunas prob_fcu_* comuns
+    aos masters {run: caminho}. Retorna (resumo, maiores deslocamentos).
+    """
+    import pandas as pd
+    ids, positions = align_runs(master_paths)
+    names = {run: set(_column_names(path)) for run, path in master_paths.items()}
+    first = next(iter(master_paths))
+    columns = [c for c in _column_names(master_paths[first])
+               if c.startswith(PROB_PREFIX) and all(c in run_names for run_names in names.values())]
+
+    summary_rows, mover_frames = [], []
+    for column in columns:
+        scope = column[len(PROB_PREFIX):].replace("_", " ")
+        probs = {run: read_prob(path, column, positions[run]) for run, path in master_paths.items()}
+        for run_a, run_b in pairs:
+            summary, movers = diff_pair(ids, probs[run_a], probs[run_b], k_percent, n_movers)
+            if summary is None:
+                continue
+            summary_rows.append({"Run A": run_a, "Run B": run_b, "Scope": scope, **summary})
+            movers.insert(0, "Scope", scope)
+            movers.insert(0, "Run B", run_b)
+            movers.insert(0, "Run A", run_a)
+            mover_frames.append(movers)
+    return pd.DataFrame(summary_rows), (pd.concat(mover_frames, ignore_index=True) if mover_frames else pd.DataFrame())
+
+def select_pairs(registry, folders=None):
+    """
+    Pares [(rótulo A, rótulo B)] a comparar, só com runs que têm master: as
+    pastas pedidas (cada uma contra a primeira) ou, por padrão, os pares
+    com/sem interações de cada threshold.
+    """
+    with_master = {run["folder"]: run["label"] for run in registry if run["has_master"]}
+    if folders:
+        missing = [folder for folder in folders if folder not in with_master]
+        for folder in missing:
+            print(f"Run sem output_final_master em {BASE_DIR}: {folder}")
+        labels = [with_master[folder] for folder in folders if folder in with_master]
+        return [(labels[0], label) for label in labels[1:]]
+    labels = set(with_master.values())
+    return [(run_std, run_noint) for _, run_std, run_noint in run_registry.interaction_pairs(registry)
+            if run_std in labels and run_noint in labels]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Diferenças de predição setor a setor entre runs (output_final_master).")
+    parser.add_argument("--runs", nargs="+", metavar="PASTA",
+                        help="Pastas log_v3_* a comparar, cada uma contra a primeira (padrão: pares com/sem interações).")
+    parser.add_argument("--top-k-percent", type=float, default=TOP_K_PERCENT,
+                        help="Tamanho do top-k usado na sobreposição, em %% dos setores.")
+    parser.add_argument("--movers", type=int, default=N_MOVERS,
+                        help="Setores com maior |delta| listados por par e escopo.")
+    parser.add_argument("--test-set", action="store_true",
+                        help="Compara só as linhas de teste, lidas do cache de predições de advanced_evaluation.py.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    import prediction_cache
+    registry = run_registry.load_registry(BASE_DIR)
+    pairs = select_pairs(registry, args.runs)
+    if not pairs:
+        print("Nenhum par de runs com output_final_master para comparar.")
+        return 1
+
+    folder_of = {run["label"]: run["folder"] for run in registry}
+    runs = list(dict.fromkeys(run for pair in pairs for run in pair))
+    summary_file, movers_file = SUMMARY_FILE, MOVERS_FILE
+    if args.test_set:
+        master_paths = {run: prediction_cache.cache_path(BASE_DIR, folder_of[run]) for run in runs}
+        missing = [run for run, path in master_paths.items() if not path.exists()]
+        if missing:
+            print(f"Cache de predições ausente para {', '.join(missing)}; rode advanced_evaluation.py antes.")
+            return 1
+        summary_file, movers_file = (name.replace(".csv", "_test.csv") for name in (SUMMARY_FILE, MOVERS_FILE))
+    else:
+        master_paths = {run: BASE_DIR / folder_of[run] / run_registry.MASTER_FILE for run in runs}
+    print(f"Comparando {len(pairs)} pares de runs ({len(runs)} {'caches de teste' if args.test_set else 'masters'})...")
+    summary, movers = diff_runs(master_paths, pairs, args.top_k_percent, args.movers)
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    summary.to_csv(OUTPUT_DIR / summary_file, index=False)
+    movers.to_csv(OUTPUT_DIR / movers_file, index=False)
+    print(f"Resumo salvo em {summary_file}; maiores deslocamentos em {movers_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Métricas de ranking em uma única passada (NumPy).
+
+Para cada par (run, escopo) as predições são ordenadas uma única vez
+(argsort decrescente estável) e acumuladas uma única vez (cumsum dos
+positivos). Dessa passada saem AUPRC, Average Precision, AUC ROC, Brier,
+Recall@k / Precision@k para qualquer lista de k e a curva de ganho/lift.
+
+batched_ranking_metrics aplica a mesma passada a uma matriz de pesos
+(n linhas x B reamostragens), para o bootstrap.
+
+Os valores reproduzem precision_recall_curve + auc, average_precision_score,
+roc_auc_score e brier_score_loss do sklearn, e o sort_values(kind="stable")
++ head(k) do pandas usado em calculate_recall_at_k / calculate_precision_at_k.
+Empates de score no corte k são resolvidos pela ordem original das linhas
+(ordenação estável, nos dois lados). Os testes em tests/test_ranking_metrics.py
+conferem essa equivalência, com empates e pesos.
+"""
+import warnings
+import numpy as np
+
+# np.trapz foi renomeado para np.trapezoid no NumPy 2.0
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+def rank_order(y_prob):
+    """Índices que ordenam y_prob de forma decrescente e estável."""
+    return np.argsort(-np.asarray(y_prob, dtype=float), kind="stable")
+
+def threshold_counts(y_sorted, p_sorted):
+    """
+    Verdadeiros e falsos positivos acumulados em cada threshold distinto,
+    a partir de y/scores já ordenados de forma decrescente.
+    """
+    tp_cum = np.cumsum(y_sorted)
+    distinct = np.r_[np.flatnonzero(np.diff(p_sorted)), p_sorted.size - 1]
+    tps = tp_cum[distinct]
+    fps = 1 + distinct - tps
+    return tp_cum, tps, fps
+
+def _precision_recall(tps, fps):
+    precision = tps / (tps + fps)
+    if tps[-1] == 0:
+        warnings.warn("Nenhum positivo em y_true; recall definido como 1 em todos os thresholds.")
+        recall = np.ones_like(tps, dtype=float)
+    else:
+        recall = tps / tps[-1]
+    # Mesma convenção do sklearn: recall decrescente terminando em (0, 1)
+    return np.r_[precision[::-1], 1.0], np.r_[recall[::-1], 0.0]
+
+def _roc_auc(tps, fps):
+    if tps[-1] == 0 or fps[-1] == 0:
+        return np.nan
+    tpr = np.r_[0.0, tps / tps[-1]]
+    fpr = np.r_[0.0, fps / fps[-1]]
+    return float(_trapezoid(tpr, fpr))
+
+def _k_from_percent(n, k_percent):
+    return int(n * (k_percent / 100))
+
+def compute_ranking_metrics(y_true, y_prob, k_percents=(1.0, 5.0), curve_points=100):
+    """
+    Calcula as métricas de ranking de um par (run, escopo) numa única passada.
+
+    Retorna um dict com n, positives, auprc, average_precision, auc_roc, brier,
+    recall_at_k / precision_at_k ({k_percent: valor}) e gain_curve, um dict de
+    arrays (pct, gain, lift) com curve_points pontos entre 0% e 100% da lista.
+    """
+    y = np.asarray(y_true, dtype=float)
+    p = np.asarray(y_prob, dtype=float)
+    n = y.size
+
+    order = rank_order(p)
+    y_sorted = y[order]
+    p_sorted = p[order]
+    tp_cum, tps, fps = threshold_counts(y_sorted, p_sorted)
+    total_pos = tp_cum[-1]
+
+    precision, recall = _precision_recall(tps, fps)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall_at_k = {}
+        precision_at_k = {}
+        for k_percent in k_percents:
+            k = _k_from_percent(n, k_percent)
+            if k == 0:
+                recall_at_k[k_percent] = 0.0
+                precision_at_k[k_percent] = 0.0
+                continue
+            recall_at_k[k_percent] = float(tp_cum[k - 1] / total_pos)
+            precision_at_k[k_percent] = float(tp_cum[k - 1] / k)
+
+        pct = np.arange(1, curve_points + 1) * (100.0 / curve_points)
+        k_curve = (n * (pct / 100)).astype(int)
+        hits = np.where(k_curve > 0, tp_cum[np.maximum(k_curve - 1, 0)], 0.0)
+        gain = hits / total_pos
+        lift = np.where(k_curve > 0, hits / np.maximum(k_curve, 1), 0.0) / (total_pos / n)
+
+    return {
+        "n": n,
+        "positives": float(total_pos),
+        "auprc": float(-_trapezoid(precision, recall)),
+        "average_precision": float(-np.sum(np.diff(recall) * precision[:-1])),
+        "auc_roc": _roc_auc(tps, fps),
+        "brier": float(np.mean((p - y) ** 2)),
+        "recall_at_k": recall_at_k,
+        "precision_at_k": precision_at_k,
+        "gain_curve": {"pct": pct, "gain": gain, "lift": lift},
+    }
+
+def batched_ranking_metrics(y_true, y_prob, weights):
+    """
+    AUC ROC, AUPRC e Brier de B reamostragens de uma só vez.
+
+    weights é uma matriz (n x B) de contagens: a coluna b equivale a repetir a
+    observação i weights[i, b] vezes (coluna de uns = conjunto original). A
+    ordenação é feita uma vez e cada reamostragem vira uma coluna dos cumsums
+    de positivos e de pesos; as somas dos trapézios são produtos escalares
+    entre linhas deslocadas desses cumsums, sem matrizes intermediárias de
+    diferenças. Retorna um dict de arrays (B,).
+    """
+    y = np.asarray(y_true, dtype=float)
+    p = np.asarray(y_prob, dtype=float)
+    weights = np.asarray(weights, dtype=float).reshape(y.size, -1)
+
+    order = rank_order(p)
+    ends = np.flatnonzero(np.diff(p[order]))
+
+    # Pesos dos positivos e cumsums por linha, na ordem decrescente de score
+    total = weights[order]
+    positives = total * y[order][:, None]
+    np.cumsum(total, axis=0, out=total)
+    tp = np.cumsum(positives, axis=0)
+    if ends.size < y.size - 1:
+        # Empates: apenas o fim de cada grupo de score é um threshold
+        ends = np.r_[ends, y.size - 1]
+        tp = tp[ends]
+        total = total[ends]
+        positives = np.diff(tp, axis=0, prepend=0)
+
+    tp_total = tp[-1]
+    fp_total = total[-1] - tp_total
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Trapézios da curva ROC: sum (fp_g - fp_g-1)(tp_g + tp_g-1) telescopa
+        # em TP*FP + sum(total_g tp_g-1) - sum(total_g-1 tp_g)
+        cross = np.einsum("ij,ij->j", total[1:], tp[:-1]) - np.einsum("ij,ij->j", total[:-1], tp[1:])
+        auc_roc = (tp_total * fp_total + cross) / (2 * tp_total * fp_total)
+
+        # Trapézios da curva PR, partindo de (recall 0, precision 1) como no sklearn.
+        # Thresholds ainda sem peso sorteado ficam com precision 1.
+        precision = np.ones_like(tp)
+        np.divide(tp, total, out=precision, where=total > 0)
+        area = (np.einsum("ij,ij->j", positives, precision)
+                + np.einsum("ij,ij->j", positives[1:], precision[:-1]) + positives[0])
+        auprc = area / (2 * tp_total)
+
+        brier = (((p - y) ** 2) @ weights) / weights.sum(axis=0)
+
+    return {"auc_roc": auc_roc, "auprc": auprc, "brier": brier}
@@ -0,0 +1,187 @@
+"""
+Registro dos runs de sensibilidade, descoberto a partir das pastas de log.
+
+Varre BASE_DIR atrás de pastas log_v3_<thresh>_<variante> e lê, em paralelo,
+os metadados de cada run: threshold de correlação e variante (std = com
+interações, noint = sem interações). Quando a pasta traz um arquivo de
+configuração (METADATA_FILES) os valores vêm dele; senão, do nome da pasta.
+O resultado fica num manifesto em cache, refeito só quando a listagem das
+pastas muda, e substitui as listas de runs escritas à mão nos scripts.
+
+Ordem e rótulos seguem a convenção dos relatórios: primeiro os runs com
+interações, depois os sem, com thresholds decrescentes; "Run N (0.95, Std)".
+
+Só usa a biblioteca padrão, para que listar os runs seja rápido.
+"""
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Configuração: pasta com os log_v3_* e comparativo_avancado/. Os scripts
+# (cli.py, consolidate_results.py, advanced_evaluation.py, ...) usam este valor.
+BASE_DIR = Path(r"C:\Users\adirs\Downloads\preditor_fcu-20251203T221625Z-1-001\preditor_fcu_v3")
+
+# Relativo ao BASE_DIR de cada script
+CACHE_FILE = Path("comparativo_avancado") / "cache_runs" / "run_registry.json"
+MANIFEST_VERSION = 1
+
+RUN_FOLDER_PATTERN = re.compile(r"^log_v3_(\d+)_([A-Za-z0-9]+)$")
+
+# Arquivos de configuração procurados na raiz da pasta do run, em ordem
+METADATA_FILES = ("run_config.json", "config.json", "metadata.json")
+THRESHOLD_KEYS = ("corr_threshold", "correlation_threshold", "threshold")
+VARIANT_KEYS = ("variant",)
+INTERACTION_KEYS = ("interactions", "use_interactions")
+
+VARIANT_LABELS = {"std": "Std", "noint": "NoInt"}
+VARIANT_ORDER = {"std": 0, "noint": 1}
+
+MASTER_FILE = Path("output_final") / "output_final_master.geoparquet"
+
+def _read_metadata(run_dir):
+    for name in METADATA_FILES:
+        path = run_dir / name
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        if isinstance(data, dict):
+            return data, name
+    return {}, None
+
+def _first(data, keys):
+    return next((data[key] for key in keys if data.get(key) is not None), None)
+
+def scan_run(run_dir):
+    """Metadados de uma pasta de run (None se o nome não seguir o padrão)."""
+    match = RUN_FOLDER_PATTERN.match(run_dir.name)
+    if not match:
+        return None
+    threshold = int(match.group(1)) / 100
+    variant = match.group(2).lower()
+    source = "folder"
+
+    data, metadata_file = _read_metadata(run_dir)
+    meta_threshold = _first(data, THRESHOLD_KEYS)
+    if meta_threshold is not None:
+        meta_threshold = float(meta_threshold)
+        # Aceita 0.95 ou 95
+        threshold = meta_threshold / 100 if meta_threshold > 1 else meta_threshold
+        source = metadata_file
+    meta_variant = _first(data, VARIANT_KEYS)
+    meta_interactions = _first(data, INTERACTION_KEYS)
+    if meta_variant is not None:
+        variant = str(meta_variant).lower()
+        source = metadata_file
+    elif meta_interactions is not None:
+        variant = "std" if meta_interactions else "noint"
+        source = metadata_file
+
+    return {
+        "folder": run_dir.name,
+        "threshold": threshold,
+        "variant": variant,
+        "interactions": variant != "noint",
+        "has_master": (run_dir / MASTER_FILE).exists(),
+        "source": source,
+    }
+
+def _run_dirs(base_dir):
+    try:
+        entries = list(os.scandir(base_dir))
+    except FileNotFoundError:
+        return []
+    return sorted((entry for entry in entries if entry.is_dir() and RUN_FOLDER_PATTERN.match(entry.name)),
+                  key=lambda entry: entry.name)
+
+def listing_signature(base_dir):
+    """(pasta, mtime da pasta, mtime de output_final) de cada pasta de run."""
+    signature = []
+    for entry in _run_dirs(base_dir):
+        try:
+            output_mtime = os.stat(os.path.join(entry.path, "output_final")).st_mtime_ns
+        except FileNotFoundError:
+            output_mtime = None
+        signature.append([entry.name, entry.stat().st_mtime_ns, output_mtime])
+    return signature
+
+def _sort_key(run):
+    return (VARIANT_ORDER.get(run["variant"], len(VARIANT_ORDER)), run["variant"], -run["threshold"], run["folder"])
+
+def _label(index, run):
+    variant = VARIANT_LABELS.get(run["variant"], run["variant"].title())
+    return f"Run {index} ({run['threshold']:.2f}, {variant})"
+
+def load_registry(base_dir, refresh=False, workers=None):
+    """
+    Lista de runs (dicts com folder, label, threshold, variant, interactions,
+    has_master, source), na ordem dos relatórios. Usa o manifesto em cache
+    enquanto a listagem das pastas não mudar.
+    """
+    base_dir = Path(base_dir)
+    cache_path = base_dir / CACHE_FILE
+    signature = listing_signature(base_dir)
+
+    if not refresh and cache_path.exists():
+        try:
+            manifest = json.loads(cache_path.read_text(encoding="utf-8"))
+            if manifest.get("version") == MANIFEST_VERSION and manifest.get("signature") == signature:
+                return manifest["runs"]
+        except (OSError, ValueError):
+            pass
+
+    run_dirs = [base_dir / name for name, _, _ in signature]
+    with ThreadPoolExecutor(max_workers=workers or min(32, max(1, len(run_dirs)))) as pool:
+        runs = [run for run in pool.map(scan_run, run_dirs) if run is not None]
+    runs.sort(key=_sort_key)
+    for index, run in enumerate(runs, 1):
+        run["label"] = _label(index, run)
+
+    if base_dir.exists():
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"version": MANIFEST_VERSION, "signature": signature, "runs": runs},
+                                       ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    return runs
+
+def run_pairs(runs):
+    """[(rótulo, pasta)] no formato das antigas listas RUNS."""
+    return [(run["label"], run["folder"]) for run in runs]
+
+def interaction_pairs(runs):
+    """
+    [(threshold, rótulo com interações, rótulo sem interações)] para cada
+    threshold que tem as duas variantes, em ordem decrescente de threshold.
+    """
+    by_threshold = {}
+    for run in runs:
+        if run["variant"] in ("std", "noint"):
+            by_threshold.setdefault(run["threshold"], {})[run["variant"]] = run["label"]
+    return [(f"{threshold:.2f}", pair["std"], pair["noint"])
+            for threshold, pair in sorted(by_threshold.items(), reverse=True)
+            if "std" in pair and "noint" in pair]
+
+def match_calibration_image(runs, filename):
+    """
+    (run, escopo) de uma figura calib_<thresh>_<variante>_<escopo>.png. Nomes
+    antigos, sem variante (calib_<thresh>_<escopo>.png), só são atribuídos
+    quando um único run avaliado tem aquele threshold; senão retorna (None, None).
+    """
+    match = re.match(r"^calib_(\d+)_(.+)\.png$", filename)
+    if not match:
+        return None, None
+    threshold = int(match.group(1)) / 100
+    rest = match.group(2)
+    candidates = [run for run in runs if abs(run["threshold"] - threshold) < 1e-9]
+    for run in candidates:
+        prefix = f"{run['variant']}_"
+        if rest.lower().startswith(prefix):
+            return run, rest[len(prefix):].replace("_", " ")
+    evaluated = [run for run in candidates if run["has_master"]]
+    if len(evaluated) == 1:
+        return evaluated[0], rest.replace("_", " ")
+    return None, None
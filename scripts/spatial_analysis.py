@@ -0,0 +1,304 @@
+"""
+Diagnóstico espacial dos resíduos (y - p) das predições de teste.
+
+Os centróides dos setores de teste saem das geometrias (WKB) do
+output_final_master.geoparquet, decodificadas em lote pelo shapely: do master
+nacional só se leem a coluna ID e a geometria dos row groups que contêm
+setores de teste. A matriz
+de vizinhança é de k vizinhos mais próximos, montada com uma KD-tree sobre os
+centróides (em coordenadas 3D na esfera quando o CRS é geográfico) direto
+numa matriz esparsa padronizada por linha, sem distâncias par a par O(n²).
+
+Para cada escopo os pesos são montados uma vez, sobre as linhas de teste
+comuns a todos os runs, e valem para todos eles:
+
+- Moran global dos resíduos, com pseudo p-valor por permutação (as
+  permutações de todos os runs saem de um mesmo produto esparso W @ Z);
+- Moran local (LISA) de cada setor, com z da randomização condicional e o
+  quadrante (HH, LL, HL, LH);
+- AUC, AUPRC e resíduo médio por célula do grid de criar_grid_espacial, com
+  o centróide médio da célula, para os mapas de resíduo do relatório
+  (residual_map_svg, SVG inline sem dependências).
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import id_index
+import prediction_cache
+import ranking_metrics
+
+KNN_K = 8
+PERMUTATIONS = 99
+PERMUTATION_SEED = 12345
+# Colunas (n x permutações x runs) por bloco no produto W @ Z permutado
+PERMUTATION_BLOCK_ELEMENTS = 1 << 24
+LISA_Z = 1.96
+
+MORAN_COLUMNS = ["Run", "Scope", "N", "K", "Moran I", "Expected I", "Z (perm)", "P (perm)", "Permutations",
+                 "HH", "LL", "HL", "LH"]
+CELL_COLUMNS = ["Run", "Scope", "Cell", "X", "Y", "N", "Positives", "Mean Residual", "AUC", "AUPRC"]
+
+def _is_geographic(master_path):
+    """True se o CRS da coluna geometry for geográfico (ou ausente, que no GeoParquet é OGC:CRS84)."""
+    metadata = pq.read_schema(master_path).metadata or {}
+    try:
+        column = json.loads(metadata[b"geo"])["columns"]["geometry"]
+    except (KeyError, ValueError):
+        return True
+    crs = column.get("crs")
+    if crs is None:
+        return True
+    if isinstance(crs, dict):
+        return crs.get("type") == "GeographicCRS"
+    return any(code in str(crs) for code in ("4326", "4674", "CRS84"))
+
+def read_geometry_rows(master_path, rows):
+    """
+    WKB das linhas rows do master, lendo só os row groups que as contêm.
+    Retorna um array de bytes na ordem de rows.
+    """
+    parquet = pq.ParquetFile(master_path, memory_map=True)
+    sizes = [parquet.metadata.row_group(i).num_rows for i in range(parquet.metadata.num_row_groups)]
+    starts = np.r_[0, np.cumsum(sizes)]
+    groups = np.unique(np.searchsorted(starts, rows, side="right") - 1)
+    column = parquet.read_row_groups(groups.tolist(), columns=["geometry"])["geometry"]
+    # Posição de cada linha dentro dos row groups lidos
+    offsets = np.r_[0, np.cumsum(np.asarray(sizes)[groups])]
+    group_of = np.searchsorted(starts, rows, side="right") - 1
+    local = offsets[np.searchsorted(groups, group_of)] + rows - starts[group_of]
+    return column.take(pa.array(local)).to_numpy(zero_copy_only=False)
+
+def read_centroids(master_path, keys, index):
+    """
+    Centróides (x, y) dos setores de chaves int64 keys (id_index), lidos da
+    geometria do master: só a coluna ID inteira e a geometria dos row groups
+    com setores pedidos (read_geometry_rows). Retorna (chaves ordenadas
+    encontradas, xy, geográfico?).
+    """
+    import shapely
+    ids = pq.read_table(master_path, columns=["ID"], memory_map=True)["ID"]
+    ids = ids.to_numpy() if pa.types.is_integer(ids.type) else np.char.strip(ids.to_numpy(zero_copy_only=False).astype(str))
+    sector_keys = id_index.encode_ids(ids, index)
+    wanted = id_index.member_mask(sector_keys, np.unique(keys))
+    rows = np.flatnonzero(wanted)
+    rows = rows[np.unique(sector_keys[rows], return_index=True)[1]]
+    geometry = shapely.from_wkb(read_geometry_rows(master_path, rows))
+    xy = shapely.get_coordinates(shapely.centroid(geometry))
+    return sector_keys[rows], xy, _is_geographic(master_path)
+
+def _tree_coordinates(xy, geographic):
+    """Coordenadas para a KD-tree: vetores unitários 3D (lon/lat) ou o próprio plano."""
+    if not geographic:
+        return xy
+    lon, lat = np.radians(xy[:, 0]), np.radians(xy[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def knn_weights(xy, k=KNN_K, geographic=False):
+    """Matriz esparsa (CSR) de k vizinhos mais próximos, padronizada por linha."""
+    from scipy.sparse import csr_matrix
+    from scipy.spatial import cKDTree
+    n = xy.shape[0]
+    k = min(k, n - 1)
+    if k < 1:
+        return csr_matrix((n, n))
+    coords = _tree_coordinates(xy, geographic)
+    # k + 1: o vizinho mais próximo de cada ponto é ele mesmo
+    _, neighbors = cKDTree(coords).query(coords, k=k + 1)
+    rows = np.repeat(np.arange(n), k + 1)
+    cols = neighbors.ravel()
+    keep = cols != rows
+    rows, cols = rows[keep], cols[keep]
+    # Pontos coincidentes podem deixar o próprio ponto fora da lista: corta em k por linha
+    first = np.r_[0, np.flatnonzero(np.diff(rows)) + 1]
+    position = np.arange(rows.size) - np.repeat(first, np.diff(np.r_[first, rows.size]))
+    keep = position < k
+    rows, cols = rows[keep], cols[keep]
+    return csr_matrix((np.full(rows.size, 1.0 / k), (rows, cols)), shape=(n, n))
+
+def global_moran(z, weights, permutations=PERMUTATIONS, seed=PERMUTATION_SEED,
+                 block_elements=PERMUTATION_BLOCK_ELEMENTS):
+    """
+    Moran global de cada coluna de z (n x runs, já centrada), com pesos
+    padronizados por linha. Retorna (I, z da permutação, pseudo p-valor), um
+    valor por coluna. Todas as colunas usam as mesmas permutações.
+    """
+    n, n_runs = z.shape
+    denominator = np.einsum("ij,ij->j", z, z)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        moran = np.einsum("ij,ij->j", z, weights @ z) / denominator
+    if permutations <= 0:
+        return moran, np.full(n_runs, np.nan), np.full(n_runs, np.nan)
+
+    rng = np.random.default_rng(seed)
+    block = max(1, block_elements // max(n * n_runs, 1))
+    simulated = []
+    for start in range(0, permutations, block):
+        size = min(block, permutations - start)
+        perms = np.stack([rng.permutation(n) for _ in range(size)])
+        zp = z[perms.T].reshape(n, size * n_runs)
+        lag = (weights @ zp).reshape(n, size, n_runs)
+        simulated.append(np.einsum("ipr,ipr->pr", zp.reshape(n, size, n_runs), lag))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        simulated = np.concatenate(simulated) / denominator
+        larger = np.count_nonzero(simulated >= moran, axis=0)
+        larger = np.minimum(larger, permutations - larger)
+        p_value = (larger + 1) / (permutations + 1)
+        z_score = (moran - simulated.mean(axis=0)) / simulated.std(axis=0, ddof=1)
+    return moran, z_score, p_value
+
+def local_moran(z, weights):
+    """
+    Moran local de cada linha de z (n x runs, já centrada). Retorna (I_i,
+    z da randomização condicional, quadrante), cada um n x runs. O z usa a
+    esperança e a variância exatas de I_i quando os vizinhos de i são
+    sorteados dentre os demais setores (Sokal et al., 1998). Quadrante:
+    "HH", "LL", "HL" ou "LH" (resíduo do setor x média dos vizinhos).
+    """
+    n = z.shape[0]
+    lag = weights @ z
+    m2 = (z ** 2).mean(axis=0)
+    w_sum = np.asarray(weights.sum(axis=1)).ravel()[:, None]
+    w_sq = np.asarray(weights.multiply(weights).sum(axis=1)).ravel()[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        local = z * lag / m2
+        # Vizinhos sorteados sem reposição entre os outros n - 1 setores:
+        # média e variância populacional desses valores (z tem média 0)
+        others_mean = -z / (n - 1)
+        others_var = (n * m2 - z ** 2) / (n - 1) - others_mean ** 2
+        lag_var = others_var * (w_sq - (w_sum ** 2 - w_sq) / (n - 2))
+        expected = z * w_sum * others_mean / m2
+        z_local = (local - expected) / (np.abs(z) * np.sqrt(lag_var) / m2)
+    quadrant = np.where(z >= 0, np.where(lag >= 0, "HH", "HL"), np.where(lag >= 0, "LH", "LL"))
+    return local, z_local, quadrant
+
+def cell_metrics(y, p, cells, xy):
+    """AUC, AUPRC, resíduo médio e centróide médio de cada célula do grid."""
+    rows = []
+    codes, labels = pd.factorize(cells)
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    bounds = np.r_[0, np.cumsum(np.bincount(codes[codes >= 0], minlength=labels.size))]
+    for c, label in enumerate(labels):
+        idx = order[bounds[c]:bounds[c + 1]]
+        y_c, p_c = y[idx], p[idx]
+        positives = int(y_c.sum())
+        auc = auprc = np.nan
+        if 0 < positives < idx.size:
+            metrics = ranking_metrics.compute_ranking_metrics(y_c, p_c, k_percents=())
+            auc, auprc = metrics["auc_roc"], metrics["auprc"]
+        rows.append({"Cell": label, "X": xy[idx, 0].mean(), "Y": xy[idx, 1].mean(), "N": idx.size,
+                     "Positives": positives, "Mean Residual": (y_c - p_c).mean(), "AUC": auc, "AUPRC": auprc})
+    return rows
+
+def analyze_scope(runs, cache_paths, scope, scope_index, centroids, cells_by_key,
+                  k=KNN_K, permutations=PERMUTATIONS):
+    """
+    Diagnóstico de um escopo para todos os runs, nas linhas de teste comuns
+    (FCU e prob não nulos em todos). centroids: (chaves ordenadas, xy,
+    geográfico?); cells_by_key: pd.Series célula por chave. Retorna
+    (linhas de Moran, linhas por célula, DataFrame do LISA) ou None.
+    """
+    col_prob = f"prob_fcu_{scope.replace(' ', '_')}"
+    scope_keys = scope_index["keys"][scope]
+    centroid_keys, xy_all, geographic = centroids
+
+    per_run = []
+    for run_name, folder_name in runs:
+        table = prediction_cache.open_table(cache_paths[folder_name], ["ID", "FCU", col_prob])
+        if col_prob not in table.column_names:
+            continue
+        df = table.to_pandas().dropna(subset=["FCU", col_prob])
+        keys = id_index.encode_ids(df["ID"].to_numpy(), scope_index)
+        df = df.assign(key=keys)[id_index.member_mask(keys, scope_keys)].drop_duplicates("key")
+        per_run.append((run_name, df.set_index("key")))
+    if not per_run:
+        return None
+
+    common = per_run[0][1].index.to_numpy()
+    for _, df in per_run[1:]:
+        common = np.intersect1d(common, df.index.to_numpy())
+    common = np.intersect1d(common, centroid_keys)
+    if common.size < 3:
+        return None
+    xy = xy_all[np.searchsorted(centroid_keys, common)]
+    y = per_run[0][1].loc[common, "FCU"].to_numpy(dtype=float)
+    probs = np.column_stack([df.loc[common, col_prob].to_numpy(dtype=float) for _, df in per_run])
+    residuals = y[:, None] - probs
+    z = residuals - residuals.mean(axis=0)
+
+    weights = knn_weights(xy, k, geographic)
+    moran, z_perm, p_perm = global_moran(z, weights, permutations)
+    local, z_local, quadrant = local_moran(z, weights)
+    significant = np.abs(z_local) > LISA_Z
+    cells = cells_by_key.reindex(common).to_numpy()
+
+    moran_rows, cell_rows, lisa_frames = [], [], []
+    for r, (run_name, _) in enumerate(per_run):
+        counts = {q: int(np.count_nonzero(significant[:, r] & (quadrant[:, r] == q))) for q in ("HH", "LL", "HL", "LH")}
+        moran_rows.append({"Run": run_name, "Scope": scope, "N": common.size, "K": min(k, common.size - 1),
+                           "Moran I": moran[r], "Expected I": -1 / (common.size - 1), "Z (perm)": z_perm[r],
+                           "P (perm)": p_perm[r], "Permutations": permutations, **counts})
+        cell_rows += [{"Run": run_name, "Scope": scope, **row} for row in cell_metrics(y, probs[:, r], cells, xy)]
+        lisa_frames.append(pd.DataFrame({"Run": run_name, "Scope": scope, "key": common, "X": xy[:, 0], "Y": xy[:, 1],
+                                         "Residual": residuals[:, r], "Local I": local[:, r], "Z": z_local[:, r],
+                                         "Quadrant": quadrant[:, r], "Significant": significant[:, r]}))
+    return moran_rows, cell_rows, pd.concat(lisa_frames, ignore_index=True)
+
+def analyze_runs(runs, cache_paths, master_path, test_split, scope_index, scopes,
+                 k=KNN_K, permutations=PERMUTATIONS):
+    """
+    Diagnóstico espacial de todos os runs e escopos. Os centróides vêm das
+    geometrias de master_path (os setores são os mesmos em todos os runs).
+    Retorna (tabela de Moran, tabela por célula, LISA por setor).
+    """
+    all_keys = np.unique(np.concatenate(list(scope_index["keys"].values())))
+    centroids = read_centroids(master_path, all_keys, scope_index)
+
+    moran_rows, cell_rows, lisa_frames = [], [], []
+    for scope in scopes:
+        ids, groups = test_split[scope]
+        cells_by_key = pd.Series(np.asarray(groups, dtype=str), index=id_index.encode_ids(ids, scope_index))
+        cells_by_key = cells_by_key[~cells_by_key.index.duplicated()]
+        result = analyze_scope(runs, cache_paths, scope, scope_index, centroids, cells_by_key, k, permutations)
+        if result is None:
+            continue
+        moran_rows += result[0]
+        cell_rows += result[1]
+        lisa_frames.append(result[2])
+
+    lisa = pd.concat(lisa_frames, ignore_index=True) if lisa_frames else pd.DataFrame()
+    if not lisa.empty:
+        vocab = scope_index["vocab"]
+        lisa.insert(2, "ID", lisa.pop("key").astype(str) if vocab is None else vocab[lisa.pop("key").to_numpy()])
+    return (pd.DataFrame(moran_rows, columns=MORAN_COLUMNS), pd.DataFrame(cell_rows, columns=CELL_COLUMNS), lisa)
+
+def residual_map_svg(x, y, residual, count, size=360, pad=12):
+    """
+    SVG inline do mapa de resíduo médio por célula: um círculo por célula no
+    centróide médio, com área proporcional ao número de setores, vermelho
+    para resíduo positivo (risco subestimado) e azul para negativo.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    residual, count = np.asarray(residual, dtype=float), np.asarray(count, dtype=float)
+    if x.size == 0:
+        return ""
+    span = max(np.ptp(x), np.ptp(y), 1e-9)
+    inner = size - 2 * pad
+    px = pad + (x - x.min()) / span * inner
+    py = size - pad - (y - y.min()) / span * inner
+    radius = 2 + 6 * np.sqrt(count / max(count.max(), 1))
+    scale = max(np.nanmax(np.abs(residual), initial=0), 1e-9)
+    intensity = np.clip(np.nan_to_num(residual) / scale, -1, 1)
+    fade = (255 * (1 - np.abs(intensity))).astype(int)
+    parts = [f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {size} {size}' width='100%'>",
+             f"<rect x='0' y='0' width='{size}' height='{size}' fill='none' stroke='#ccc'/>"]
+    for cx, cy, r, v, f in zip(px, py, radius, intensity, fade):
+        color = f"rgb(255, {f}, {f})" if v >= 0 else f"rgb({f}, {f}, 255)"
+        parts.append(f"<circle cx='{cx:.1f}' cy='{cy:.1f}' r='{r:.1f}' fill='{color}' stroke='#888' stroke-width='0.5'/>")
+    parts.append(f"<text x='{pad}' y='{size - 2}' font-size='10'>Resíduo médio: azul -{scale:.3f} · vermelho +{scale:.3f}</text>")
+    parts.append("</svg>")
+    return "".join(parts)
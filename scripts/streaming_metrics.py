@@ -0,0 +1,182 @@
+"""
+Avaliação em streaming, com memória limitada, de output_final_master.geoparquet.
+
+O arquivo é lido em record batches Arrow. Para cada escopo, as linhas de
+teste de cada batch alimentam histogramas de resolução fixa (n_bins faixas
+de score em [0, 1]) com contagem de positivos, de negativos e soma dos
+scores por faixa, além do erro quadrático acumulado. A memória depende só
+de n_bins e do número de escopos, não do número de linhas do arquivo.
+
+Dos histogramas saem AUC, AUPRC, Average Precision, Recall@k, Precision@k e
+a curva de ganho/lift (tratando cada faixa como um grupo de empate), com um
+limite superior para o erro de cada métrica; o Brier é exato. As curvas de
+calibração por quantil usam cortes alinhados às faixas do histograma.
+"""
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import id_index
+
+DEFAULT_BINS = 10_000
+DEFAULT_BATCH_ROWS = 262_144
+
+def new_accumulator(n_bins=DEFAULT_BINS):
+    return {"pos": np.zeros(n_bins), "neg": np.zeros(n_bins), "sum_p": np.zeros(n_bins),
+            "sq_err": 0.0, "n": 0}
+
+def update_accumulator(acc, y, p):
+    """Soma um lote de (y, p) ao histograma do escopo."""
+    n_bins = acc["pos"].size
+    bins = np.clip((p * n_bins).astype(np.int64), 0, n_bins - 1)
+    acc["pos"] += np.bincount(bins, weights=y, minlength=n_bins)
+    acc["neg"] += np.bincount(bins, weights=1 - y, minlength=n_bins)
+    acc["sum_p"] += np.bincount(bins, weights=p, minlength=n_bins)
+    acc["sq_err"] += float(np.sum((p - y) ** 2))
+    acc["n"] += p.size
+
+def _column_as_keys(column, scope_index):
+    if pa.types.is_integer(column.type):
+        return id_index.encode_ids(column.to_numpy(zero_copy_only=False), scope_index)
+    ids = pc.utf8_trim_whitespace(pc.cast(column, pa.string()))
+    return id_index.encode_ids(ids.to_numpy(zero_copy_only=False), scope_index)
+
+def stream_master(master_path, scope_index, scopes, n_bins=DEFAULT_BINS, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Percorre o master em record batches e retorna {escopo: acumulador} para os
+    escopos cuja coluna prob_fcu_* existe no arquivo.
+    """
+    parquet = pq.ParquetFile(master_path)
+    names = parquet.schema_arrow.names
+    prob_cols = {scope: f"prob_fcu_{scope.replace(' ', '_')}" for scope in scopes}
+    prob_cols = {scope: col for scope, col in prob_cols.items() if col in names}
+    accs = {scope: new_accumulator(n_bins) for scope in prob_cols}
+
+    for batch in parquet.iter_batches(batch_size=batch_rows, columns=["ID", "FCU"] + list(prob_cols.values())):
+        keys = _column_as_keys(batch.column("ID"), scope_index)
+        y = pc.cast(batch.column("FCU"), pa.float64()).to_numpy(zero_copy_only=False)
+        y_ok = ~np.isnan(y)
+        for scope, col in prob_cols.items():
+            p = pc.cast(batch.column(col), pa.float64()).to_numpy(zero_copy_only=False)
+            sel = id_index.member_mask(keys, scope_index["keys"][scope]) & y_ok & ~np.isnan(p)
+            if sel.any():
+                update_accumulator(accs[scope], y[sel], p[sel])
+    return accs
+
+def _interpolate_hits(k, tot, tp, pos, neg):
+    """
+    Acertos estimados entre os k primeiros (faixas em ordem decrescente),
+    supondo positivos e negativos misturados uniformemente dentro da faixa do
+    corte, e os limites inferior/superior possíveis.
+    """
+    g = np.minimum(np.searchsorted(tot, k), tot.size - 1)
+    tot_before = np.where(g > 0, tot[g - 1], 0.0)
+    tp_before = np.where(g > 0, tp[g - 1], 0.0)
+    inside = k - tot_before
+    count = pos[g] + neg[g]
+    estimate = tp_before + pos[g] * inside / np.where(count > 0, count, 1)
+    low = tp_before + np.maximum(0, inside - neg[g])
+    high = tp_before + np.minimum(pos[g], inside)
+    return estimate, low, high
+
+def histogram_metrics(acc, k_percents=(1.0, 5.0), curve_points=100):
+    """
+    Métricas aproximadas a partir do histograma de um escopo, no mesmo formato
+    de ranking_metrics.compute_ranking_metrics, mais "bounds" com o erro
+    máximo (absoluto) de cada métrica em relação ao cálculo exato.
+    """
+    pos_all = acc["pos"][::-1]
+    neg_all = acc["neg"][::-1]
+    nonempty = (pos_all + neg_all) > 0
+    pos = pos_all[nonempty]
+    neg = neg_all[nonempty]
+
+    tp = np.cumsum(pos)
+    tot = np.cumsum(pos + neg)
+    fp = tot - tp
+    total_pos = tp[-1] if tp.size else 0.0
+    total_neg = fp[-1] if fp.size else 0.0
+    n = int(acc["n"])
+
+    tp_prev = np.r_[0.0, tp[:-1]]
+    fp_prev = np.r_[0.0, fp[:-1]]
+    tot_prev = np.r_[0.0, tot[:-1]]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # ROC: trapézios com cada faixa como um grupo de empate
+        auc_roc = np.sum((fp - fp_prev) * (tp + tp_prev)) / (2 * total_pos * total_neg)
+        auc_bound = np.sum(pos * neg) / (2 * total_pos * total_neg)
+
+        # PR: partindo de (recall 0, precision 1), como no sklearn
+        precision = tp / tot
+        recall = tp / total_pos
+        precision_prev = np.r_[1.0, precision[:-1]]
+        d_recall = pos / total_pos
+        auprc = np.sum(d_recall * (precision + precision_prev)) / 2
+        average_precision = np.sum(d_recall * precision)
+        # Dentro de uma faixa a precisão fica entre "negativos primeiro" e "positivos primeiro"
+        low_den = tot_prev + neg
+        precision_low = np.where(low_den > 0, tp_prev / low_den, 1.0)
+        precision_high = np.where(tot_prev + pos > 0, (tp_prev + pos) / (tot_prev + pos), 1.0)
+        pr_bound = np.sum(d_recall * (precision_high - precision_low))
+
+        recall_at_k = {}
+        precision_at_k = {}
+        bounds = {"auc_roc": auc_bound, "auprc": pr_bound, "average_precision": pr_bound, "brier": 0.0}
+        for k_percent in k_percents:
+            k = int(n * (k_percent / 100))
+            if k == 0 or tot.size == 0:
+                recall_at_k[k_percent] = 0.0
+                precision_at_k[k_percent] = 0.0
+                continue
+            hits, low, high = _interpolate_hits(np.array([k]), tot, tp, pos, neg)
+            recall_at_k[k_percent] = float(hits[0] / total_pos)
+            precision_at_k[k_percent] = float(hits[0] / k)
+            spread = max(high[0] - hits[0], hits[0] - low[0])
+            bounds[f"recall@{k_percent:g}%"] = float(spread / total_pos)
+            bounds[f"precision@{k_percent:g}%"] = float(spread / k)
+
+        pct = np.arange(1, curve_points + 1) * (100.0 / curve_points)
+        k_curve = (n * (pct / 100)).astype(int)
+        if tot.size:
+            hits, _, _ = _interpolate_hits(k_curve.astype(float), tot, tp, pos, neg)
+        else:
+            hits = np.zeros(pct.size)
+        hits = np.where(k_curve > 0, hits, 0.0)
+        gain = hits / total_pos
+        lift = np.where(k_curve > 0, hits / np.maximum(k_curve, 1), 0.0) / (total_pos / n)
+
+    return {
+        "n": n,
+        "positives": float(total_pos),
+        "auprc": float(auprc),
+        "average_precision": float(average_precision),
+        "auc_roc": float(auc_roc),
+        "brier": acc["sq_err"] / n if n else np.nan,
+        "recall_at_k": recall_at_k,
+        "precision_at_k": precision_at_k,
+        "gain_curve": {"pct": pct, "gain": gain, "lift": lift},
+        "bounds": {name: float(value) for name, value in bounds.items()},
+    }
+
+def histogram_calibration(acc, n_bins=10):
+    """
+    Curva de calibração por quantil a partir do histograma: os cortes de
+    quantil são alinhados às faixas do histograma. Retorna (prob_true,
+    prob_pred, contagem) apenas das faixas de calibração não vazias.
+    """
+    count = acc["pos"] + acc["neg"]
+    cum = np.cumsum(count)
+    if cum.size == 0 or cum[-1] == 0:
+        return np.empty(0), np.empty(0), np.empty(0)
+
+    targets = cum[-1] * np.arange(1, n_bins) / n_bins
+    edges = np.searchsorted(cum, targets)
+    calib_bin = np.searchsorted(edges, np.arange(count.size), side="left")
+
+    bin_count = np.bincount(calib_bin, weights=count, minlength=n_bins)
+    bin_pos = np.bincount(calib_bin, weights=acc["pos"], minlength=n_bins)
+    bin_sum_p = np.bincount(calib_bin, weights=acc["sum_p"], minlength=n_bins)
+    nonzero = bin_count > 0
+    return bin_pos[nonzero] / bin_count[nonzero], bin_sum_p[nonzero] / bin_count[nonzero], bin_count[nonzero]
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Os scripts importam uns aos outros como módulos irmãos (python scripts/<script>.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
@@ -0,0 +1,61 @@
+"""
+Equivalência das métricas de passada única (ranking_metrics.py) com as
+referências do sklearn e de advanced_evaluation.py, com scores empatados e
+pesos de bootstrap.
+"""
+import numpy as np
+import pytest
+from sklearn.metrics import auc, brier_score_loss, precision_recall_curve, roc_auc_score
+
+import advanced_evaluation
+import ranking_metrics
+
+K_PERCENTS = (1.0, 5.0, 10.0, 33.0)
+
+def _sample(seed, n=2000, decimals=2):
+    """y binário e scores arredondados (muitos empates, inclusive no corte k)."""
+    rng = np.random.default_rng(seed)
+    p = np.round(rng.random(n), decimals)
+    y = (rng.random(n) < p).astype(int)
+    return y, p
+
+@pytest.mark.parametrize("seed,decimals", [(0, 1), (1, 2), (2, 6)])
+def test_compute_ranking_metrics_matches_references(seed, decimals):
+    y, p = _sample(seed, decimals=decimals)
+    metrics = ranking_metrics.compute_ranking_metrics(y, p, k_percents=K_PERCENTS)
+
+    precision, recall, _ = precision_recall_curve(y, p)
+    assert metrics["auprc"] == pytest.approx(auc(recall, precision), abs=1e-12)
+    assert metrics["auc_roc"] == pytest.approx(roc_auc_score(y, p), abs=1e-12)
+    assert metrics["brier"] == pytest.approx(brier_score_loss(y, p), abs=1e-12)
+    for k_percent in K_PERCENTS:
+        assert metrics["recall_at_k"][k_percent] == pytest.approx(
+            advanced_evaluation.calculate_recall_at_k(y, p, k_percent), abs=1e-12)
+        assert metrics["precision_at_k"][k_percent] == pytest.approx(
+            advanced_evaluation.calculate_precision_at_k(y, p, k_percent), abs=1e-12)
+
+def test_verify_ranking_metrics_accepts_ties():
+    # Todos os scores empatados: o top-k depende só da ordem das linhas
+    y = np.tile([1, 0, 0, 1, 0], 200)
+    p = np.full(y.size, 0.5)
+    metrics = ranking_metrics.compute_ranking_metrics(y, p, k_percents=K_PERCENTS)
+    assert advanced_evaluation.verify_ranking_metrics(y, p, metrics, "empates")
+
+def test_batched_ranking_metrics_matches_repeated_rows():
+    y, p = _sample(3, n=500)
+    rng = np.random.default_rng(4)
+    weights = rng.multinomial(y.size, np.full(y.size, 1 / y.size), size=8).T
+    weights[:, 0] = 1
+    batched = ranking_metrics.batched_ranking_metrics(y, p, weights)
+
+    for b in range(weights.shape[1]):
+        # Peso inteiro w equivale a repetir a linha w vezes
+        y_b, p_b = np.repeat(y, weights[:, b]), np.repeat(p, weights[:, b])
+        precision, recall, _ = precision_recall_curve(y_b, p_b)
+        assert batched["auprc"][b] == pytest.approx(auc(recall, precision), abs=1e-10)
+        assert batched["auc_roc"][b] == pytest.approx(roc_auc_score(y_b, p_b), abs=1e-10)
+        assert batched["brier"][b] == pytest.approx(brier_score_loss(y_b, p_b), abs=1e-10)
+
+    single = ranking_metrics.compute_ranking_metrics(y, p)
+    for name in ("auprc", "auc_roc", "brier"):
+        assert batched[name][0] == pytest.approx(single[name], abs=1e-12)